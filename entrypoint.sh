@@ -7,6 +7,7 @@ export PYTHONPATH=$PYTHONPATH:.
 # 设置FLASK_APP环境变量，指向新的管理文件
 export FLASK_APP=manage.py
 MIGRATIONS_DIR="migrations"
+TRACKED_MIGRATIONS="test_platform/migrations/versions"
 
 # 使用-d参数明确指定迁移目录，消除路径歧义
 if [ ! -d "$MIGRATIONS_DIR/versions" ]; then
@@ -14,10 +15,13 @@ if [ ! -d "$MIGRATIONS_DIR/versions" ]; then
   flask db init -d $MIGRATIONS_DIR
   flask db migrate -m "Initial database setup" -d $MIGRATIONS_DIR
   flask db upgrade -d $MIGRATIONS_DIR
-else
-  echo "Migrations directory found. Applying any new migrations..."
-  flask db upgrade -d $MIGRATIONS_DIR
 fi
 
+# 代码中维护的迁移（test_platform/migrations/versions，独立分支）复制到迁移目录，已有的不覆盖；
+# 自动生成的初始迁移与这些迁移是两个分支，因此升级到所有 heads
+echo "Applying any new migrations..."
+cp -n $TRACKED_MIGRATIONS/*.py $MIGRATIONS_DIR/versions/
+flask db upgrade heads -d $MIGRATIONS_DIR
+
 # 执行 supervisord，它将根据配置文件启动并管理所有服务
 exec /usr/bin/supervisord -c /etc/supervisor/conf.d/supervisord.conf 
\ No newline at end of file
@@ -1,19 +1,73 @@
 import os
+import time
 from flask import Flask, jsonify, render_template, send_from_directory
 from flask_socketio import SocketIO
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from database import db
+from core.startup import LazyBlueprint, StartupProfiler
+from core.engine import engine_options, tune_engine
 
 # 初始化扩展
 socketio = SocketIO()
 migrate = Migrate()
 jwt = JWTManager()
 
+# 模型模块
+MODEL_MODULES = [
+    'models.device',
+    'models.user',
+    'models.test_case',
+    'models.firmware',
+    'models.firmware_checkpoint',
+    'models.test_result',
+    'models.alert',
+]
+
+# 蓝图清单：(模块, URL前缀, 是否允许延迟加载)
+# api.test_results 和 api.devices 在注册前要挂载额外的端点，因此即时加载
+BLUEPRINT_MANIFEST = [
+    ('core', None, False),
+    ('auth', '/auth', False),
+    ('dashboard', '/dashboard', False),
+    # API蓝图
+    ('api.auth', '/api/auth', True),
+    ('api.user_auth', '/api/user-auth', True),
+    ('api.test_cases', '/api/test-cases', True),
+    ('api.test_results', '/api/test-results', False),
+    ('api.firmware', '/api/firmware', True),
+    ('api.hardware', '/api/hardware', True),
+    ('api.test_execution', '/api/test-execution', True),
+    ('api.devices', '/api/devices', False),
+    ('api.system', '/api/system', True),
+    ('api.dashboard', '/api/dashboard', True),
+    ('api.alerts', '/api/alerts', True),
+    ('api.reports', '/api/reports', True),
+]
+
+def get_socketio_message_queue(app):
+    """
+    选择Socket.IO跨进程广播使用的消息队列。
+
+    多个gunicorn worker各自持有一部分客户端连接，必须经由消息队列转发广播，
+    否则一个worker发出的消息到不了其他worker上的客户端。
+    - SOCKETIO_MESSAGE_QUEUE 显式指定，如 redis://...、amqp://...，
+      测试时可用 memory://（kombu进程内队列）；设为 none 则禁用；
+    - 否则使用 REDIS_URL（与健康检查一致，忽略默认的 localhost 地址）。
+    """
+    queue = app.config.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    if queue:
+        return None if queue.lower() == 'none' else queue
+
+    redis_url = app.config.get('REDIS_URL')
+    if redis_url and not redis_url.startswith('redis://localhost'):
+        return redis_url
+    return None
+
 def create_app(config_name=None):
     """应用工厂函数"""
-    print('Creating Flask app...')
+    profiler = StartupProfiler()
     app = Flask(__name__, static_folder='static', static_url_path='/static')
     
     # 加载配置
@@ -24,57 +78,129 @@ def create_app(config_name=None):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    app.logger.debug('Creating Flask app...')
+
     # 初始化扩展
+    started = time.perf_counter()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app)
     db.init_app(app)
+    with app.app_context():
+        tune_engine(app, db.engine)
     migrate.init_app(app, db)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        message_queue=get_socketio_message_queue(app),
+        channel=app.config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    )
     jwt.init_app(app)
     CORS(app)
+    profiler.record('init extensions', started)
 
     # 导入模型 - 确保所有模型都被导入
-    from models.device import Device
-    from models.user import User
-    from models.test_case import TestCase, TestSuite
-    from models.firmware import Firmware, FirmwareDeployment
-    from models.test_result import TestResult, TestExecution
-    from models.alert import Alert, AlertRule
-
-    # 注册蓝图
-    from core import bp as core_bp
-    from auth import bp as auth_bp
-    from dashboard import bp as dashboard_bp
-    
-    # 注册API蓝图
-    from api.auth import bp as api_auth_bp
-    from api.user_auth import bp as api_user_auth_bp
-    from api.test_cases import bp as test_cases_bp
-    from api.test_results import bp as test_results_bp
-    from api.firmware import bp as firmware_bp
-    from api.hardware import bp as hardware_bp
-    from api.test_execution import bp as test_execution_bp
-    from api.devices import bp as devices_bp
-    from api.system import bp as system_bp
-    from api.dashboard import bp as api_dashboard_bp
-    from api.alerts import bp as alerts_bp
-    from api.reports import bp as reports_bp
-    
-    app.register_blueprint(core_bp)
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
-    
-    # 注册API路由
-    app.register_blueprint(api_auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(api_user_auth_bp, url_prefix='/api/user-auth')
-    app.register_blueprint(test_cases_bp, url_prefix='/api/test-cases')
-    app.register_blueprint(test_results_bp, url_prefix='/api/test-results')
-    app.register_blueprint(firmware_bp, url_prefix='/api/firmware')
-    app.register_blueprint(hardware_bp, url_prefix='/api/hardware')
-    app.register_blueprint(test_execution_bp, url_prefix='/api/test-execution')
-    app.register_blueprint(devices_bp, url_prefix='/api/devices')
-    app.register_blueprint(system_bp, url_prefix='/api/system')
-    app.register_blueprint(api_dashboard_bp, url_prefix='/api/dashboard')
-    app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
-    app.register_blueprint(reports_bp, url_prefix='/api/reports')
+    # 模型之间的关系在映射配置时解析，因此模型始终即时导入
+    for module_name in MODEL_MODULES:
+        profiler.import_attr(module_name)
+
+    # 设备token校验缓存，多worker之间经 auth.invalidation 失效
+    from auth.invalidation import invalidation_bus
+    invalidation_bus.init_app(app)
+    from auth.token_cache import token_cache
+    token_cache.configure(
+        max_size=app.config.get('TOKEN_CACHE_SIZE', 1024),
+        ttl=app.config.get('TOKEN_CACHE_TTL', 300)
+    )
+
+    # 设备登录凭据缓存与 last_login_at 批量写入
+    from auth.login import credential_cache, last_login_writer
+    credential_cache.configure(
+        max_size=app.config.get('CREDENTIAL_CACHE_SIZE', 4096),
+        ttl=app.config.get('CREDENTIAL_CACHE_TTL', 300)
+    )
+    last_login_writer.init_app(app)
+
+    # 测试日志实时推送，执行器把命令输出写入其中
+    from dashboard.logstream import log_streamer
+    log_streamer.init_app(app, socketio)
+
+    # 测试套件执行器
+    from tasks import executor
+    executor.init_app(app, log_streamer=log_streamer)
+
+    # 主机状态合并广播的窗口，在启动时设置一次
+    from dashboard.broadcast import host_status_coalescer
+    host_status_coalescer.init_socketio(
+        socketio, window=app.config.get('HOST_STATUS_WINDOW_MS', 250) / 1000.0)
+
+    # 设备列表增量同步
+    from dashboard.device_sync import device_sync
+    device_sync.init_app(app, socketio)
+
+    # 健康检查探测器
+    from core.health import health_prober
+    health_prober.init_app(app, socketio)
+
+    # 设备遥测存储，配置 TELEMETRY_DIR 时定期落盘
+    from services.telemetry import telemetry_store
+    telemetry_store.init_app(app)
+    if telemetry_store.directory:
+        telemetry_store.start_flusher(socketio, app.config.get('TELEMETRY_FLUSH_INTERVAL', 60))
+
+    # 增量告警规则引擎：由状态变更事件驱动，在后台任务中评估
+    from services.rule_engine import init_rule_engine
+    init_rule_engine(app, socketio)
+
+    # 串口I/O引擎（首次打开串口时才启动事件循环）
+    from services.serial_io import serial_manager
+    serial_manager.init_app(app)
+
+    # 全局只执行一次的后台任务由持有该锁的进程执行
+    from core.leader import leader
+    leader.init_app(app)
+
+    # 设备可达性扫描，配置 REACHABILITY_INTERVAL 时在后台循环，只在持有领导者锁的进程中执行
+    from services.reachability import scanner
+    scanner.init_app(app, socketio)
+    scanner.start(leader)
+
+    # 固件批量部署；持有领导者锁的进程负责恢复中断的部署
+    from services.firmware_deploy import deployer
+    deployer.init_app(app, socketio)
+    deployer.start_resumer(leader)
+
+    # 报表流式导出端点
+    from services.report_export import init_export_routes
+    init_export_routes(app)
+
+    # 仪表盘汇总计数
+    from services.aggregates import aggregates, init_dashboard_routes
+    aggregates.init_app(app)
+    aggregates.start_reconciler(socketio)
+    init_dashboard_routes(app)
+
+    # 请求级性能指标（METRICS_ENABLED 开启时才安装）
+    from core.metrics import init_metrics
+    init_metrics(app, socketio, db)
+
+    # 挂在已有API蓝图上的端点（测试结果流式导入、设备列表键集分页），须在蓝图注册之前添加
+    from services.result_ingest import init_ingest_routes
+    init_ingest_routes(profiler.import_attr('api.test_results', 'bp'))
+    from services.device_list import init_device_list_routes
+    init_device_list_routes(profiler.import_attr('api.devices', 'bp'))
+
+    # 注册蓝图：LAZY_BLUEPRINTS 开启时，可延迟的蓝图只注册占位视图，首次访问其URL前缀时才导入；
+    # 即时加载的蓝图导入耗时记入启动报告
+    started = time.perf_counter()
+    lazy = app.config.get('LAZY_BLUEPRINTS', False)
+    lazy_blueprints = []
+    for module_name, url_prefix, deferrable in BLUEPRINT_MANIFEST:
+        if lazy and deferrable:
+            lazy_blueprints.append(LazyBlueprint(app, module_name, url_prefix))
+        else:
+            bp = profiler.import_attr(module_name, 'bp')
+            app.register_blueprint(bp, url_prefix=url_prefix)
+    app.extensions['lazy_blueprints'] = lazy_blueprints
+    profiler.record('register blueprints', started)
 
     # 页面路由 - 重定向到React前端
     @app.route('/')
@@ -156,43 +282,27 @@ def create_app(config_name=None):
     
     @app.route('/health')
     def health():
-        """完整的健康检查端点"""
-        import time
-        from datetime import datetime
-        
-        health_status = {
-            "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
-            "version": "1.0.0",
-            "services": {}
-        }
-        
-        # 检查数据库连接
-        try:
-            db.session.execute(db.text('SELECT 1'))
-            health_status["services"]["database"] = "healthy"
-        except Exception as e:
-            health_status["services"]["database"] = f"unhealthy: {str(e)}"
-            health_status["status"] = "unhealthy"
-        
-        # 检查Redis连接（如果配置了）
-        redis_url = app.config.get('REDIS_URL')
-        if redis_url and not redis_url.startswith('redis://localhost'):
-            try:
-                import redis
-                r = redis.from_url(redis_url)
-                r.ping()
-                health_status["services"]["redis"] = "healthy"
-            except Exception as e:
-                health_status["services"]["redis"] = f"unhealthy: {str(e)}"
-                # Redis失败不影响整体健康状态，因为它是可选的
+        """
+        健康检查端点。
+        默认返回后台探测器缓存的结果；?deep=1 时立即检查并返回各依赖的耗时。
+        """
+        from flask import request
+        from core.health import health_prober
+
+        if request.args.get('deep'):
+            health_status = health_prober.refresh(with_latency=True)
         else:
-            health_status["services"]["redis"] = "not configured"
-        
+            health_status = health_prober.status()
+
         # 返回适当的HTTP状态码
         status_code = 200 if health_status["status"] == "healthy" else 503
         return jsonify(health_status), status_code
 
+    app.extensions['startup_profile'] = profiler.report()
+    profile_path = app.config.get('STARTUP_PROFILE_PATH') or os.environ.get('STARTUP_PROFILE_PATH')
+    if profile_path:
+        profiler.write(profile_path)
+
     return app
 
 if __name__ == '__main__':
@@ -221,6 +331,10 @@ if __name__ == '__main__':
     alert_service.set_app(app)
     alert_service.set_socketio(socketio)
     alert_service.start_monitoring()
+
+    # 表刚创建，让规则引擎重新加载规则
+    from services.rule_engine import rule_engine
+    rule_engine.request_reload()
     
     # 启动应用
     socketio.run(app, host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
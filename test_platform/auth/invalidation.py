@@ -0,0 +1,151 @@
+"""
+设备鉴权缓存的跨进程失效
+
+token缓存（auth.token_cache）和登录凭据缓存（auth.login）都保存在进程内，
+在某个worker上修改了设备的指纹、密码或状态后，其他worker也必须立即丢弃该设备的条目：
+
+- 配置了Redis（`AUTH_INVALIDATION_REDIS`，否则使用非localhost的 `REDIS_URL`）时，
+  事务提交后把设备id发布到 `AUTH_INVALIDATION_CHANNEL` 频道，每个worker的订阅线程
+  收到后清除本地条目；订阅断开期间缓存不命中（每次请求查库），重新订阅后先清空缓存再恢复；
+- 没有Redis时无法通知其他进程，缓存TTL被限制为 `AUTH_CACHE_LOCAL_TTL` 秒（默认5秒），
+  确认是单进程部署时可以调大。
+
+ORM之外的批量写入（如可达性扫描的状态回写）应在提交后调用 `invalidation_bus.publish(ids)`，
+它会同时清除本进程和其他进程中两个缓存的条目。
+"""
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'device-auth-invalidate'
+
+
+class InvalidationBus(object):
+    """设备鉴权缓存的失效通知"""
+
+    def __init__(self):
+        self.channel = DEFAULT_CHANNEL
+        self.local_ttl = 5
+        self.client = None
+        self._listeners = []    # listener(device_ids)，device_ids 为 None 表示全部清空
+        self._subscribed = False
+        self._running = False
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+
+    def init_app(self, app):
+        self.channel = app.config.get('AUTH_INVALIDATION_CHANNEL', self.channel)
+        self.local_ttl = app.config.get('AUTH_CACHE_LOCAL_TTL', self.local_ttl)
+        redis_url = app.config.get('AUTH_INVALIDATION_REDIS')
+        if not redis_url:
+            # 与健康检查一致，忽略默认的 localhost 地址
+            redis_url = app.config.get('REDIS_URL')
+            if redis_url and redis_url.startswith('redis://localhost'):
+                redis_url = None
+        if redis_url:
+            import redis
+            self.client = redis.Redis.from_url(redis_url, socket_connect_timeout=2)
+            self.start()
+        else:
+            self.client = None
+
+    @property
+    def shared(self):
+        """是否能通知其他进程"""
+        return self.client is not None
+
+    def register(self, listener):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def cache_ttl(self, ttl):
+        """缓存实际使用的TTL：不能跨进程失效时限制为 local_ttl"""
+        return ttl if self.shared else min(ttl, self.local_ttl)
+
+    def serving(self):
+        """缓存当前是否可以命中；订阅断开时返回 False"""
+        return not self.shared or self._subscribed
+
+    def publish(self, device_ids):
+        """清除本进程的条目，并通知其他进程"""
+        device_ids = sorted(set(device_ids))
+        if not device_ids:
+            return
+        self._notify(device_ids)
+        if self.client is None:
+            return
+        try:
+            self.client.publish(self.channel, json.dumps(device_ids))
+            self.published += 1
+        except Exception as e:
+            # Redis不可用时订阅连接也会断开，各进程在重新订阅前都不再命中缓存
+            logger.error(f"Failed to publish device auth invalidation: {e}")
+
+    def start(self):
+        """启动订阅线程"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._listen, name='auth-invalidation', daemon=True).start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=False)
+            try:
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # 断开期间可能错过了通知，清空后再恢复命中
+                        self._notify(None)
+                        self._subscribed = True
+                        backoff = 1
+                    elif message['type'] == 'message':
+                        self.received += 1
+                        self._notify(json.loads(message['data']))
+            except Exception as e:
+                logger.warning(f"Device auth invalidation subscription lost: {e}")
+            finally:
+                self._subscribed = False
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _notify(self, device_ids):
+        for listener in self._listeners:
+            try:
+                listener(device_ids)
+            except Exception as e:
+                logger.error(f"Device auth cache invalidation failed: {e}")
+
+
+invalidation_bus = InvalidationBus()
+
+
+def defer_invalidation(session, device_id):
+    """登记本事务中鉴权字段变化的设备，提交后统一发布"""
+    if session is not None:
+        session.info.setdefault('auth_invalidate', set()).add(device_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_invalidations(session):
+    device_ids = session.info.pop('auth_invalidate', None)
+    if device_ids:
+        invalidation_bus.publish(device_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidations(session):
+    session.info.pop('auth_invalidate', None)
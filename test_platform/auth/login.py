@@ -0,0 +1,236 @@
+"""
+设备登录快速路径
+
+断电重启后几百个agent会同时调用 `/api/auth/device-login`，每次都按指纹查库、
+同步提交 `last_login_at` 并签发JWT。这里提供：
+
+- CredentialCache：fingerprint -> 设备凭据的进程内LRU/TTL缓存，
+  指纹或密码变更、设备删除时通过ORM事件清除本进程的条目，事务提交后再经
+  `auth.invalidation` 通知其他worker（与token缓存共用同一个通知频道和TTL限制）；
+- LastLoginWriter：把 `last_login_at` 的写入合并，每 `LOGIN_FLUSH_INTERVAL` 秒
+  用一次批量UPDATE提交；
+- verify_password：哈希校验放到线程池执行（eventlet下使用tpool），
+  避免阻塞事件循环；历史上的明文密码仍按常量时间比较。
+"""
+import hmac
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import object_session
+from werkzeug.security import check_password_hash
+
+from database import db
+from models.device import Device
+from .invalidation import defer_invalidation, invalidation_bus
+
+# werkzeug 生成的哈希以方法名开头，例如 pbkdf2:sha256:600000$salt$hash
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+_hash_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='password-hash')
+
+
+class DeviceCredential(object):
+    """登录所需的设备凭据"""
+    __slots__ = ('id', 'name', 'fingerprint', 'password_hash')
+
+    def __init__(self, id, name, fingerprint, password_hash):
+        self.id = id
+        self.name = name
+        self.fingerprint = fingerprint
+        self.password_hash = password_hash
+
+    @classmethod
+    def from_device(cls, device):
+        return cls(device.id, device.name, device.fingerprint, device.password_hash)
+
+
+class CredentialCache(object):
+    """按指纹缓存设备凭据"""
+
+    def __init__(self, max_size=4096, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # fingerprint -> (expires_at, DeviceCredential)
+        self._by_device = {}            # device_id -> fingerprint
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, ttl=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+
+    def get(self, fingerprint):
+        now = time.monotonic()
+        if not invalidation_bus.serving():
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._remove(fingerprint)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, device):
+        credential = DeviceCredential.from_device(device)
+        with self._lock:
+            self._remove(credential.fingerprint)
+            self._entries[credential.fingerprint] = (
+                time.monotonic() + invalidation_bus.cache_ttl(self.ttl), credential)
+            self._by_device[credential.id] = credential.fingerprint
+            while len(self._entries) > self.max_size:
+                _, (_, oldest) = self._entries.popitem(last=False)
+                self._by_device.pop(oldest.id, None)
+        return credential
+
+    def invalidate_device(self, device_id):
+        with self._lock:
+            fingerprint = self._by_device.pop(device_id, None)
+            if fingerprint is not None:
+                self._entries.pop(fingerprint, None)
+
+    def invalidate_devices(self, device_ids):
+        """失效通知的回调，device_ids 为 None 时清空缓存"""
+        if device_ids is None:
+            self.clear()
+            return
+        for device_id in device_ids:
+            self.invalidate_device(device_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'ttl': invalidation_bus.cache_ttl(self.ttl),
+                    'hits': self.hits, 'misses': self.misses}
+
+    def _remove(self, fingerprint):
+        entry = self._entries.pop(fingerprint, None)
+        if entry is not None:
+            self._by_device.pop(entry[1].id, None)
+
+
+class LastLoginWriter(object):
+    """合并 last_login_at 写入，定期批量提交"""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.app = None
+        self._pending = {}   # device_id -> datetime
+        self._lock = threading.Lock()
+        self._timer = None
+        self.flushes = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('LOGIN_FLUSH_INTERVAL', self.interval)
+
+    def record(self, device_id, when=None):
+        """登记一次登录；interval 为0时立即写入"""
+        with self._lock:
+            self._pending[device_id] = when or datetime.utcnow()
+            if self.interval <= 0:
+                schedule = False
+            elif self._timer is None:
+                self._timer = threading.Timer(self.interval, self._on_timer)
+                self._timer.daemon = True
+                schedule = True
+            else:
+                return
+        if schedule:
+            self._timer.start()
+        else:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的登录时间写入数据库，返回写入的设备数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(Device),
+                    [{'id': device_id, 'last_login_at': when} for device_id, when in pending.items()]
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error writing device last_login_at: {e}")
+                return 0
+        self.flushes += 1
+        return len(pending)
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+
+credential_cache = CredentialCache()
+invalidation_bus.register(credential_cache.invalidate_devices)
+last_login_writer = LastLoginWriter()
+
+
+def _run_blocking(func, *args):
+    """在线程中执行CPU密集的函数，eventlet环境下使用其原生线程池"""
+    # 只检查已导入的eventlet：在请求线程中首次导入eventlet会让该线程退出时挂住
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is not None:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'):
+            return tpool.execute(func, *args)
+    return _hash_pool.submit(func, *args).result()
+
+
+def verify_password(password_hash, password):
+    """校验设备密码"""
+    if not password_hash or not password:
+        return False
+    if password_hash.startswith(HASH_PREFIXES):
+        return _run_blocking(check_password_hash, password_hash, password)
+    # 历史数据中的明文密码
+    return hmac.compare_digest(password_hash.encode('utf-8'), password.encode('utf-8'))
+
+
+def find_credential(fingerprint):
+    """按指纹获取设备凭据，优先读缓存"""
+    credential = credential_cache.get(fingerprint)
+    if credential is None:
+        device = Device.query.filter_by(fingerprint=fingerprint).first()
+        if device is None:
+            return None
+        credential = credential_cache.put(device)
+    return credential
+
+
+@event.listens_for(Device, 'after_update')
+def _invalidate_on_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.fingerprint.history.has_changes() or state.attrs.password_hash.history.has_changes():
+        credential_cache.invalidate_device(target.id)
+        defer_invalidation(object_session(target), target.id)
+
+
+@event.listens_for(Device, 'after_delete')
+def _invalidate_on_delete(mapper, connection, target):
+    credential_cache.invalidate_device(target.id)
+    defer_invalidation(object_session(target), target.id)
@@ -1,10 +1,11 @@
-from flask import Blueprint, request, jsonify, render_template
-from .services import register_new_device, authenticate_device, create_token, token_required
+from flask import Blueprint, request, jsonify, render_template, current_app
+from database import db
+from .services import (register_new_device, register_devices_bulk, authenticate_device, create_token,
+                       token_required, login_secret)
 from models.user import User
 from werkzeug.security import check_password_hash
 import jwt
 from datetime import datetime, timedelta
-import os
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -23,6 +24,46 @@ def register():
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
+@bp.route('/register/bulk', methods=['POST'])
+def register_bulk():
+    """
+    批量注册设备。
+    请求体为 {"devices": [{"fingerprint": ..., "name": ..., ...}, ...]}，
+    返回逐条结果；冲突或无效的条目不影响其他设备注册。
+    """
+    data = request.get_json()
+    devices = data.get('devices') if isinstance(data, dict) else None
+    if not isinstance(devices, list) or not devices:
+        return jsonify({'message': 'A non-empty devices list is required'}), 400
+
+    max_items = current_app.config.get('BULK_REGISTER_MAX', 1000)
+    if len(devices) > max_items:
+        return jsonify({'message': f'At most {max_items} devices per request'}), 413
+
+    try:
+        results = register_devices_bulk(devices)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+    counts = {'created': 0, 'conflict': 0, 'invalid': 0}
+    for r in results:
+        counts[r['status']] += 1
+    # 全部成功 201，全部无效 400，全部冲突 409，其余为部分成功 207
+    if counts['created'] == len(results):
+        status_code = 201
+    elif counts['invalid'] == len(results):
+        status_code = 400
+    elif counts['conflict'] == len(results):
+        status_code = 409
+    else:
+        status_code = 207
+    return jsonify({
+        'created': counts['created'],
+        'failed': len(results) - counts['created'],
+        'results': results
+    }), status_code
+
 @bp.route('/login', methods=['POST'])
 def login():
     """
@@ -45,7 +86,7 @@ def login():
             'username': user.username,
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
-        token = jwt.encode(payload, os.environ.get('SECRET_KEY', 'dev-secret-key'), algorithm='HS256')
+        token = jwt.encode(payload, login_secret(), algorithm='HS256')
         
         return jsonify({
             'success': True,
@@ -87,7 +128,7 @@ def verify():
     token = auth_header.split(' ')[1]
     
     try:
-        payload = jwt.decode(token, os.environ.get('SECRET_KEY', 'dev-secret-key'), algorithms=['HS256'])
+        payload = jwt.decode(token, login_secret(), algorithms=['HS256'])
         user = User.query.get(payload['user_id'])
         if user:
             return jsonify({
@@ -106,7 +147,7 @@ def verify():
         return jsonify({'success': False, 'message': 'Token无效'}), 401
 
 @bp.route('/status')
-@token_required
+@token_required(identity=True)
 def status(current_device):
     """
     检查当前JWT Token的有效性.
@@ -3,8 +3,11 @@ import os
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, current_app
+from sqlalchemy.exc import IntegrityError
 from database import db
 from models.device import Device
+from .token_cache import token_cache
+from .login import find_credential, verify_password, last_login_writer
 import secrets
 
 def register_new_device(data):
@@ -32,6 +35,154 @@ def register_new_device(data):
     db.session.commit()
     return password
 
+# 批量注册时按这些唯一列检测冲突
+BULK_UNIQUE_FIELDS = ('fingerprint', 'serial_number', 'name', 'ip_address')
+BULK_OPTIONAL_FIELDS = ('model', 'serial_number', 'description', 'location',
+                        'ip_address', 'serial_port', 'firmware_version', 'hardware_version')
+BULK_STRING_FIELDS = ('fingerprint', 'name', 'device_type', 'created_by') + BULK_OPTIONAL_FIELDS
+# 并发注册导致唯一约束冲突时，重新检查冲突并重试插入的次数
+BULK_INSERT_ATTEMPTS = 3
+
+def _validate_bulk_item(item):
+    """校验批量注册的单个条目，返回错误信息，合法时返回 None"""
+    if not isinstance(item, dict):
+        return 'Item must be an object'
+    fingerprint = item.get('fingerprint')
+    if not isinstance(fingerprint, str) or not fingerprint.strip():
+        return 'Fingerprint is required'
+    for field in BULK_STRING_FIELDS:
+        value = item.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            return f'{field} must be a string'
+        length = getattr(Device.__table__.c[field].type, 'length', None)
+        if length and len(value) > length:
+            return f'{field} must be at most {length} characters'
+    return None
+
+def register_devices_bulk(items):
+    """
+    批量注册设备。
+    先逐条校验，再用集合运算一次性找出请求内部重复和与已有设备冲突的条目，
+    最后把其余设备在同一个事务里按列分组用 executemany INSERT 写入。
+    与其他注册并发导致唯一约束冲突时回滚并重新检查，冲突的条目返回 conflict。
+    返回与请求顺序一致的逐条结果，status 为 created / conflict / invalid。
+    """
+    user_agent_string = request.headers.get('User-Agent', 'Unknown Agent')
+    ip_address = request.remote_addr
+    results = [None] * len(items)
+    candidates = []
+
+    # 校验并补全字段
+    for index, item in enumerate(items):
+        error = _validate_bulk_item(item)
+        if error:
+            results[index] = {'index': index, 'status': 'invalid', 'error': error}
+            continue
+        fingerprint = item['fingerprint']
+        row = {
+            'fingerprint': fingerprint,
+            'name': item.get('name') or f'Device_{fingerprint[:8]}',
+            'device_type': item.get('device_type') or 'unknown',
+            'registered_ip': ip_address,
+            'user_agent': user_agent_string,
+            'created_by': item.get('created_by'),
+        }
+        for field in BULK_OPTIONAL_FIELDS:
+            if item.get(field) is not None:
+                row[field] = item[field]
+        candidates.append((index, row))
+
+    # 请求内部重复：同一个唯一值只保留第一次出现
+    seen = {field: set() for field in BULK_UNIQUE_FIELDS}
+    unique_candidates = []
+    for index, row in candidates:
+        duplicate = next((field for field in BULK_UNIQUE_FIELDS
+                          if row.get(field) is not None and row[field] in seen[field]), None)
+        if duplicate:
+            results[index] = {'index': index, 'fingerprint': row['fingerprint'], 'status': 'conflict',
+                              'error': f'Duplicate {duplicate} in request'}
+            continue
+        for field in BULK_UNIQUE_FIELDS:
+            if row.get(field) is not None:
+                seen[field].add(row[field])
+        unique_candidates.append((index, row))
+
+    # 与已有设备冲突的条目标记为 conflict，其余写入；并发注册导致插入违反唯一约束时回滚，
+    # 重新检查冲突后再写入剩下的条目
+    created = []
+    for attempt in range(BULK_INSERT_ATTEMPTS):
+        rows = _without_conflicts(unique_candidates, seen, results)
+        if not rows:
+            break
+        try:
+            _insert_rows([row for _, row in rows])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            current_app.logger.warning(f"Bulk registration raced with another registration "
+                                       f"(attempt {attempt + 1}), re-checking conflicts")
+            unique_candidates = rows
+            continue
+        created = rows
+        break
+    else:
+        for index, row in unique_candidates:
+            results[index] = {'index': index, 'fingerprint': row['fingerprint'], 'status': 'conflict',
+                              'error': 'Conflicting concurrent registration'}
+
+    if created:
+        ids = dict(db.session.execute(
+            db.select(Device.fingerprint, Device.id)
+            .where(Device.fingerprint.in_([row['fingerprint'] for _, row in created]))
+        ).all())
+        for index, row in created:
+            results[index] = {'index': index, 'fingerprint': row['fingerprint'], 'status': 'created',
+                              'id': ids.get(row['fingerprint']), 'name': row['name'],
+                              'password': row['password_hash']}
+        # executemany 不经过ORM事件，需要手动通知设备列表同步；status 未指定，均为默认的 active
+        from dashboard.device_sync import device_sync
+        from services.aggregates import aggregates
+        device_sync.notify(ids.values())
+        aggregates.device_status_changed({(None, 'active'): len(created)})
+    return results
+
+def _without_conflicts(candidates, values, results):
+    """每个唯一列一次 IN 查询找出与已有设备冲突的条目，写入 results，返回其余条目"""
+    existing = {}
+    for field in BULK_UNIQUE_FIELDS:
+        if not values[field]:
+            existing[field] = set()
+            continue
+        column = getattr(Device, field)
+        existing[field] = set(
+            db.session.execute(db.select(column).where(column.in_(sorted(values[field])))).scalars()
+        )
+
+    rows = []
+    for index, row in candidates:
+        conflict = next((field for field in BULK_UNIQUE_FIELDS
+                         if row.get(field) is not None and row[field] in existing[field]), None)
+        if conflict:
+            results[index] = {'index': index, 'fingerprint': row['fingerprint'], 'status': 'conflict',
+                              'error': f'{conflict} already registered'}
+            continue
+        row.setdefault('password_hash', secrets.token_hex(8))  # 与单个注册一致，生产中应存储哈希值
+        rows.append((index, row))
+    return rows
+
+def _insert_rows(rows):
+    """
+    按键集合分组，每组一条 executemany INSERT。
+    同一组的行键一致，未提供的列不会被写成 NULL，仍使用模型的默认值。
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    for group in groups.values():
+        db.session.execute(db.insert(Device), group)
+
 def authenticate_device(data):
     """
     验证设备密码, 成功则返回JWT和设备信息.
@@ -42,8 +193,8 @@ def authenticate_device(data):
     if not password or not fingerprint:
         return None, None
         
-    # 简化版：直接对比明文密码。生产环境应使用哈希校验。
-    device = Device.query.filter_by(fingerprint=fingerprint).first()
+    # 凭据按指纹缓存；密码哈希校验在线程池中进行，历史明文密码按常量时间比较
+    device = find_credential(fingerprint)
     if not device:
         if password == current_app.config.get('SHARED_PASSWORD'):
             # 自动注册
@@ -60,10 +211,9 @@ def authenticate_device(data):
             return token, new_device
         else:
             return None, None
-    # 现有设备验证
-    if device.password_hash == password:
-        device.last_login_at = datetime.utcnow()
-        db.session.commit()
+    # 现有设备验证，last_login_at 由后台批量写入
+    if verify_password(device.password_hash, password):
+        last_login_writer.record(device.id)
         token = create_token(device)
         return token, device
     return None, None
@@ -78,8 +228,34 @@ def create_token(device):
     }, current_app.config['SECRET_KEY'], algorithm="HS256")
     return token
 
-def token_required(f):
-    """Token验证装饰器（简化版，不再创建闭包）."""
+def login_secret():
+    """用户登录token的签名密钥，与 `auth.routes.login` 签发时一致"""
+    return os.environ.get('SECRET_KEY', 'dev-secret-key')
+
+def decode_user_token(token):
+    """
+    校验 `/login` 签发的用户token，返回其中的用户名（没有时为 user_id），无效时返回 None。
+    设备token不带 user_id，不会被当作用户。
+    """
+    try:
+        payload = jwt.decode(token, login_secret(), algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if payload.get('user_id') is None:
+        return None
+    return payload.get('username') or payload['user_id']
+
+def token_required(f=None, identity=False):
+    """
+    Token验证装饰器，视图函数的第一个参数为当前设备。
+
+    默认传入完整的 `Device`：缓存命中时跳过 jwt.decode，但仍按主键取一次设备。
+    `@token_required(identity=True)` 的视图只收到缓存中的 `DeviceIdentity`
+    （id / name / fingerprint / status），命中时不查数据库，需要完整设备时调用 `load()`。
+    """
+    if f is None:
+        return lambda view: token_required(view, identity=identity)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         auth_header = request.headers.get('Authorization')
@@ -90,13 +266,24 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
 
+        # 先查进程内缓存，命中则跳过 jwt.decode
+        cached = token_cache.get(token)
+        if cached is not None:
+            if identity:
+                return f(cached, *args, **kwargs)
+            device = cached.load()
+            if device is None:
+                return jsonify({'message': 'Token is invalid!'}), 401
+            return f(device, *args, **kwargs)
+
         try:
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_device = Device.query.get(data['device_id'])
-            if not current_device or current_device.fingerprint != data['fingerprint']:
+            device = db.session.get(Device, data['device_id'])
+            if not device or device.fingerprint != data['fingerprint']:
                 raise ValueError("Invalid device")
         except Exception:
             return jsonify({'message': 'Token is invalid!'}), 401
-        
-        return f(current_device, *args, **kwargs)
-    return decorated
\ No newline at end of file
+        cached = token_cache.put(token, data['exp'], device)
+
+        return f(cached if identity else device, *args, **kwargs)
+    return decorated
@@ -0,0 +1,186 @@
+"""
+设备Token校验缓存
+
+`token_required` 每次请求都要 `jwt.decode` 并回查一次 `Device` 表，
+设备轮询频繁时这次查询占据了大部分耗时。这里在进程内维护一个有界的
+LRU缓存：token -> 精简的设备身份记录。
+
+- 条目在token的 `exp` 到期或超过 `TOKEN_CACHE_TTL` 秒后失效；
+- `Device` 的 fingerprint / status / password_hash 变更或删除时，
+  通过ORM事件主动清除本进程中该设备的所有条目，事务提交后再经
+  `auth.invalidation` 通知其他worker；
+- 命中的是精简的身份记录；`token_required` 默认据此取完整设备，
+  `token_required(identity=True)` 的视图直接使用身份记录，需要时调用 `load()`。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from database import db
+from models.device import Device
+from .invalidation import defer_invalidation, invalidation_bus
+
+# 触发缓存失效的字段
+INVALIDATING_FIELDS = ('fingerprint', 'status', 'password_hash')
+
+
+class DeviceIdentity(object):
+    """
+    缓存中保存的精简设备身份记录。
+
+    只保存鉴权需要的字段，跨请求共享，因此不持有ORM对象；
+    需要其他字段的视图函数调用 `load()` 查询完整的 `Device`。
+    """
+    __slots__ = ('id', 'name', 'fingerprint', 'status')
+
+    def __init__(self, id, name, fingerprint, status):
+        self.id = id
+        self.name = name
+        self.fingerprint = fingerprint
+        self.status = status
+
+    @classmethod
+    def from_device(cls, device):
+        return cls(device.id, device.name, device.fingerprint, device.status)
+
+    def load(self):
+        """查询完整的设备对象，设备已删除时返回 None"""
+        return db.session.get(Device, self.id)
+
+    def __repr__(self):
+        return f"<DeviceIdentity {self.id} {self.name}>"
+
+
+class TokenCache(object):
+    """线程安全的 LRU + TTL token缓存"""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # token -> (expires_at, identity)
+        self._by_device = {}            # device_id -> set(token)
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, ttl=None):
+        """根据应用配置调整容量和TTL"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            while len(self._entries) > self.max_size:
+                self._pop_oldest()
+
+    def get(self, token):
+        """命中返回 DeviceIdentity，未命中或已过期返回 None"""
+        now = time.time()
+        if not invalidation_bus.serving():
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, identity = entry
+            if expires_at <= now:
+                self._remove(token)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return identity
+
+    def put(self, token, exp, device):
+        """缓存一个已校验通过的token，exp 为 JWT 中的过期时间戳，返回身份记录"""
+        identity = DeviceIdentity.from_device(device)
+        if self.max_size <= 0:
+            return identity
+        expires_at = min(float(exp), time.time() + invalidation_bus.cache_ttl(self.ttl))
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (expires_at, identity)
+            self._by_device.setdefault(identity.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._pop_oldest()
+        return identity
+
+    def invalidate_device(self, device_id):
+        """清除某个设备的所有缓存条目"""
+        with self._lock:
+            for token in self._by_device.pop(device_id, ()):
+                self._entries.pop(token, None)
+
+    def invalidate_devices(self, device_ids):
+        """失效通知的回调，device_ids 为 None 时清空缓存"""
+        if device_ids is None:
+            self.clear()
+            return
+        for device_id in device_ids:
+            self.invalidate_device(device_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': invalidation_bus.cache_ttl(self.ttl),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / total) if total else 0.0
+            }
+
+    def _pop_oldest(self):
+        token, (_, identity) = self._entries.popitem(last=False)
+        self._discard_index(token, identity.id)
+        self.evictions += 1
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._discard_index(token, entry[1].id)
+
+    def _discard_index(self, token, device_id):
+        tokens = self._by_device.get(device_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_device[device_id]
+
+
+token_cache = TokenCache()
+invalidation_bus.register(token_cache.invalidate_devices)
+
+
+@event.listens_for(Device, 'after_update')
+def _invalidate_on_update(mapper, connection, target):
+    """鉴权相关字段变更时清除缓存，提交后再通知其他进程"""
+    state = inspect(target)
+    for field in INVALIDATING_FIELDS:
+        if state.attrs[field].history.has_changes():
+            token_cache.invalidate_device(target.id)
+            defer_invalidation(object_session(target), target.id)
+            break
+
+
+@event.listens_for(Device, 'after_delete')
+def _invalidate_on_delete(mapper, connection, target):
+    token_cache.invalidate_device(target.id)
+    defer_invalidation(object_session(target), target.id)
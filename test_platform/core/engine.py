@@ -0,0 +1,171 @@
+"""
+数据库引擎配置
+
+开发环境使用SQLite，生产环境通过 `DATABASE_URL` 使用PostgreSQL，两者需要不同的调优：
+
+- PostgreSQL：连接池大小 `DB_POOL_SIZE`、溢出 `DB_MAX_OVERFLOW`、
+  获取超时 `DB_POOL_TIMEOUT`、回收时间 `DB_POOL_RECYCLE`，并开启 pre-ping；
+- SQLite：WAL模式、`busy_timeout`（`SQLITE_BUSY_TIMEOUT_MS`）和 `synchronous=NORMAL`，
+  减少多worker下的 `database is locked`。
+
+应用显式配置的 `SQLALCHEMY_ENGINE_OPTIONS` 优先于这里的默认值。
+连接池的检出/归还次数、占用数、占用时长，以及请求连接时在池中等待的时长
+（从请求连接到拿到连接，包括排队、建立新连接和pre-ping）通过 `pool_metrics` 导出。
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+def engine_options(app):
+    """根据数据库类型生成引擎参数"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    options = {}
+    if uri.startswith('sqlite'):
+        busy_timeout_ms = app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+        options['connect_args'] = {
+            'timeout': busy_timeout_ms / 1000.0,
+            'check_same_thread': False
+        }
+    elif uri.startswith(('postgresql', 'postgres')):
+        options.update({
+            'pool_size': app.config.get('DB_POOL_SIZE', 5),
+            'max_overflow': app.config.get('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': app.config.get('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': app.config.get('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True
+        })
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+class PoolMetrics(object):
+    """连接池事件统计"""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.hold_time_total = 0.0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.wait_timeouts = 0
+        self._checked_out_at = {}
+        self._local = threading.local()   # 当前线程开始请求连接的时间
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        # dispose() 会换一个新的连接池，需要重新包装
+        event.listen(engine, 'engine_disposed', lambda e: self._instrument_pool(e.pool))
+        self._instrument_pool(engine.pool)
+
+    def _instrument_pool(self, pool):
+        """包装 pool.connect，记录请求连接的起始时间，检出事件里算出等待时长"""
+        if getattr(pool, '_pool_metrics_wrapped', False):
+            return
+        connect = pool.connect
+        local = self._local
+
+        def timed_connect():
+            local.started = time.perf_counter()
+            try:
+                return connect()
+            except PoolTimeoutError:
+                with self._lock:
+                    self.wait_timeouts += 1
+                raise
+            finally:
+                local.started = None
+
+        pool.connect = timed_connect
+        pool._pool_metrics_wrapped = True
+
+    def snapshot(self, engine=None):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'hold_seconds_total': round(self.hold_time_total, 6),
+                'waits': self.waits,
+                'wait_seconds_total': round(self.wait_time_total, 6),
+                'wait_seconds_max': round(self.wait_time_max, 6),
+                'wait_timeouts': self.wait_timeouts
+            }
+        pool = getattr(engine, 'pool', None)
+        if pool is not None and hasattr(pool, 'size'):
+            data.update({
+                'pool_size': pool.size(),
+                'pool_checked_out': pool.checkedout(),
+                'pool_overflow': pool.overflow()
+            })
+        return data
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        now = time.perf_counter()
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self._checked_out_at[id(connection_record)] = now
+            if started is not None:
+                wait = now - started
+                self.waits += 1
+                self.wait_time_total += wait
+                self.wait_time_max = max(self.wait_time_max, wait)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            started = self._checked_out_at.pop(id(connection_record), None)
+            if started is None:
+                return
+            self.checkins += 1
+            self.in_use -= 1
+            self.hold_time_total += time.perf_counter() - started
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+def _sqlite_pragmas(journal_mode, synchronous, busy_timeout_ms):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+    return set_pragmas
+
+
+def tune_engine(app, engine):
+    """给已创建的引擎挂上PRAGMA设置和连接池统计"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas(
+            app.config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+            app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+        ))
+    pool_metrics.attach(engine)
@@ -0,0 +1,125 @@
+"""
+健康检查探测器
+
+`/health` 被 docker / nginx / 负载均衡器频繁探测，每次都查库、新建Redis连接并不划算。
+这里由探测器在后台执行检查并缓存结果，`/health` 只读取缓存：
+
+- 结果超过 `HEALTH_CHECK_TTL` 秒（默认10秒）后，下一次读取会触发一次后台刷新，
+  刷新完成前继续返回旧结果；
+- Redis使用进程内共享的连接池，不再每次新建连接；
+- `/health?deep=1` 立即执行一次检查并返回每个依赖的耗时和连接池统计。
+"""
+import threading
+import time
+from datetime import datetime
+
+from database import db
+
+HEALTH_VERSION = "1.0.0"
+
+
+class HealthProber(object):
+    """缓存式健康检查"""
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self.app = None
+        self.socketio = None
+        self._redis = None
+        self._state = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio_instance=None):
+        self.app = app
+        self.socketio = socketio_instance
+        self.ttl = app.config.get('HEALTH_CHECK_TTL', self.ttl)
+
+    def status(self):
+        """返回缓存的健康状态，过期时在后台刷新"""
+        with self._lock:
+            state = self._state
+            stale = time.monotonic() - self._checked_at >= self.ttl
+            start_refresh = stale and state is not None and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if state is None:
+            # 首次访问没有缓存，同步检查一次
+            return self.refresh()
+        if start_refresh:
+            if self.socketio is not None:
+                self.socketio.start_background_task(self._background_refresh)
+            else:
+                threading.Thread(target=self._background_refresh, daemon=True).start()
+        return state
+
+    def refresh(self, with_latency=False):
+        """执行一次完整检查并更新缓存"""
+        services = {}
+        latency = {}
+        overall = "healthy"
+
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                with db.engine.connect() as conn:
+                    conn.execute(db.text('SELECT 1'))
+            services["database"] = "healthy"
+        except Exception as e:
+            services["database"] = f"unhealthy: {str(e)}"
+            overall = "unhealthy"
+        latency["database"] = round((time.perf_counter() - started) * 1000, 2)
+
+        redis_client = self._redis_client()
+        if redis_client is not None:
+            started = time.perf_counter()
+            try:
+                redis_client.ping()
+                services["redis"] = "healthy"
+            except Exception as e:
+                services["redis"] = f"unhealthy: {str(e)}"
+                # Redis失败不影响整体健康状态，因为它是可选的
+            latency["redis"] = round((time.perf_counter() - started) * 1000, 2)
+        else:
+            services["redis"] = "not configured"
+
+        state = {
+            "status": overall,
+            "timestamp": datetime.utcnow().isoformat(),
+            "version": HEALTH_VERSION,
+            "services": services
+        }
+        with self._lock:
+            self._state = state
+            self._checked_at = time.monotonic()
+        if with_latency:
+            from core.engine import pool_metrics
+            with self.app.app_context():
+                pool = pool_metrics.snapshot(db.engine)
+            return dict(state, latency_ms=latency, pool=pool)
+        return state
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            self.app.logger.error(f"Health check refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _redis_client(self):
+        """按 REDIS_URL 创建一次连接池，之后复用"""
+        if self._redis is None:
+            redis_url = self.app.config.get('REDIS_URL')
+            if not redis_url or redis_url.startswith('redis://localhost'):
+                return None
+            import redis
+            pool = redis.ConnectionPool.from_url(
+                redis_url, socket_connect_timeout=2, socket_timeout=2)
+            self._redis = redis.Redis(connection_pool=pool)
+        return self._redis
+
+
+health_prober = HealthProber()
@@ -0,0 +1,121 @@
+"""
+后台任务的跨进程领导者锁
+
+gunicorn 的每个worker都会执行 create_app，全局只应执行一次的后台循环（设备可达性扫描、
+固件部署的中断恢复）在每轮开始前检查 `leader.is_leader()`，只有持有锁的进程真正执行：
+
+- 配置了Redis（`LEADER_LOCK_REDIS`，否则使用非localhost的 `REDIS_URL`）时使用Redis锁，
+  锁的有效期为 `LEADER_LOCK_TTL` 秒，持有者每 ttl/3 续期一次；进程退出或卡住超过ttl后
+  由其他进程接手，因此可以跨主机；
+- 否则在 `LEADER_LOCK_DIR`（默认系统临时目录）下对锁文件加 flock，进程退出时内核自动释放，
+  只能协调同一台主机上的worker。
+"""
+import fcntl
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock(object):
+    """领导者锁，后台线程负责获取与续期"""
+
+    def __init__(self, name, ttl=30):
+        self.name = name
+        self.ttl = ttl
+        self.directory = tempfile.gettempdir()
+        self.client = None
+        self.identity = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock = None       # redis Lock 对象
+        self._file = None       # 持有 flock 的文件
+        self._leader = False
+        self._running = False
+        self._guard = threading.Lock()
+        self.stats = {'acquired': 0, 'lost': 0}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('LEADER_LOCK_TTL', self.ttl)
+        self.directory = app.config.get('LEADER_LOCK_DIR', self.directory)
+        redis_url = app.config.get('LEADER_LOCK_REDIS')
+        if not redis_url:
+            redis_url = app.config.get('REDIS_URL')
+            if redis_url and redis_url.startswith('redis://localhost'):
+                redis_url = None
+        if redis_url:
+            import redis
+            self.client = redis.Redis.from_url(redis_url, socket_connect_timeout=2)
+        else:
+            self.client = None
+        self.start()
+
+    @property
+    def shared(self):
+        """锁是否跨主机有效"""
+        return self.client is not None
+
+    def is_leader(self):
+        return self._leader
+
+    def acquire(self):
+        """尝试获取或续期一次，返回当前是否持有锁"""
+        with self._guard:
+            try:
+                held = self._renew_redis() if self.client is not None else self._lock_file()
+            except Exception as e:
+                logger.warning(f"Leader lock {self.name} check failed: {e}")
+                held = False
+            if held and not self._leader:
+                self.stats['acquired'] += 1
+                logger.info(f"Leader lock {self.name} acquired by {self.identity}")
+            elif self._leader and not held:
+                self.stats['lost'] += 1
+                logger.warning(f"Leader lock {self.name} lost by {self.identity}")
+            self._leader = held
+            return held
+
+    def start(self):
+        with self._guard:
+            if self._running:
+                return
+            self._running = True
+
+        def run():
+            while True:
+                self.acquire()
+                time.sleep(max(self.ttl / 3.0, 1.0))
+
+        threading.Thread(target=run, name=f'leader-{self.name}', daemon=True).start()
+
+    def _renew_redis(self):
+        if self._lock is not None and self._leader:
+            try:
+                self._lock.reacquire()
+                return True
+            except Exception:
+                # 续期失败（锁已过期被他人获取或Redis不可用），重新竞争
+                self._lock = None
+        lock = self.client.lock(f'leader:{self.name}', timeout=self.ttl, thread_local=False)
+        if lock.acquire(blocking=False):
+            self._lock = lock
+            return True
+        return False
+
+    def _lock_file(self):
+        if self._file is not None:
+            return True
+        handle = open(os.path.join(self.directory, f'test-platform-{self.name}.lock'), 'a+')
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._file = handle
+        return True
+
+
+leader = LeaderLock('background')
@@ -0,0 +1,241 @@
+"""
+请求级性能指标
+
+`METRICS_ENABLED` 开启时，`init_metrics` 在应用上安装钩子并注册 `/metrics`
+（Prometheus文本格式）；未开启时不安装任何钩子，没有额外开销。采集的指标：
+
+- 每个端点的请求数（按方法、状态码）和延迟直方图；
+- 每个端点的SQL语句数和SQL耗时（SQLAlchemy游标事件）；
+- 每个Socket.IO事件名的emit次数；
+- 设备token缓存、数据库连接池等组件的统计。
+
+热路径不加锁：每个线程写自己的分片，抓取 `/metrics` 时再合并；
+线程结束后其分片在下一次抓取时并入基础分片。
+"""
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard(object):
+    """单个线程的指标分片"""
+    __slots__ = ('owner', 'requests', 'latency', 'sql', 'emits')
+
+    def __init__(self, owner=None):
+        self.owner = weakref.ref(owner) if owner is not None else None
+        self.requests = {}   # (endpoint, method, status) -> count
+        self.latency = {}    # endpoint -> [bucket counts..., +Inf count, sum]
+        self.sql = {}        # endpoint -> [queries, seconds]
+        self.emits = {}      # event -> count
+
+    def alive(self):
+        owner = self.owner() if self.owner is not None else None
+        return owner is not None and owner.is_alive()
+
+    def merge_into(self, other):
+        for key, value in list(self.requests.items()):
+            other.requests[key] = other.requests.get(key, 0) + value
+        for key, value in list(self.latency.items()):
+            target = other.latency.get(key)
+            if target is None:
+                other.latency[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    target[i] += v
+        for key, value in list(self.sql.items()):
+            target = other.sql.setdefault(key, [0, 0.0])
+            target[0] += value[0]
+            target[1] += value[1]
+        for key, value in list(self.emits.items()):
+            other.emits[key] = other.emits.get(key, 0) + value
+
+
+class MetricsRegistry(object):
+    """指标注册表"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._base = _Shard()
+        self._lock = threading.Lock()   # 只在新建分片和抓取时使用
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """注册额外的指标来源，collector() 返回 [(name, help, {labels}, value), ...]"""
+        self._collectors.append(collector)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    # 记录
+
+    def observe_request(self, endpoint, method, status, seconds, sql_queries=0, sql_seconds=0.0):
+        shard = self._shard()
+        key = (endpoint, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        buckets = shard.latency.get(endpoint)
+        if buckets is None:
+            buckets = shard.latency[endpoint] = [0] * (len(LATENCY_BUCKETS) + 2)
+        buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        buckets[-1] += seconds
+        if sql_queries:
+            sql = shard.sql.get(endpoint)
+            if sql is None:
+                sql = shard.sql[endpoint] = [0, 0.0]
+            sql[0] += sql_queries
+            sql[1] += sql_seconds
+
+    def count_emit(self, event_name):
+        shard = self._shard()
+        shard.emits[event_name] = shard.emits.get(event_name, 0) + 1
+
+    # 导出
+
+    def snapshot(self):
+        """合并所有分片，结束线程的分片并入基础分片"""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.alive():
+                    live.append(shard)
+                else:
+                    shard.merge_into(self._base)
+            self._shards = live
+            total = _Shard()
+            self._base.merge_into(total)
+            for shard in live:
+                shard.merge_into(total)
+        return total
+
+    def render(self):
+        """生成Prometheus文本格式"""
+        data = self.snapshot()
+        lines = []
+
+        lines.append('# HELP http_requests_total Total HTTP requests.')
+        lines.append('# TYPE http_requests_total counter')
+        for (endpoint, method, status), value in sorted(data.requests.items()):
+            lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {value}')
+
+        lines.append('# HELP http_request_duration_seconds HTTP request latency.')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for endpoint, buckets in sorted(data.latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            cumulative += buckets[len(LATENCY_BUCKETS)]
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {buckets[-1]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+
+        lines.append('# HELP http_request_sql_queries_total SQL statements executed while handling requests.')
+        lines.append('# TYPE http_request_sql_queries_total counter')
+        for endpoint, (queries, _) in sorted(data.sql.items()):
+            lines.append(f'http_request_sql_queries_total{{endpoint="{endpoint}"}} {queries}')
+        lines.append('# HELP http_request_sql_seconds_total Time spent in SQL while handling requests.')
+        lines.append('# TYPE http_request_sql_seconds_total counter')
+        for endpoint, (_, seconds) in sorted(data.sql.items()):
+            lines.append(f'http_request_sql_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+        lines.append('# HELP socketio_emits_total Socket.IO emits by event name.')
+        lines.append('# TYPE socketio_emits_total counter')
+        for event_name, value in sorted(data.emits.items()):
+            lines.append(f'socketio_emits_total{{event="{event_name}"}} {value}')
+
+        for collector in self._collectors:
+            seen = set()
+            for name, help_text, labels, value in collector():
+                if name not in seen:
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} gauge')
+                    seen.add(name)
+                label_text = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def _component_stats():
+    """各组件自带的统计"""
+    from database import db
+    from auth.token_cache import token_cache
+    from core.engine import pool_metrics
+
+    for key, value in token_cache.stats().items():
+        yield 'token_cache', 'Device token cache statistics.', {'stat': key}, value
+    for key, value in pool_metrics.snapshot(db.engine).items():
+        yield 'db_pool', 'Database connection pool statistics.', {'stat': key}, value
+
+
+def init_metrics(app, socketio_instance, db):
+    """按 METRICS_ENABLED 安装指标采集钩子"""
+    if not app.config.get('METRICS_ENABLED', False):
+        return None
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_started = time.perf_counter()
+        g._metrics_sql = [0, 0.0]
+
+    @app.after_request
+    def _metrics_record(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            sql = g.pop('_metrics_sql', None) or (0, 0.0)
+            metrics.observe_request(
+                request.endpoint or 'unmatched', request.method, response.status_code,
+                time.perf_counter() - started, sql[0], sql[1])
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _sql_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _sql_end(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_metrics_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if has_request_context():
+            sql = g.get('_metrics_sql')
+            if sql is not None:
+                sql[0] += 1
+                sql[1] += elapsed
+
+    # 统计所有经由 socketio.emit 的消息（flask_socketio.emit 也会调用它）
+    original_emit = socketio_instance.emit
+    if not getattr(original_emit, '_counted', False):
+        def counted_emit(event_name, *args, **kwargs):
+            metrics.count_emit(event_name)
+            return original_emit(event_name, *args, **kwargs)
+        counted_emit._counted = True
+        socketio_instance.emit = counted_emit
+
+    metrics.add_collector(lambda: list(_component_stats()))
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus指标"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
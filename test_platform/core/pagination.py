@@ -0,0 +1,115 @@
+"""
+键集（keyset）分页
+
+OFFSET 分页越往后越慢：数据库要先扫描并丢弃前面所有行。键集分页记住上一页最后一行的
+排序键，下一页直接从索引中该位置继续，深翻页的耗时与第一页相同：
+
+    stmt, keys = select(...).where(...), (table.c.updated_at, table.c.id)
+    rows, next_cursor = keyset_page(db.session, stmt, keys, cursor=request.args.get('cursor'))
+
+- 排序键的最后一列必须唯一（通常是主键），保证顺序稳定；
+- 排序键的列必须是 NOT NULL（行值比较遇到 NULL 结果为 NULL，这些行会从翻页中消失），
+  并应有 (过滤列..., 排序键...) 的组合索引，索引需要随迁移一起创建；
+- 游标是排序键值经JSON + base64url编码的不透明字符串，`next_cursor` 为 None 表示没有下一页；
+  解码时按排序键列的类型逐个校验，格式不对的游标抛出 CursorError（调用方返回400）。
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class CursorError(ValueError):
+    """无法解析的分页游标"""
+
+
+def encode_cursor(values):
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            encoded.append({'dt': value.isoformat()})
+        elif isinstance(value, date):
+            encoded.append({'d': value.isoformat()})
+        else:
+            encoded.append(value)
+    raw = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _python_type(key):
+    try:
+        return key.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _decode_value(value, expected):
+    """解码一个排序键值并检查它与列类型一致"""
+    if isinstance(value, dict):
+        if list(value) == ['dt'] and isinstance(value['dt'], str):
+            value = datetime.fromisoformat(value['dt'])
+        elif list(value) == ['d'] and isinstance(value['d'], str):
+            value = date.fromisoformat(value['d'])
+        else:
+            raise ValueError('unknown key encoding')
+    if value is None or isinstance(value, (bool, list)):
+        raise ValueError(f'unexpected key value {value!r}')
+    if expected is None:
+        return value
+    if expected is datetime or expected is date:
+        # datetime 是 date 的子类，两者分开判断
+        valid = type(value) is expected
+    elif expected is float:
+        valid = isinstance(value, (int, float))
+    else:
+        valid = isinstance(value, expected)
+    if not valid:
+        raise ValueError(f'expected {expected.__name__}, got {type(value).__name__}')
+    return value
+
+
+def decode_cursor(cursor, keys):
+    """解码游标，返回与 keys 一一对应的值"""
+    try:
+        if not isinstance(cursor, str):
+            raise TypeError('cursor must be a string')
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        encoded = json.loads(raw)
+        if not isinstance(encoded, list) or len(encoded) != len(keys):
+            raise ValueError('wrong number of keys')
+        return [_decode_value(value, _python_type(key)) for value, key in zip(encoded, keys)]
+    except (ValueError, TypeError) as e:
+        raise CursorError(f'Invalid cursor: {e}') from None
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """解析并限制每页条数"""
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(session, stmt, keys, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True):
+    """
+    执行一页键集分页查询。
+    stmt 的选择列表末尾会追加 keys，返回 (rows, next_cursor)，rows 中不含追加的排序键列。
+    """
+    keys = tuple(keys)
+    stmt = stmt.add_columns(*keys)
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        position = tuple_(*keys)
+        stmt = stmt.where(position < tuple_(*values) if descending else position > tuple_(*values))
+    stmt = stmt.order_by(*[key.desc() if descending else key.asc() for key in keys]).limit(limit + 1)
+
+    rows = session.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][-len(keys):]) if has_more else None
+    return [row[:-len(keys)] for row in rows], next_cursor
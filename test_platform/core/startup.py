@@ -0,0 +1,127 @@
+"""
+应用启动辅助
+
+- StartupProfiler：记录 create_app 中每个模块导入和每个初始化步骤的耗时，
+  设置 `STARTUP_PROFILE_PATH` 时把报告写成JSON，便于在CI中跟踪启动时间；
+- LazyBlueprint：启动时只为蓝图的URL前缀注册一个占位视图，第一次命中该前缀时
+  才导入蓝图模块。
+
+应用的路由表在 create_app 中就已完整，处理请求后不再改动。延迟加载的蓝图注册在
+一个私有的Flask对象上，占位视图在它的路由表中匹配请求并调用真正的视图函数，
+同时执行蓝图的 before_request / after_request。限制：
+
+- 延迟加载的蓝图端点不在应用的路由表中，`url_for` 无法解析它们；
+- 蓝图自己注册的错误处理器不生效，异常交给应用级的错误处理器。
+
+使用了这些功能的蓝图应保持即时加载。
+"""
+import importlib
+import json
+import threading
+import time
+
+from flask import Flask, request
+
+# 占位视图接受的请求方法，实际允许的方法由蓝图的路由决定
+LAZY_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+
+class StartupProfiler(object):
+    """启动耗时记录"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.entries = []
+
+    def import_attr(self, module_name, attr=None):
+        """导入模块（可选取其属性）并记录耗时"""
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.record(f"import {module_name}", started)
+        return getattr(module, attr) if attr else module
+
+    def record(self, name, started):
+        self.entries.append({
+            'name': name,
+            'ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+
+    def report(self):
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'steps': sorted(self.entries, key=lambda e: e['ms'], reverse=True)
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+class LazyBlueprint(object):
+    """
+    延迟加载的蓝图占位：在应用上注册 `<prefix>`、`<prefix>/` 和 `<prefix>/<path:subpath>`，
+    请求到达时导入蓝图（只导入一次），再把请求分发给蓝图中匹配的视图。
+    """
+
+    def __init__(self, app, module_name, url_prefix, attr='bp'):
+        self.app = app
+        self.module_name = module_name
+        self.url_prefix = url_prefix
+        self.attr = attr
+        self.load_ms = None
+        self._blueprint = None
+        self._router = None
+        self._lock = threading.Lock()
+        endpoint = 'lazy_' + module_name.replace('.', '_')
+        for rule in (url_prefix, f'{url_prefix}/', f'{url_prefix}/<path:subpath>'):
+            app.add_url_rule(rule, endpoint, self, methods=LAZY_METHODS)
+
+    @property
+    def loaded(self):
+        return self._router is not None
+
+    def load(self):
+        """导入蓝图并在私有Flask对象上注册，返回该对象；已加载时直接返回"""
+        if self._router is not None:
+            return self._router
+        with self._lock:
+            if self._router is None:
+                started = time.perf_counter()
+                blueprint = getattr(importlib.import_module(self.module_name), self.attr)
+                router = Flask(self.module_name)
+                router.url_map.strict_slashes = self.app.url_map.strict_slashes
+                router.register_blueprint(blueprint, url_prefix=self.url_prefix)
+                self._blueprint = blueprint
+                self.load_ms = round((time.perf_counter() - started) * 1000, 3)
+                self._router = router
+                self.app.logger.info(f"Lazily loaded blueprint {self.module_name} at "
+                                     f"{self.url_prefix} in {self.load_ms:.1f}ms")
+        return self._router
+
+    def __call__(self, subpath=None):
+        router = self.load()
+        adapter = router.url_map.bind_to_environ(request.environ)
+        # 未匹配时抛出 NotFound / MethodNotAllowed / RequestRedirect，由Flask按HTTP异常处理
+        rule, values = adapter.match(return_rule=True)
+        request.view_args = values
+
+        if request.method == 'OPTIONS' and rule.provide_automatic_options:
+            response = self.app.response_class()
+            response.allow.update(adapter.allowed_methods())
+            return response
+
+        name = self._blueprint.name
+        for func in router.before_request_funcs.get(name, ()):
+            result = func()
+            if result is not None:
+                return self._after(router, result)
+        return self._after(router, router.view_functions[rule.endpoint](**values))
+
+    def _after(self, router, result):
+        funcs = router.after_request_funcs.get(self._blueprint.name)
+        if not funcs:
+            return result
+        response = self.app.make_response(result)
+        for func in reversed(funcs):
+            response = func(response)
+        return response
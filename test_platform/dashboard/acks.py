@@ -0,0 +1,144 @@
+"""
+告警确认的批量写回
+
+事故期间运维会一次确认成百上千条告警。逐条处理意味着逐条事务和逐条回执，
+这里把确认请求先放进队列，满 `ALERT_ACK_BATCH_SIZE` 条或等待
+`ALERT_ACK_FLUSH_MS` 毫秒后，用一条批量UPDATE写入 `Alert` 表，
+再给每个客户端回一条汇总的 `alert_acknowledged` 消息。
+
+只有尚未处理的告警（状态为空或不在 CLOSED_STATUSES 中）会被更新；回执中的 `acknowledged` 是本次实际确认的告警，
+其余的（不存在或已被确认/解决）列在 `skipped` 中。确认人取自Socket.IO连接认证时的身份，
+不接受客户端自报。批量UPDATE不经过ORM事件，写入后按返回的严重程度直接扣减仪表盘的未处理告警数。
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import or_, select, update
+
+from database import db
+
+# 已处理的告警状态，不再重复确认
+CLOSED_STATUSES = ('acknowledged', 'resolved', 'closed')
+
+
+def acknowledge_alerts(alert_ids, acknowledged_by, acknowledged_at):
+    """
+    把未处理的告警标记为已确认，返回实际更新的 [(id, severity)]。
+    调用方负责提交事务。
+    """
+    from models.alert import Alert
+
+    criteria = (Alert.id.in_(sorted(alert_ids)),
+                or_(Alert.status.is_(None), Alert.status.notin_(CLOSED_STATUSES)))
+    stmt = update(Alert).where(*criteria).values(
+        status='acknowledged', acknowledged_at=acknowledged_at, acknowledged_by=acknowledged_by)
+    if db.engine.dialect.update_returning:
+        return [tuple(row) for row in db.session.execute(stmt.returning(Alert.id, Alert.severity))]
+    rows = [tuple(row) for row in db.session.execute(
+        select(Alert.id, Alert.severity).where(*criteria).with_for_update())]
+    if rows:
+        db.session.execute(stmt.where(Alert.id.in_([alert_id for alert_id, _ in rows])))
+    return rows
+
+
+class AckBatcher(object):
+    """告警确认的写回队列"""
+
+    def __init__(self, batch_size=200, flush_interval=0.2):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.socketio = None
+        self._app = None
+        self._pending = {}   # acknowledged_by -> set(alert_id)
+        self._waiters = {}   # sid -> set(alert_id)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flusher_running = False
+        self.total_flushes = 0
+        self.total_acknowledged = 0
+
+    def init_socketio(self, socketio_instance):
+        self.socketio = socketio_instance
+
+    def submit(self, app, sid, alert_ids, acknowledged_by):
+        """登记一批确认请求，acknowledged_by 为已认证的用户，到达批量阈值时立即刷新"""
+        self.batch_size = app.config.get('ALERT_ACK_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('ALERT_ACK_FLUSH_MS', 200) / 1000.0
+        with self._lock:
+            self._app = app
+            self._pending.setdefault(acknowledged_by, set()).update(alert_ids)
+            self._waiters.setdefault(sid, set()).update(alert_ids)
+            self._count += len(alert_ids)
+            flush_now = self._count >= self.batch_size
+            start_timer = not flush_now and not self._flusher_running
+            if start_timer:
+                self._flusher_running = True
+        if flush_now:
+            self.socketio.start_background_task(self.flush)
+        elif start_timer:
+            self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        """把队列中的确认写入数据库，并向每个客户端发送汇总回执"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, {}
+            self._count = 0
+            app = self._app
+        if not pending:
+            return 0
+
+        error = None
+        updated = []
+        now = datetime.utcnow()
+        with app.app_context():
+            try:
+                for acknowledged_by, ids in pending.items():
+                    updated.extend(acknowledge_alerts(ids, acknowledged_by, now))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                updated = []
+                error = str(e)
+                app.logger.error(f"Error acknowledging alerts: {error}")
+        if updated:
+            from services.aggregates import aggregates
+            aggregates.alerts_closed([severity for _, severity in updated])
+
+        with self._lock:
+            self.total_flushes += 1
+            self.total_acknowledged += len(updated)
+
+        acknowledged = {alert_id for alert_id, _ in updated}
+        for sid, ids in waiters.items():
+            ids = sorted(ids)
+            if error is not None:
+                payload = {'alert_ids': ids, 'status': 'failed', 'error': error}
+            else:
+                done = [alert_id for alert_id in ids if alert_id in acknowledged]
+                payload = {
+                    'alert_ids': ids,
+                    'acknowledged': done,
+                    'skipped': [alert_id for alert_id in ids if alert_id not in acknowledged],
+                    'count': len(done),
+                    'status': 'success' if len(done) == len(ids) else 'partial' if done else 'failed'
+                }
+            self.socketio.emit('alert_acknowledged', payload, to=sid)
+        return len(updated)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._count,
+                'flushes': self.total_flushes,
+                'acknowledged': self.total_acknowledged
+            }
+
+    def _run(self):
+        self.socketio.sleep(self.flush_interval)
+        with self._lock:
+            self._flusher_running = False
+        self.flush()
+
+
+ack_batcher = AckBatcher()
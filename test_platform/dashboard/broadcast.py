@@ -0,0 +1,159 @@
+"""
+主机状态广播合并
+
+测试机架批量抖动时，逐条转发 `host_status_changed` 会把所有仪表盘淹没。
+这里按房间缓冲状态变更，在一个时间窗口（`HOST_STATUS_WINDOW_MS`，默认250ms）内
+每台主机只保留最后一次状态，窗口结束时每个房间只发送一条批量消息::
+
+    host_status_update = {
+        'hosts': [...每台主机的最新状态...],
+        'received': 本批收到的事件数,
+        'coalesced': 被后续状态覆盖的事件数,
+        'dropped': 因缓冲区已满被丢弃的事件数,
+        'timestamp': ...
+    }
+
+发送失败（如消息队列不可用）只记录日志并计入 errors，该批变更被丢弃，刷新任务继续运行。
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 用于识别同一台主机的字段，按顺序取第一个存在的
+HOST_KEYS = ('host_id', 'hostname', 'ip_address', 'ip')
+
+
+class _RoomBuffer(object):
+    __slots__ = ('hosts', 'received', 'coalesced', 'dropped')
+
+    def __init__(self):
+        self.hosts = {}
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+
+class StatusCoalescer(object):
+    """按房间合并主机状态并定时批量广播"""
+
+    def __init__(self, event='host_status_update', window=0.25, max_pending=10000):
+        self.event = event
+        self.window = window
+        self.max_pending = max_pending
+        self.socketio = None
+        self._buffers = {}  # room -> _RoomBuffer，room 为 None 表示广播给所有人
+        self._lock = threading.Lock()
+        self._flusher_running = False
+        self._anonymous = 0
+        # 累计统计
+        self.total_received = 0
+        self.total_coalesced = 0
+        self.total_dropped = 0
+        self.total_emitted = 0
+        self.total_batches = 0
+        self.total_errors = 0
+
+    def init_socketio(self, socketio_instance, window=None):
+        self.socketio = socketio_instance
+        if window is not None:
+            self.window = window
+
+    def publish(self, data, room=None):
+        """放入一条状态变更，返回是否被接收"""
+        key = self._host_key(data)
+        with self._lock:
+            buf = self._buffers.get(room)
+            if buf is None:
+                buf = self._buffers[room] = _RoomBuffer()
+            buf.received += 1
+            self.total_received += 1
+            if key in buf.hosts:
+                buf.coalesced += 1
+                self.total_coalesced += 1
+            elif len(buf.hosts) >= self.max_pending:
+                buf.dropped += 1
+                self.total_dropped += 1
+                return False
+            buf.hosts[key] = data
+            start_flusher = not self._flusher_running
+            self._flusher_running = True
+        if start_flusher:
+            self.socketio.start_background_task(self._run)
+        return True
+
+    def flush(self):
+        """立即发送所有缓冲的变更，返回发送的批次数"""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for room, buf in buffers.items():
+            payload = {
+                'hosts': list(buf.hosts.values()),
+                'received': buf.received,
+                'coalesced': buf.coalesced,
+                'dropped': buf.dropped,
+                'timestamp': time.time()
+            }
+            try:
+                if room is None:
+                    self.socketio.emit(self.event, payload)
+                else:
+                    self.socketio.emit(self.event, payload, to=room)
+            except Exception as e:
+                logger.error(f"Failed to emit {self.event} to room {room}: {e}")
+                with self._lock:
+                    self.total_errors += 1
+                continue
+            with self._lock:
+                self.total_emitted += len(buf.hosts)
+                self.total_batches += 1
+        return len(buffers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'window': self.window,
+                'pending_rooms': len(self._buffers),
+                'received': self.total_received,
+                'coalesced': self.total_coalesced,
+                'dropped': self.total_dropped,
+                'emitted': self.total_emitted,
+                'batches': self.total_batches,
+                'errors': self.total_errors
+            }
+
+    def _run(self):
+        """后台刷新循环，缓冲区清空后退出，下次 publish 时再启动"""
+        stopped = False
+        try:
+            while True:
+                self.socketio.sleep(self.window)
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Host status flush failed")
+                with self._lock:
+                    if not self._buffers:
+                        self._flusher_running = False
+                        stopped = True
+                        return
+        finally:
+            # 循环意外退出时也要复位，否则之后的 publish 不会再启动刷新任务
+            if not stopped:
+                with self._lock:
+                    self._flusher_running = False
+
+    def _host_key(self, data):
+        if isinstance(data, dict):
+            for name in HOST_KEYS:
+                value = data.get(name)
+                if value is not None:
+                    return value
+        # 无法识别主机的事件不参与合并
+        with self._lock:
+            self._anonymous += 1
+            return ('anonymous', self._anonymous)
+
+
+host_status_coalescer = StatusCoalescer()
@@ -0,0 +1,264 @@
+"""
+设备列表增量同步
+
+仪表盘通过 `subscribe_devices` 订阅设备列表，之后只接收变化的设备：
+
+- 每次提交中 `Device` 的增删改由ORM事件捕获，分配单调递增的版本号，
+  并以 `device_changes` 推送到 `device_sync` 房间::
+
+      {'epoch': ..., 'version': 42, 'changed': [{...}, ...], 'removed': [3, 7]}
+
+- 客户端订阅时带上自己的 epoch 和 version：在变更历史（`DEVICE_SYNC_HISTORY` 条）
+  范围内时只返回差量，否则返回完整快照；
+- 版本号和变更历史保存在Redis中（`DEVICE_SYNC_REDIS`，否则使用非localhost的 `REDIS_URL`），
+  所有worker共用同一个版本序列，客户端连到任何worker都能拿到正确的差量；
+  没有Redis时只在本进程内维护，epoch 标识进程实例，客户端连到别的worker时
+  epoch 不一致，退回完整快照；
+- 推送本身经消息队列发给所有客户端，内容是完整的设备记录，可以幂等地应用。
+  Redis暂时不可用时推送带 `resync: true`，客户端应重新订阅取快照。
+
+绕过ORM的批量写入（如批量注册）应调用 `device_sync.notify(changed_ids)`。
+"""
+import logging
+import threading
+import uuid
+from collections import deque
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models.device import Device
+
+DEVICE_SYNC_ROOM = 'device_sync'
+
+logger = logging.getLogger(__name__)
+
+
+class LocalChangeLog(object):
+    """进程内的变更历史，只适用于单进程部署"""
+
+    def __init__(self, history=10000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._history = deque(maxlen=history)   # (version, device_id, removed)
+        self._lock = threading.Lock()
+
+    def resize(self, history):
+        with self._lock:
+            self._history = deque(self._history, maxlen=history)
+
+    def record(self, changed, removed):
+        """登记一批变更，返回 (epoch, 新版本号)"""
+        with self._lock:
+            for device_id in changed:
+                self.version += 1
+                self._history.append((self.version, device_id, False))
+            for device_id in removed:
+                self.version += 1
+                self._history.append((self.version, device_id, True))
+            return self.epoch, self.version
+
+    def current(self):
+        with self._lock:
+            return self.epoch, self.version
+
+    def since(self, version):
+        """返回 (epoch, 当前版本, version 之后的 [(device_id, removed)])，超出历史范围时变更列表为 None"""
+        with self._lock:
+            if version > self.version:
+                return self.epoch, self.version, None
+            if version == self.version:
+                return self.epoch, self.version, []
+            if not self._history or self._history[0][0] > version + 1:
+                return self.epoch, self.version, None
+            return self.epoch, self.version, [(d, removed) for v, d, removed in self._history if v > version]
+
+
+class RedisChangeLog(object):
+    """
+    保存在Redis中的变更历史，所有worker共用。
+
+    每个版本号在有序集合中恰好对应一条记录（score 为版本号），读取差量时
+    检查 (version, 当前版本] 内的记录数是否等于版本差：历史已被截断或另一个worker
+    正在写入时条数不符，退回快照。
+    """
+
+    def __init__(self, client, prefix='device_sync', history=10000):
+        self.client = client
+        self.history = history
+        self.epoch_key = f'{prefix}:epoch'
+        self.version_key = f'{prefix}:version'
+        self.log_key = f'{prefix}:log'
+
+    def resize(self, history):
+        self.history = history
+
+    def record(self, changed, removed):
+        entries = [(device_id, 0) for device_id in changed] + [(device_id, 1) for device_id in removed]
+        pipe = self.client.pipeline(transaction=True)
+        # Redis数据丢失后版本号从头开始，同时生成新的 epoch，客户端会退回快照
+        pipe.set(self.epoch_key, uuid.uuid4().hex[:12], nx=True)
+        pipe.incrby(self.version_key, len(entries))
+        pipe.get(self.epoch_key)
+        _, version, epoch = pipe.execute()
+        if not entries:
+            return _text(epoch), version
+        first = version - len(entries) + 1
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zadd(self.log_key, {f'{first + i}:{device_id}:{flag}': first + i
+                                 for i, (device_id, flag) in enumerate(entries)})
+        pipe.zremrangebyrank(self.log_key, 0, -(self.history + 1))
+        pipe.execute()
+        return _text(epoch), version
+
+    def current(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self.epoch_key, uuid.uuid4().hex[:12], nx=True)
+        pipe.get(self.epoch_key)
+        pipe.get(self.version_key)
+        _, epoch, version = pipe.execute()
+        return _text(epoch), int(version or 0)
+
+    def since(self, version):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self.epoch_key)
+        pipe.get(self.version_key)
+        pipe.zrangebyscore(self.log_key, f'({version}', '+inf')
+        epoch, current, members = pipe.execute()
+        epoch, current = _text(epoch), int(current or 0)
+        if version > current:
+            return epoch, current, None
+        changes = []
+        for member in members:
+            v, device_id, flag = _text(member).split(':')
+            if int(v) <= current:
+                changes.append((int(device_id), flag == '1'))
+        if len(changes) != current - version:
+            return epoch, current, None
+        return epoch, current, changes
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class DeviceChangeLog(object):
+    """设备变更历史与推送"""
+
+    def __init__(self, history=10000):
+        self.store = LocalChangeLog(history)
+        self.socketio = None
+        self.fields = Device.SUMMARY_FIELDS
+
+    def init_app(self, app, socketio_instance):
+        self.socketio = socketio_instance
+        history = app.config.get('DEVICE_SYNC_HISTORY', 10000)
+        redis_url = app.config.get('DEVICE_SYNC_REDIS')
+        if not redis_url:
+            redis_url = app.config.get('REDIS_URL')
+            if redis_url and redis_url.startswith('redis://localhost'):
+                redis_url = None
+        if redis_url:
+            import redis
+            self.store = RedisChangeLog(redis.Redis.from_url(redis_url, socket_connect_timeout=2),
+                                        prefix=app.config.get('DEVICE_SYNC_PREFIX', 'device_sync'),
+                                        history=history)
+        else:
+            self.store.resize(history)
+
+    def record(self, changed, removed):
+        """登记一批变更，返回 (epoch, 新版本号)"""
+        return self.store.record(list(changed), list(removed))
+
+    def sync(self, epoch, version):
+        """生成订阅响应：差量或快照；version 无效或 epoch 不一致时返回快照"""
+        try:
+            version = int(version)
+        except (TypeError, ValueError):
+            version = None
+        changes = None
+        try:
+            if epoch is not None and version is not None and version >= 0:
+                current_epoch, current, changes = self.store.since(version)
+                if epoch != current_epoch:
+                    changes = None
+            else:
+                current_epoch, current = self.store.current()
+        except Exception as e:
+            logger.error(f"Device change log unavailable, sending snapshot: {e}")
+            current_epoch, current = None, None
+        if changes is None:
+            return {
+                'type': 'snapshot',
+                'epoch': current_epoch,
+                'version': current,
+                'devices': Device.bulk_to_dict(fields=self.fields)
+            }
+        latest = dict(changes)
+        changed = sorted(d for d, removed in latest.items() if not removed)
+        return {
+            'type': 'delta',
+            'epoch': current_epoch,
+            'version': current,
+            'changed': Device.bulk_to_dict(Device.id.in_(changed), fields=self.fields) if changed else [],
+            'removed': sorted(d for d, removed in latest.items() if removed)
+        }
+
+    def notify(self, changed_ids=(), removed_ids=()):
+        """为绕过ORM的写入登记变更并推送，需在应用上下文中调用"""
+        changed_ids = list(changed_ids)
+        removed_ids = list(removed_ids)
+        if not changed_ids and not removed_ids:
+            return
+        changed = Device.bulk_to_dict(Device.id.in_(changed_ids), fields=self.fields) if changed_ids else []
+        self._publish(changed, removed_ids)
+
+    def _publish(self, changed, removed):
+        payload = {'changed': changed, 'removed': list(removed)}
+        try:
+            payload['epoch'], payload['version'] = self.record([d['id'] for d in changed], removed)
+        except Exception as e:
+            logger.error(f"Failed to record device changes, asking clients to resync: {e}")
+            payload.update({'epoch': None, 'version': None, 'resync': True})
+        if self.socketio is None:
+            return
+        self.socketio.emit('device_changes', payload, to=DEVICE_SYNC_ROOM)
+
+
+device_sync = DeviceChangeLog()
+
+
+def _synced_fields_changed(obj):
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in device_sync.fields)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_device_changes(session, flush_context):
+    """flush后记录本事务中变化的设备，提交后再发布"""
+    pending = session.info.setdefault('device_sync', {'changed': {}, 'removed': set()})
+    for obj in session.new:
+        if isinstance(obj, Device):
+            pending['changed'][obj.id] = obj
+    for obj in session.dirty:
+        # 只关心同步字段的变化，例如 last_login_at 的更新不推送
+        if isinstance(obj, Device) and _synced_fields_changed(obj):
+            pending['changed'][obj.id] = obj
+    for obj in session.deleted:
+        if isinstance(obj, Device):
+            pending['changed'].pop(obj.id, None)
+            pending['removed'].add(obj.id)
+    # 提交后不能再发SQL，这里先把要推送的字段序列化
+    pending['payload'] = [obj.to_dict(device_sync.fields) for obj in pending['changed'].values()]
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_device_changes(session):
+    pending = session.info.pop('device_sync', None)
+    if pending and (pending.get('payload') or pending['removed']):
+        device_sync._publish(pending.get('payload', []), sorted(pending['removed']))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_device_changes(session):
+    session.info.pop('device_sync', None)
@@ -0,0 +1,137 @@
+"""
+Socket.IO 后台任务
+
+耗时的事件处理器不应直接在handler里 `time.sleep`，否则在eventlet/gevent下
+会一直占住worker。这里基于 `socketio.start_background_task` 提供一个轻量的
+任务框架：
+
+- 任务按客户端sid归属，进度只推送给发起的客户端；
+- 客户端断开时取消它的所有任务；
+- 每个客户端同时运行的任务数有上限（`SOCKET_MAX_JOBS_PER_CLIENT`）。
+
+用法::
+
+    def work(job, message):
+        for i in range(5):
+            if not job.sleep(1):
+                return
+            job.emit('progress', {'step': i})
+
+    job_manager.start(request.sid, 'server_info', work, message)
+"""
+import itertools
+import threading
+
+from flask import current_app
+
+
+class JobLimitExceeded(Exception):
+    """客户端并发任务数超过上限"""
+
+
+class SocketJob(object):
+    """一个归属于某个sid的后台任务"""
+
+    def __init__(self, manager, job_id, sid, name):
+        self.manager = manager
+        self.id = job_id
+        self.sid = sid
+        self.name = name
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def emit(self, event, data):
+        """向发起任务的客户端推送消息，任务已取消时不再推送"""
+        if self.cancelled:
+            return False
+        self.manager.socketio.emit(event, data, to=self.sid)
+        return True
+
+    def sleep(self, seconds, step=0.2):
+        """
+        协作式休眠，按 step 切片检查取消标志。
+        返回 False 表示任务已被取消，调用方应尽快退出。
+        """
+        remaining = seconds
+        while remaining > 0:
+            if self.cancelled:
+                return False
+            interval = min(step, remaining)
+            self.manager.socketio.sleep(interval)
+            remaining -= interval
+        return not self.cancelled
+
+
+class SocketJobManager(object):
+    """管理所有客户端的后台任务"""
+
+    def __init__(self, max_jobs_per_client=2):
+        self.socketio = None
+        self.max_jobs_per_client = max_jobs_per_client
+        self._jobs = {}  # sid -> {job_id: SocketJob}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def init_socketio(self, socketio_instance):
+        self.socketio = socketio_instance
+
+    def start(self, sid, name, func, *args, **kwargs):
+        """
+        为 sid 启动一个后台任务，func 的第一个参数是 SocketJob。
+        超过并发上限时抛出 JobLimitExceeded。
+        """
+        app = current_app._get_current_object()
+        limit = app.config.get('SOCKET_MAX_JOBS_PER_CLIENT', self.max_jobs_per_client)
+        with self._lock:
+            jobs = self._jobs.setdefault(sid, {})
+            if len(jobs) >= limit:
+                raise JobLimitExceeded(
+                    f"Client {sid} already has {len(jobs)} running jobs")
+            job = SocketJob(self, next(self._ids), sid, name)
+            jobs[job.id] = job
+
+        def runner():
+            try:
+                with app.app_context():
+                    func(job, *args, **kwargs)
+            except Exception as e:
+                app.logger.error(f"Socket job {name} for {sid} failed: {e}")
+                job.emit('job_error', {'job': name, 'job_id': job.id, 'error': str(e)})
+            finally:
+                self._finish(job)
+
+        self.socketio.start_background_task(runner)
+        return job
+
+    def cancel(self, sid, job_id=None):
+        """取消 sid 的指定任务，不传 job_id 时取消其全部任务"""
+        with self._lock:
+            jobs = self._jobs.get(sid, {})
+            if job_id is None:
+                targets = list(jobs.values())
+            else:
+                targets = [jobs[job_id]] if job_id in jobs else []
+        for job in targets:
+            job.cancel()
+        return len(targets)
+
+    def running(self, sid):
+        with self._lock:
+            return len(self._jobs.get(sid, {}))
+
+    def _finish(self, job):
+        with self._lock:
+            jobs = self._jobs.get(job.sid)
+            if jobs is not None:
+                jobs.pop(job.id, None)
+                if not jobs:
+                    del self._jobs[job.sid]
+
+
+job_manager = SocketJobManager()
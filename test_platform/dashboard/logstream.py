@@ -0,0 +1,280 @@
+"""
+测试日志实时推送
+
+执行器把日志行写入每个执行（execution）独立的有界环形缓冲区，写入是O(1)且从不阻塞；
+后台刷新任务每 `LOG_STREAM_FRAME_MS` 毫秒把新日志按最多 `LOG_STREAM_FRAME_LINES`
+行一帧推送给订阅的客户端（事件 `test_log`）。
+
+- 每行日志带单调递增的序号 seq；
+- 后加入的客户端订阅时会先收到缓冲区末尾的若干行（tail）；
+- 订阅时声明 `ack: true` 的客户端需要回 `log_ack`，未确认的帧超过
+  `LOG_STREAM_MAX_INFLIGHT` 时暂停给它发送，恢复后如果它需要的日志已被缓冲区覆盖，
+  会收到 `{'skipped': n}` 标记而不是让生产者等待。
+
+缓冲区只由执行器创建（`open` / 写入日志），订阅不存在的执行会被拒绝。
+执行结束后缓冲区再保留 `LOG_STREAM_RETAIN_SECONDS` 秒供迟到的客户端回放；
+超过 `LOG_STREAM_IDLE_SECONDS` 秒没有新日志的执行视为已结束。
+"""
+import threading
+import time
+from collections import deque
+
+
+class LogRingBuffer(object):
+    """带序号的有界日志缓冲区"""
+
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self._lines = deque(maxlen=capacity)
+        self.next_seq = 1        # 下一行的序号
+        self.closed = False
+        self.last_active = time.monotonic()   # 最后一次写入或结束的时间
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            seq = self.next_seq
+            self._lines.append(line)
+            self.next_seq += 1
+            self.last_active = time.monotonic()
+            return seq
+
+    def extend(self, lines):
+        with self._lock:
+            self._lines.extend(lines)
+            self.next_seq += len(lines)
+            self.last_active = time.monotonic()
+            return self.next_seq - 1
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self.last_active = time.monotonic()
+
+    @property
+    def first_seq(self):
+        """缓冲区中最早一行的序号"""
+        return self.next_seq - len(self._lines)
+
+    def read(self, after_seq, limit):
+        """
+        读取序号大于 after_seq 的最多 limit 行。
+        返回 (first_seq, lines, skipped)，skipped 为已被覆盖而无法读取的行数。
+        """
+        with self._lock:
+            first = self.next_seq - len(self._lines)
+            start = max(after_seq + 1, first)
+            skipped = start - (after_seq + 1)
+            offset = start - first
+            end = min(offset + limit, len(self._lines))
+            lines = [self._lines[i] for i in range(offset, end)]
+            return start, lines, skipped
+
+    def tail(self, count):
+        """返回回放最后 count 行时的起始游标（即其前一行的序号）"""
+        with self._lock:
+            return max(self.next_seq - 1 - count, self.next_seq - 1 - len(self._lines))
+
+
+class _Subscriber(object):
+    __slots__ = ('cursor', 'acked', 'use_ack')
+
+    def __init__(self, cursor, use_ack):
+        self.cursor = cursor     # 已发送的最后一行序号
+        self.acked = cursor      # 客户端确认的最后一行序号
+        self.use_ack = use_ack
+
+
+class LogStreamer(object):
+    """管理所有执行的日志缓冲区与订阅者"""
+
+    def __init__(self, buffer_lines=5000, frame_lines=200, frame_interval=0.1, max_inflight=4,
+                 retain_seconds=60, idle_seconds=600):
+        self.buffer_lines = buffer_lines
+        self.frame_lines = frame_lines
+        self.frame_interval = frame_interval
+        self.max_inflight = max_inflight
+        self.retain_seconds = retain_seconds
+        self.idle_seconds = idle_seconds
+        self.socketio = None
+        self._buffers = {}       # execution_id -> LogRingBuffer
+        self._subscribers = {}   # execution_id -> {sid: _Subscriber}
+        self._lock = threading.Lock()
+        self._flusher_running = False
+        self._last_evict = 0.0
+        self.frames_sent = 0
+        self.lines_sent = 0
+        self.lines_skipped = 0
+
+    def init_app(self, app, socketio_instance):
+        self.socketio = socketio_instance
+        self.buffer_lines = app.config.get('LOG_STREAM_BUFFER_LINES', self.buffer_lines)
+        self.frame_lines = app.config.get('LOG_STREAM_FRAME_LINES', self.frame_lines)
+        self.frame_interval = app.config.get('LOG_STREAM_FRAME_MS', self.frame_interval * 1000) / 1000.0
+        self.max_inflight = app.config.get('LOG_STREAM_MAX_INFLIGHT', self.max_inflight)
+        self.retain_seconds = app.config.get('LOG_STREAM_RETAIN_SECONDS', self.retain_seconds)
+        self.idle_seconds = app.config.get('LOG_STREAM_IDLE_SECONDS', self.idle_seconds)
+
+    # 生产者接口
+
+    def open(self, execution_id):
+        """执行开始时创建缓冲区，之后客户端才能订阅"""
+        self._evict()
+        self._buffer(execution_id)
+
+    def write(self, execution_id, *lines):
+        """写入日志行，返回最后一行的序号"""
+        buf = self._buffer(execution_id)
+        seq = buf.extend(lines)
+        self._ensure_flusher()
+        return seq
+
+    def close(self, execution_id):
+        """执行结束，推送完剩余日志后通知客户端"""
+        buf = self._buffers.get(execution_id)
+        if buf is not None:
+            buf.close()
+            self._ensure_flusher()
+
+    # 订阅接口
+
+    def subscribe(self, sid, execution_id, tail=200, use_ack=False):
+        """订阅日志，先回放最后 tail 行；执行不存在（未开始或已释放）时返回 False"""
+        self._evict()
+        with self._lock:
+            buf = self._buffers.get(execution_id)
+            if buf is None:
+                return False
+            self._subscribers.setdefault(execution_id, {})[sid] = _Subscriber(buf.tail(tail), use_ack)
+        self._ensure_flusher()
+        return True
+
+    def unsubscribe(self, sid, execution_id=None):
+        with self._lock:
+            targets = [execution_id] if execution_id is not None else list(self._subscribers)
+            for target in targets:
+                subs = self._subscribers.get(target)
+                if subs is not None:
+                    subs.pop(sid, None)
+                    if not subs:
+                        del self._subscribers[target]
+
+    def ack(self, sid, execution_id, seq):
+        with self._lock:
+            sub = self._subscribers.get(execution_id, {}).get(sid)
+            if sub is not None and seq > sub.acked:
+                sub.acked = min(seq, sub.cursor)
+        self._ensure_flusher()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': len(self._buffers),
+                'subscribers': sum(len(s) for s in self._subscribers.values()),
+                'frames_sent': self.frames_sent,
+                'lines_sent': self.lines_sent,
+                'lines_skipped': self.lines_skipped
+            }
+
+    # 内部实现
+
+    def _buffer(self, execution_id):
+        buf = self._buffers.get(execution_id)
+        if buf is None:
+            with self._lock:
+                buf = self._buffers.get(execution_id)
+                if buf is None:
+                    buf = self._buffers[execution_id] = LogRingBuffer(self.buffer_lines)
+        return buf
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher_running or self.socketio is None:
+                return
+            self._flusher_running = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        """刷新循环：没有待发送内容时退出，下次写入或订阅时重新启动"""
+        while True:
+            self.socketio.sleep(self.frame_interval)
+            if not self.flush():
+                with self._lock:
+                    self._flusher_running = False
+                return
+
+    def flush(self):
+        """给所有订阅者推送新日志，返回是否还有未完成的工作"""
+        pending = False
+        with self._lock:
+            work = [(execution_id, list(subs.items()))
+                    for execution_id, subs in self._subscribers.items()]
+        for execution_id, subs in work:
+            buf = self._buffers.get(execution_id)
+            if buf is None:
+                continue
+            for sid, sub in subs:
+                if self._flush_subscriber(execution_id, buf, sid, sub):
+                    pending = True
+        self._evict()
+        return pending
+
+    def _flush_subscriber(self, execution_id, buf, sid, sub):
+        """给单个订阅者发送若干帧，返回它是否还有未发送的日志"""
+        frames = 0
+        while True:
+            if sub.use_ack and (sub.cursor - sub.acked) >= self.max_inflight * self.frame_lines:
+                # 客户端处理不过来，暂停发送
+                return sub.cursor < buf.next_seq - 1
+            start, lines, skipped = buf.read(sub.cursor, self.frame_lines)
+            if skipped:
+                self.socketio.emit('test_log', {
+                    'execution_id': execution_id, 'skipped': skipped, 'seq': start
+                }, to=sid)
+                self.lines_skipped += skipped
+                # 被跳过的行不计入未确认的量
+                sub.acked = max(sub.acked, start - 1)
+            if not lines:
+                sub.cursor = start - 1
+                if buf.closed and sub.cursor >= buf.next_seq - 1:
+                    self.socketio.emit('test_log', {'execution_id': execution_id, 'final': True}, to=sid)
+                    self.unsubscribe(sid, execution_id)
+                return False
+            self.socketio.emit('test_log', {
+                'execution_id': execution_id, 'seq': start, 'lines': lines
+            }, to=sid)
+            sub.cursor = start + len(lines) - 1
+            self.frames_sent += 1
+            self.lines_sent += len(lines)
+            frames += 1
+            if frames >= self.max_inflight:
+                return sub.cursor < buf.next_seq - 1
+
+    def _evict(self, force=False):
+        """
+        把长时间没有新日志的执行标记为结束，并释放结束超过保留时间且无人订阅的缓冲区。
+        至多每秒执行一次。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_evict < 1.0:
+                return
+            self._last_evict = now
+            buffers = list(self._buffers.items())
+        for execution_id, buf in buffers:
+            if not buf.closed and now - buf.last_active > self.idle_seconds:
+                self.close(execution_id)
+        now = time.monotonic()
+        with self._lock:
+            for execution_id in [eid for eid, buf in self._buffers.items()
+                                 if buf.closed and eid not in self._subscribers
+                                 and now - buf.last_active >= self.retain_seconds]:
+                del self._buffers[execution_id]
+
+
+log_streamer = LogStreamer()
+
+
+def stream_log_to_client(execution_id, *lines):
+    """执行器写日志的入口"""
+    return log_streamer.write(execution_id, *lines)
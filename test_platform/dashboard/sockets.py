@@ -1,6 +1,15 @@
-from flask_socketio import emit
-from flask import session, current_app
-import time
+from flask_socketio import emit, join_room, leave_room
+from flask import session, current_app, request
+from flask_jwt_extended import decode_token
+from auth.services import decode_user_token
+from .jobs import job_manager, JobLimitExceeded
+from .broadcast import host_status_coalescer
+from .subscriptions import alert_subscriptions
+from .acks import ack_batcher
+from .logstream import log_streamer
+from .device_sync import device_sync, DEVICE_SYNC_ROOM
+from services.rule_engine import rule_engine
+from services.telemetry import telemetry_store
 
 # 注意：socketio实例将在app.py中初始化后导入
 socketio = None
@@ -12,30 +21,69 @@ def init_socketio(app_socketio):
 
 # 可以在这里定义与仪表盘相关的WebSocket事件处理器
 
-def handle_connect():
+def _authenticated_user(auth):
+    """
+    从连接时的 auth（{'token': ...}）或查询参数 token 中校验JWT，返回用户身份。
+    接受 `/login` 签发的用户token（user_id / username），也接受 flask_jwt_extended 的token（sub）。
+    """
+    token = auth.get('token') if isinstance(auth, dict) else None
+    token = token or request.args.get('token')
+    if not token:
+        return None
+    user = decode_user_token(token)
+    if user is not None:
+        return user
+    try:
+        return decode_token(token).get('sub')
+    except Exception:
+        return None
+
+def handle_connect(auth=None):
     """
     处理客户端连接事件。
-    可以在这里进行用户认证或会话设置。
+    连接时携带有效JWT的客户端，其身份保存在Socket.IO会话中，供确认告警等操作使用。
     """
+    user = _authenticated_user(auth)
+    session['user'] = str(user) if user is not None else None
     current_app.logger.info(f"Client connected: {session.sid}")
-    emit('response', {'data': 'Connected', 'sid': session.sid})
+    emit('response', {'data': 'Connected', 'sid': session.sid, 'authenticated': user is not None})
 
 def handle_disconnect():
     """处理客户端断开连接事件。"""
     current_app.logger.info(f"Client disconnected: {session.sid}")
+    # 取消该客户端仍在运行的后台任务，清理告警订阅
+    job_manager.cancel(request.sid)
+    alert_subscriptions.unsubscribe(request.sid)
+    log_streamer.unsubscribe(request.sid)
+
+def _server_info_job(job, message):
+    """在后台逐步返回服务器信息"""
+    # 模拟一个耗时任务，并逐步返回信息
+    for i in range(5):
+        if not job.sleep(1):
+            return
+        job.emit('server_info_update', {'progress': (i + 1) * 20, 'message': f'Processing step {i+1}...'})
+    
+    job.emit('server_info_update', {'progress': 100, 'message': 'Done!', 'final': True})
 
 def handle_server_info(message):
     """
     一个示例事件，用于客户端请求服务器信息。
+    耗时部分交给后台任务执行，handler本身立即返回。
     """
     current_app.logger.info(f"Received server info request from {session.sid} with data: {message}")
-    
-    # 模拟一个耗时任务，并逐步返回信息
-    for i in range(5):
-        time.sleep(1)
-        emit('server_info_update', {'progress': (i + 1) * 20, 'message': f'Processing step {i+1}...'})
-    
-    emit('server_info_update', {'progress': 100, 'message': 'Done!', 'final': True})
+    try:
+        job = job_manager.start(request.sid, 'server_info', _server_info_job, message)
+    except JobLimitExceeded as e:
+        emit('server_info_update', {'error': str(e), 'final': True})
+        return
+    emit('server_info_update', {'progress': 0, 'message': 'Queued', 'job_id': job.id})
+
+def handle_cancel_job(data):
+    """处理客户端取消后台任务，不传 job_id 时取消全部"""
+    job_id = (data or {}).get('job_id')
+    cancelled = job_manager.cancel(request.sid, job_id)
+    emit('job_cancelled', {'job_id': job_id, 'cancelled': cancelled})
 
 def default_error_handler(e):
     """默认的错误处理器。"""
@@ -43,43 +91,172 @@ def default_error_handler(e):
     emit('error', {'error': str(e)})
 
 def handle_host_status_change(data):
-    """处理主机状态变更，并广播给所有客户端"""
-    emit('host_status_update', data, broadcast=True)
+    """
+    处理主机状态变更，并广播给所有客户端。
+    变更先进入合并缓冲区，按 HOST_STATUS_WINDOW_MS 窗口批量发送；
+    窗口配置为0时退回逐条广播。
+    data 可带 room 只发给某个房间，房间必须在 HOST_STATUS_ROOMS 中列出，
+    不能借此向其他客户端的私有房间（sid）发送消息。
+    """
+    room = data.get('room') if isinstance(data, dict) else None
+    if room is not None and room not in current_app.config.get('HOST_STATUS_ROOMS', ()):
+        emit('host_status_error', {'error': f'Room not allowed: {room}'})
+        return
+
+    # 状态变更同时放入告警规则引擎的队列，由后台任务评估与该主机相关的规则
+    if isinstance(data, dict):
+        rule_engine.submit(data)
+
+    if host_status_coalescer.window <= 0:
+        emit('host_status_update', data, to=room, broadcast=room is None)
+        return
+    host_status_coalescer.publish(data, room=room)
 
 def handle_subscribe_alerts(data):
-    """处理客户端订阅告警事件"""
-    current_app.logger.info(f"Client {session.sid} subscribed to alerts")
-    emit('alert_subscription_confirmed', {'status': 'subscribed'})
+    """
+    处理客户端订阅告警事件。
+    data 可包含 severity / device_type / location 过滤条件（单值或列表），
+    不带条件即订阅全部告警。
+    """
+    filters = (data or {}).get('filters', data)
+    try:
+        rooms, normalized = alert_subscriptions.subscribe(request.sid, filters)
+    except ValueError as e:
+        emit('alert_subscription_confirmed', {'status': 'error', 'error': str(e)})
+        return
+    for room in rooms:
+        join_room(room)
+    current_app.logger.info(f"Client {session.sid} subscribed to alerts with {normalized}")
+    emit('alert_subscription_confirmed', {'status': 'subscribed', 'rooms': rooms, 'filters': normalized})
 
 def handle_unsubscribe_alerts(data):
-    """处理客户端取消订阅告警事件"""
+    """处理客户端取消订阅告警事件，不带过滤条件时取消全部订阅"""
+    filters = (data or {}).get('filters', data) or None
+    rooms = alert_subscriptions.unsubscribe(request.sid, filters)
+    for room in rooms:
+        leave_room(room)
     current_app.logger.info(f"Client {session.sid} unsubscribed from alerts")
-    emit('alert_subscription_confirmed', {'status': 'unsubscribed'})
+    emit('alert_subscription_confirmed', {'status': 'unsubscribed', 'rooms': rooms})
 
 def handle_acknowledge_alert(data):
-    """处理客户端确认告警事件"""
+    """
+    处理客户端确认告警事件。
+    支持 alert_id 单条或 alert_ids 列表；确认请求进入批量写回队列，
+    写库后客户端会收到一条汇总的 alert_acknowledged 回执。
+    只有连接时通过认证的客户端可以确认告警，确认人记为认证的用户。
+    """
+    user = session.get('user')
+    if not user:
+        emit('alert_acknowledged', {'error': 'Authentication required'})
+        return
     try:
-        alert_id = data.get('alert_id')
-        if alert_id:
-            # 这里可以调用告警服务来确认告警
-            current_app.logger.info(f"Client {session.sid} acknowledged alert {alert_id}")
-            emit('alert_acknowledged', {'alert_id': alert_id, 'status': 'success'})
-        else:
+        alert_ids = data.get('alert_ids') or []
+        if data.get('alert_id'):
+            alert_ids = list(alert_ids) + [data['alert_id']]
+        if not alert_ids:
             emit('alert_acknowledged', {'error': 'Missing alert_id'})
+            return
+        try:
+            alert_ids = [int(alert_id) for alert_id in alert_ids]
+        except (TypeError, ValueError):
+            emit('alert_acknowledged', {'error': 'Invalid alert_id'})
+            return
+        current_app.logger.info(f"Client {session.sid} acknowledged {len(alert_ids)} alerts")
+        ack_batcher.submit(current_app._get_current_object(), request.sid, alert_ids, acknowledged_by=user)
     except Exception as e:
         current_app.logger.error(f"Error acknowledging alert: {str(e)}")
         emit('alert_acknowledged', {'error': str(e)})
 
+def handle_subscribe_logs(data):
+    """
+    订阅某次执行的实时日志。
+    data: execution_id，可选 tail（回放的行数，默认200）和 ack（是否启用确认式流控）
+    """
+    try:
+        execution_id = int((data or {})['execution_id'])
+        tail = int(data.get('tail', 200))
+    except (KeyError, TypeError, ValueError):
+        emit('test_log', {'error': 'execution_id must be an integer'})
+        return
+    if not log_streamer.subscribe(request.sid, execution_id, tail=tail, use_ack=bool(data.get('ack'))):
+        emit('test_log', {'execution_id': execution_id, 'error': 'Execution is not running'})
+
+def handle_unsubscribe_logs(data):
+    """取消订阅日志，不带 execution_id 时取消全部"""
+    execution_id = (data or {}).get('execution_id')
+    try:
+        execution_id = int(execution_id) if execution_id is not None else None
+    except (TypeError, ValueError):
+        return
+    log_streamer.unsubscribe(request.sid, execution_id)
+
+def handle_log_ack(data):
+    """客户端确认已处理到的日志序号"""
+    try:
+        log_streamer.ack(request.sid, int(data['execution_id']), int(data['seq']))
+    except (KeyError, TypeError, ValueError):
+        pass
+
+def handle_device_telemetry(data):
+    """
+    接收设备上报的遥测样本。
+    data: {'device_id': ..., 'metrics': {'cpu': 12.5, ...}, 'timestamp': 可选}
+    """
+    if not data or data.get('device_id') is None or not data.get('metrics'):
+        emit('telemetry_error', {'error': 'device_id and metrics are required'})
+        return
+    try:
+        telemetry_store.record_many(data['device_id'], data['metrics'], data.get('timestamp'))
+    except (TypeError, ValueError) as e:
+        emit('telemetry_error', {'error': str(e)})
+
+def handle_query_telemetry(data):
+    """查询遥测数据，按时间范围自动选择原始点或汇总"""
+    try:
+        result = telemetry_store.query(
+            data['device_id'], data['metric'], float(data['start']),
+            float(data['end']) if data.get('end') is not None else None,
+            data.get('resolution'))
+    except (KeyError, TypeError, ValueError) as e:
+        emit('telemetry_data', {'error': str(e)})
+        return
+    result.update({'device_id': data['device_id'], 'metric': data['metric']})
+    emit('telemetry_data', result)
+
+def handle_subscribe_devices(data):
+    """
+    订阅设备列表同步。
+    data 可带上次收到的 epoch 和 version，能接上历史时只返回差量，否则返回完整快照。
+    """
+    data = data or {}
+    join_room(DEVICE_SYNC_ROOM)
+    emit('device_sync', device_sync.sync(data.get('epoch'), data.get('version')))
+
+def handle_unsubscribe_devices(data):
+    """取消设备列表同步"""
+    leave_room(DEVICE_SYNC_ROOM)
+
 def register_socketio_events(socketio_instance):
     """注册所有socketio事件处理器"""
     global socketio
     socketio = socketio_instance
+    job_manager.init_socketio(socketio_instance)
+    host_status_coalescer.init_socketio(socketio_instance)
+    ack_batcher.init_socketio(socketio_instance)
     
     socketio.on_event('connect', handle_connect)
     socketio.on_event('disconnect', handle_disconnect)
     socketio.on_event('request_server_info', handle_server_info)
+    socketio.on_event('cancel_job', handle_cancel_job)
     socketio.on_event('host_status_changed', handle_host_status_change)
     socketio.on_event('subscribe_alerts', handle_subscribe_alerts)
     socketio.on_event('unsubscribe_alerts', handle_unsubscribe_alerts)
     socketio.on_event('acknowledge_alert', handle_acknowledge_alert)
+    socketio.on_event('subscribe_logs', handle_subscribe_logs)
+    socketio.on_event('unsubscribe_logs', handle_unsubscribe_logs)
+    socketio.on_event('log_ack', handle_log_ack)
+    socketio.on_event('device_telemetry', handle_device_telemetry)
+    socketio.on_event('subscribe_devices', handle_subscribe_devices)
+    socketio.on_event('unsubscribe_devices', handle_unsubscribe_devices)
+    socketio.on_event('query_telemetry', handle_query_telemetry)
     socketio.on_error_default(default_error_handler)
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+告警订阅管理
+
+客户端订阅告警时携带过滤条件（severity / device_type / location），
+订阅被展开成若干个固定的Socket.IO房间，每个房间对应一组“每个字段至多一个取值”的条件：
+
+    {'severity': ['critical', 'high'], 'location': 'lab1'}
+    -> alerts:<severity=critical, location=lab1>、alerts:<severity=high, location=lab1>
+
+房间名只由条件决定，因此推送告警时不需要任何订阅索引：一条告警能匹配的房间
+就是每个字段取“告警中的值”或“任意值”的组合（3个字段至多8个房间），
+`publish_alert` 直接向这些房间发送，经消息队列到达所有worker，由各worker投递给房间里的本地客户端。
+告警只需由产生它的进程推送一次。
+
+每个订阅展开的房间数不超过 `MAX_ROOMS_PER_SUBSCRIPTION`。
+"""
+import hashlib
+import itertools
+import json
+import threading
+
+ALERT_ROOM_PREFIX = 'alerts:'
+FILTER_FIELDS = ('severity', 'device_type', 'location')
+MAX_ROOMS_PER_SUBSCRIPTION = 64
+
+
+def normalize_filters(data):
+    """
+    规范化过滤条件：每个字段为排序后的取值元组，未指定的字段为 None（匹配任意值）。
+    """
+    data = data or {}
+    normalized = {}
+    for field in FILTER_FIELDS:
+        value = data.get(field)
+        if value in (None, '', [], '*'):
+            normalized[field] = None
+        elif isinstance(value, (list, tuple, set)):
+            normalized[field] = tuple(sorted(str(v) for v in value))
+        else:
+            normalized[field] = (str(value),)
+    return normalized
+
+
+def room_for_filters(filters):
+    """同一组单值过滤条件总是得到同一个房间名"""
+    key = json.dumps({field: filters.get(field) for field in FILTER_FIELDS}, sort_keys=True)
+    return ALERT_ROOM_PREFIX + hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def rooms_for_filters(filters):
+    """把规范化后的过滤条件展开成房间列表"""
+    options = [[None] if filters[field] is None else [(value,) for value in filters[field]]
+               for field in FILTER_FIELDS]
+    count = 1
+    for values in options:
+        count *= len(values)
+    if count > MAX_ROOMS_PER_SUBSCRIPTION:
+        raise ValueError(f'Subscription expands to {count} rooms, '
+                         f'at most {MAX_ROOMS_PER_SUBSCRIPTION} are allowed')
+    return sorted(room_for_filters(dict(zip(FILTER_FIELDS, combo)))
+                  for combo in itertools.product(*options))
+
+
+def rooms_for_alert(alert):
+    """一条告警能匹配的所有房间"""
+    options = []
+    for field in FILTER_FIELDS:
+        value = alert.get(field)
+        options.append([None] if value is None else [None, (str(value),)])
+    return sorted(room_for_filters(dict(zip(FILTER_FIELDS, combo)))
+                  for combo in itertools.product(*options))
+
+
+class AlertSubscriptions(object):
+    """本进程上客户端的订阅记录，用于取消订阅和统计"""
+
+    def __init__(self):
+        self._rooms_by_sid = {}   # sid -> {room: 引用该房间的订阅数}
+        self._lock = threading.Lock()
+
+    def subscribe(self, sid, data):
+        """登记订阅，返回 (rooms, filters)；展开的房间过多时抛出 ValueError"""
+        filters = normalize_filters(data)
+        rooms = rooms_for_filters(filters)
+        with self._lock:
+            joined = self._rooms_by_sid.setdefault(sid, {})
+            for room in rooms:
+                joined[room] = joined.get(room, 0) + 1
+        return rooms, filters
+
+    def unsubscribe(self, sid, data=None):
+        """取消订阅；data 为空时取消该客户端的全部订阅，返回需要离开的房间列表"""
+        with self._lock:
+            joined = self._rooms_by_sid.get(sid)
+            if not joined:
+                return []
+            if data is None:
+                left = sorted(joined)
+                del self._rooms_by_sid[sid]
+                return left
+            try:
+                rooms = rooms_for_filters(normalize_filters(data))
+            except ValueError:
+                return []
+            left = []
+            for room in rooms:
+                if room not in joined:
+                    continue
+                joined[room] -= 1
+                if joined[room] <= 0:
+                    del joined[room]
+                    left.append(room)
+            if not joined:
+                del self._rooms_by_sid[sid]
+            return left
+
+    def rooms_for(self, sid):
+        with self._lock:
+            return set(self._rooms_by_sid.get(sid, ()))
+
+    def stats(self):
+        with self._lock:
+            rooms = set()
+            for joined in self._rooms_by_sid.values():
+                rooms.update(joined)
+            return {
+                'rooms': len(rooms),
+                'clients': len(self._rooms_by_sid),
+                'subscriptions': sum(len(joined) for joined in self._rooms_by_sid.values())
+            }
+
+
+alert_subscriptions = AlertSubscriptions()
+
+
+def publish_alert(socketio_instance, alert, event='new_alert'):
+    """
+    向与告警匹配的房间推送告警，返回目标房间数。
+    同一客户端在多个匹配房间中时，Socket.IO会对接收者去重。
+    """
+    rooms = rooms_for_alert(alert)
+    socketio_instance.emit(event, alert, to=rooms)
+    return len(rooms)
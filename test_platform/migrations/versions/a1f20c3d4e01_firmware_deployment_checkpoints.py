@@ -0,0 +1,37 @@
+"""固件部署检查点与租约表
+
+entrypoint.sh 把本目录下的迁移复制到运行时的迁移目录后执行 `flask db upgrade heads`。
+这些迁移位于独立的分支上（不依赖各环境自动生成的初始迁移），并且先检查表和索引是否已经存在，
+因此在初始迁移已经按模型建好表的新环境里也可以安全执行。
+
+Revision ID: a1f20c3d4e01
+Revises:
+Create Date: 2026-10-16 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'a1f20c3d4e01'
+down_revision = None
+branch_labels = ('test_platform',)
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if inspector.has_table('firmware_deployment_checkpoints'):
+        return
+    op.create_table(
+        'firmware_deployment_checkpoints',
+        sa.Column('deployment_id', sa.Integer(), nullable=False),
+        sa.Column('bytes_transferred', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('claimed_by', sa.String(length=128), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['deployment_id'], ['firmware_deployments.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('deployment_id')
+    )
+
+
+def downgrade():
+    op.drop_table('firmware_deployment_checkpoints')
@@ -0,0 +1,43 @@
+"""设备列表键集分页：updated_at 回填并设为 NOT NULL，创建组合索引
+
+Revision ID: b7c31e5f9a02
+Revises: a1f20c3d4e01
+Create Date: 2026-10-16 11:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = 'b7c31e5f9a02'
+down_revision = 'a1f20c3d4e01'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_devices_updated_at_id': ['updated_at', 'id'],
+    'ix_devices_status_updated_at_id': ['status', 'updated_at', 'id'],
+    'ix_devices_device_type_updated_at_id': ['device_type', 'updated_at', 'id'],
+    'ix_devices_location_updated_at_id': ['location', 'updated_at', 'id'],
+}
+
+
+def upgrade():
+    # 旧数据中 updated_at 可能为空，用 created_at（仍为空时用当前时间）回填
+    op.execute(
+        "UPDATE devices SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL")
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name']: column for column in inspector.get_columns('devices')}
+    if columns['updated_at']['nullable']:
+        with op.batch_alter_table('devices') as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('devices')}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'devices', columns)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name='devices')
+    with op.batch_alter_table('devices') as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=True)
@@ -5,12 +5,13 @@ from .device import Device
 from .user import User
 from .test_case import TestCase, TestSuite
 from .firmware import Firmware, FirmwareDeployment
+from .firmware_checkpoint import FirmwareDeploymentCheckpoint
 from .test_result import TestResult, TestExecution
 
 __all__ = [
     'Device',
     'User',
     'TestCase', 'TestSuite',
-    'Firmware', 'FirmwareDeployment',
+    'Firmware', 'FirmwareDeployment', 'FirmwareDeploymentCheckpoint',
     'TestResult', 'TestExecution'
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
 # models/device.py
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import load_only
 from database import db
 
 class Device(db.Model):
@@ -8,6 +9,13 @@ class Device(db.Model):
     设备模型，用于设备管理和认证
     """
     __tablename__ = 'devices'
+    # 列表页常用过滤条件 + 键集分页排序键 (updated_at, id) 的组合索引
+    __table_args__ = (
+        db.Index('ix_devices_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_devices_status_updated_at_id', 'status', 'updated_at', 'id'),
+        db.Index('ix_devices_device_type_updated_at_id', 'device_type', 'updated_at', 'id'),
+        db.Index('ix_devices_location_updated_at_id', 'location', 'updated_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     
@@ -41,7 +49,8 @@ class Device(db.Model):
     
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 键集分页的排序键，不能为 NULL
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login_at = db.Column(db.DateTime)
     
     # 创建者
@@ -57,29 +66,100 @@ class Device(db.Model):
             return False
         return check_password_hash(self.password_hash, password)
     
-    def to_dict(self):
-        """转换为字典"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'device_type': self.device_type,
-            'model': self.model,
-            'serial_number': self.serial_number,
-            'description': self.description,
-            'location': self.location,
-            'status': self.status,
-            'ip_address': self.ip_address,
-            'serial_port': self.serial_port,
-            'firmware_version': self.firmware_version,
-            'hardware_version': self.hardware_version,
-            'network_config': self.network_config,
-            'test_config': self.test_config,
-            'fingerprint': self.fingerprint,
-            'registered_ip': self.registered_ip,
-            'last_login_ip': self.last_login_ip,
-            'user_agent': self.user_agent,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'last_login_at': self.last_login_at.isoformat() if self.last_login_at else None,
-            'created_by': self.created_by
-        }
\ No newline at end of file
+    # 可序列化的字段，顺序与 to_dict 的输出一致
+    SERIALIZABLE_FIELDS = (
+        'id', 'name', 'device_type', 'model', 'serial_number', 'description',
+        'location', 'status', 'ip_address', 'serial_port', 'firmware_version',
+        'hardware_version', 'network_config', 'test_config', 'fingerprint',
+        'registered_ip', 'last_login_ip', 'user_agent', 'created_at',
+        'updated_at', 'last_login_at', 'created_by'
+    )
+    # 设备列表视图使用的精简字段，不含JSON配置和user_agent等大字段
+    SUMMARY_FIELDS = (
+        'id', 'name', 'device_type', 'model', 'serial_number', 'location',
+        'status', 'ip_address', 'firmware_version', 'updated_at'
+    )
+    DATETIME_FIELDS = frozenset(('created_at', 'updated_at', 'last_login_at'))
+
+    @classmethod
+    def check_fields(cls, fields):
+        """校验字段名，返回字段元组；fields 为 None 时返回全部字段"""
+        if fields is None:
+            return cls.SERIALIZABLE_FIELDS
+        fields = tuple(fields)
+        unknown = set(fields) - set(cls.SERIALIZABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown device fields: {', '.join(sorted(unknown))}")
+        return fields
+
+    def to_dict(self, fields=None):
+        """
+        转换为字典。
+        fields 指定只输出哪些字段；未加载的列在访问时才会从数据库加载，
+        因此配合 query_fields 使用时应传入相同的字段。
+        """
+        result = {}
+        for name in self.check_fields(fields):
+            value = getattr(self, name)
+            if name in self.DATETIME_FIELDS:
+                value = value.isoformat() if value else None
+            result[name] = value
+        return result
+
+    @classmethod
+    def query_fields(cls, fields=None):
+        """只加载指定列的查询，其余列（尤其是JSON配置）保持延迟加载"""
+        fields = cls.check_fields(fields or cls.SUMMARY_FIELDS)
+        return cls.query.options(load_only(*[getattr(cls, name) for name in fields]))
+
+    @classmethod
+    def bulk_to_dict(cls, *criteria, fields=None, order_by=None, limit=None, offset=None):
+        """
+        大批量设备的快速序列化。
+        直接按列查询，不构造ORM对象，也不经过identity map。
+        """
+        fields = cls.check_fields(fields or cls.SUMMARY_FIELDS)
+        columns = cls.__table__.c
+        stmt = db.select(*[columns[name] for name in fields])
+        if criteria:
+            stmt = stmt.where(*criteria)
+        stmt = stmt.order_by(order_by if order_by is not None else columns.id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        if offset is not None:
+            stmt = stmt.offset(offset)
+
+        return cls._rows_to_dicts(fields, db.session.execute(stmt))
+
+    @classmethod
+    def keyset_page(cls, *criteria, fields=None, cursor=None, limit=50):
+        """
+        按 (updated_at, id) 倒序的键集分页，深翻页不再依赖OFFSET。
+        返回 (devices, next_cursor)，next_cursor 为 None 表示没有下一页；
+        游标无法解析时抛出 core.pagination.CursorError。
+        """
+        from core.pagination import keyset_page
+
+        fields = cls.check_fields(fields or cls.SUMMARY_FIELDS)
+        columns = cls.__table__.c
+        stmt = db.select(*[columns[name] for name in fields])
+        if criteria:
+            stmt = stmt.where(*criteria)
+        rows, next_cursor = keyset_page(db.session, stmt, (columns.updated_at, columns.id),
+                                        cursor=cursor, limit=limit)
+        return cls._rows_to_dicts(fields, rows), next_cursor
+
+    @classmethod
+    def _rows_to_dicts(cls, fields, rows):
+        datetime_positions = [i for i, name in enumerate(fields) if name in cls.DATETIME_FIELDS]
+        if not datetime_positions:
+            return [dict(zip(fields, row)) for row in rows]
+
+        result = []
+        for row in rows:
+            values = list(row)
+            for i in datetime_positions:
+                if values[i] is not None:
+                    values[i] = values[i].isoformat()
+            result.append(dict(zip(fields, values)))
+        return result
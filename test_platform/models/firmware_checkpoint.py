@@ -0,0 +1,22 @@
+# models/firmware_checkpoint.py
+from datetime import datetime
+from database import db
+
+class FirmwareDeploymentCheckpoint(db.Model):
+    """
+    固件部署的续传检查点与执行租约，与 FirmwareDeployment 一对一。
+
+    bytes_transferred 为设备已确认收到的字节数；claimed_by / claimed_until 是执行该部署的
+    worker及其租约到期时间，worker通过条件UPDATE（CAS）领取，租约过期后其他worker才能接手。
+    """
+    __tablename__ = 'firmware_deployment_checkpoints'
+
+    deployment_id = db.Column(db.Integer, db.ForeignKey('firmware_deployments.id', ondelete='CASCADE'),
+                              primary_key=True)
+    bytes_transferred = db.Column(db.BigInteger, nullable=False, default=0)
+    claimed_by = db.Column(db.String(128))
+    claimed_until = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FirmwareDeploymentCheckpoint {self.deployment_id} {self.bytes_transferred}>'
@@ -0,0 +1,369 @@
+"""
+仪表盘汇总计数
+
+仪表盘的汇总数字（按状态的设备数、各套件通过率、按严重程度的未处理告警数）
+不再在每次刷新时对 devices / test_results / alerts 做 GROUP BY，而是维护一组计数器：
+
+- 设备和告警的增删改由ORM会话事件捕获，事务提交后累加到计数器；
+- 测试结果由流式导入每批写入后累加（`services.result_ingest.result_listeners`）；
+- 绕过ORM的批量写入（批量注册、可达性扫描、告警批量确认）显式调用 `apply` 累加增量；
+- 每 `DASHBOARD_RECONCILE_INTERVAL` 秒（默认300）用一次 GROUP BY 校正计数器，
+  多个worker之间用Redis锁保证同一时刻只有一个在校正。
+
+多worker部署必须配置Redis（`DASHBOARD_AGGREGATES_REDIS`，否则使用非localhost的 `REDIS_URL`）：
+计数器保存在一个Redis哈希里，所有gunicorn worker共享同一份数据并随Redis持久化。
+没有Redis时退回进程内字典，只适用于单进程（开发服务器、测试）：各worker只能看到自己的增量，
+校正锁也只在本进程内有效；因此 `WEB_CONCURRENCY`（gunicorn 的默认worker数）大于1而没有
+配置Redis时拒绝启动。读取只取一次哈希，并在本地缓存 `DASHBOARD_CACHE_TTL` 秒（默认1秒）。
+
+计数器键：
+    devices:status:<status>
+    suites:<suite_id>:total / suites:<suite_id>:passed
+    alerts:open:<severity>
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import case, event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from database import db
+from models.device import Device
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'dashboard:aggregates'
+RECONCILE_LOCK_KEY = 'dashboard:aggregates:reconcile'
+# 视为已处理的告警状态
+CLOSED_ALERT_STATUSES = ('acknowledged', 'resolved', 'closed')
+PASSED_STATUSES = ('passed', 'pass', 'success', 'ok')
+# execution_id -> suite_id 映射缓存的容量，超出时淘汰最久未使用的
+SUITE_CACHE_SIZE = 10000
+
+
+class MemoryCounterStore(object):
+    """进程内计数器，只适用于单进程部署"""
+
+    def __init__(self):
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, deltas):
+        with self._lock:
+            self._values.update(deltas)
+
+    def read(self):
+        with self._lock:
+            return dict(self._values)
+
+    def replace(self, parts, values):
+        with self._lock:
+            for key in [k for k in self._values if k.partition(':')[0] in parts]:
+                del self._values[key]
+            self._values.update(values)
+
+    def lock(self, ttl):
+        # 计数器只属于本进程，由本进程自己校正
+        return True
+
+
+class RedisCounterStore(object):
+    """保存在Redis哈希中的计数器，所有worker共享"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def incr(self, deltas):
+        pipe = self.client.pipeline(transaction=False)
+        for key, delta in deltas.items():
+            if delta:
+                pipe.hincrby(REDIS_KEY, key, delta)
+        pipe.execute()
+
+    def read(self):
+        return {k.decode() if isinstance(k, bytes) else k: int(v)
+                for k, v in self.client.hgetall(REDIS_KEY).items()}
+
+    def replace(self, parts, values):
+        stale = [k for k in self.client.hkeys(REDIS_KEY)
+                 if (k.decode() if isinstance(k, bytes) else k).partition(':')[0] in parts]
+        pipe = self.client.pipeline(transaction=True)
+        if stale:
+            pipe.hdel(REDIS_KEY, *stale)
+        if values:
+            pipe.hset(REDIS_KEY, mapping=values)
+        pipe.execute()
+
+    def lock(self, ttl):
+        """在多个worker之间抢占校正任务"""
+        return bool(self.client.set(RECONCILE_LOCK_KEY, '1', nx=True, ex=max(1, int(ttl))))
+
+
+class DashboardAggregates(object):
+    """仪表盘汇总计数"""
+
+    def __init__(self):
+        self.app = None
+        self.store = MemoryCounterStore()
+        self.alert_model = None
+        self.cache_ttl = 1.0
+        self.reconcile_interval = 300
+        self._cache = None
+        self._cached_at = 0.0
+        self._suites = OrderedDict()    # execution_id -> suite_id，LRU，由 _lock 保护
+        self._lock = threading.Lock()
+        self._running = False
+        self.reconciles = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.cache_ttl = app.config.get('DASHBOARD_CACHE_TTL', self.cache_ttl)
+        self.reconcile_interval = app.config.get('DASHBOARD_RECONCILE_INTERVAL', self.reconcile_interval)
+        redis_url = app.config.get('DASHBOARD_AGGREGATES_REDIS')
+        if not redis_url:
+            # 与健康检查一致，忽略默认的 localhost 地址
+            redis_url = app.config.get('REDIS_URL')
+            if redis_url and redis_url.startswith('redis://localhost'):
+                redis_url = None
+        if redis_url:
+            import redis
+            self.store = RedisCounterStore(redis.Redis.from_url(
+                redis_url, socket_connect_timeout=2, socket_timeout=2))
+        else:
+            workers = int(app.config.get('WEB_CONCURRENCY') or os.environ.get('WEB_CONCURRENCY') or 1)
+            if workers > 1:
+                raise RuntimeError(
+                    f'Dashboard aggregates need Redis with {workers} workers: '
+                    'set DASHBOARD_AGGREGATES_REDIS or a non-localhost REDIS_URL')
+            self.store = MemoryCounterStore()
+        from models.alert import Alert
+        self.alert_model = Alert
+
+        from services.result_ingest import result_listeners
+        if self.record_results not in result_listeners:
+            result_listeners.append(self.record_results)
+
+    # 写入
+
+    def apply(self, deltas):
+        """累加一组计数变化 {key: delta}"""
+        deltas = {k: v for k, v in deltas.items() if v}
+        if not deltas:
+            return
+        try:
+            self.store.incr(deltas)
+        except Exception as e:
+            logger.error(f"Failed to update dashboard aggregates: {e}")
+        with self._lock:
+            self._cache = None
+
+    def device_status_changed(self, transitions):
+        """transitions 为 {(旧状态, 新状态): 设备数}，旧状态为 None 表示新增，新状态为 None 表示删除"""
+        deltas = Counter()
+        for (old, new), count in transitions.items():
+            if old is not None:
+                deltas[f'devices:status:{old}'] -= count
+            if new is not None:
+                deltas[f'devices:status:{new}'] += count
+        self.apply(deltas)
+
+    def alerts_closed(self, severities):
+        """绕过ORM批量关闭了一组未处理告警（如批量确认），severities 为每条告警的严重程度"""
+        self.apply({f'alerts:open:{severity}': -count for severity, count in Counter(severities).items()})
+
+    def record_results(self, execution_id, counts):
+        """导入一批测试结果后累加套件的通过数（result_listeners 回调）"""
+        suite_id = self._suite_for(execution_id)
+        self.apply({
+            f'suites:{suite_id}:total': counts.get('total', 0),
+            f'suites:{suite_id}:passed': counts.get('passed', 0)
+        })
+
+    # 读取
+
+    def summary(self):
+        """返回汇总数字，只读取计数器"""
+        with self._lock:
+            if self._cache is not None and time.monotonic() - self._cached_at < self.cache_ttl:
+                return self._cache
+        values = self.store.read()
+
+        devices, suites, alerts = {}, {}, {}
+        for key, value in values.items():
+            kind, _, rest = key.partition(':')
+            if kind == 'devices' and value:
+                devices[rest.partition(':')[2]] = value
+            elif kind == 'suites':
+                suite_id, _, field = rest.rpartition(':')
+                suites.setdefault(suite_id, {'total': 0, 'passed': 0})[field] = value
+            elif kind == 'alerts' and value:
+                alerts[rest.partition(':')[2]] = value
+        for suite in suites.values():
+            suite['pass_rate'] = round(suite['passed'] * 100.0 / suite['total'], 2) if suite['total'] else None
+
+        result = {
+            'devices': {'total': sum(devices.values()), 'by_status': devices},
+            'suites': suites,
+            'alerts': {'open': sum(alerts.values()), 'open_by_severity': alerts}
+        }
+        with self._lock:
+            self._cache = result
+            self._cached_at = time.monotonic()
+        return result
+
+    # 校正
+
+    def reconcile(self, parts=('devices', 'suites', 'alerts')):
+        """用 GROUP BY 重新计算指定部分的计数器并替换这些部分，需在应用上下文中调用"""
+        values = {}
+        if 'devices' in parts:
+            values.update(self._count_devices())
+        if 'suites' in parts:
+            values.update(self._count_suites())
+        if 'alerts' in parts:
+            values.update(self._count_alerts())
+        self.store.replace(parts, values)
+        with self._lock:
+            self._cache = None
+            self.reconciles += 1
+        return values
+
+    def start_reconciler(self, socketio_instance):
+        """定期校正，多个worker中同一时刻只有一个执行"""
+        with self._lock:
+            if self._running or not self.reconcile_interval:
+                return
+            self._running = True
+
+        def run():
+            while True:
+                try:
+                    if self.store.lock(self.reconcile_interval * 0.9):
+                        with self.app.app_context():
+                            self.reconcile()
+                except Exception as e:
+                    logger.error(f"Dashboard aggregate reconcile failed: {e}")
+                socketio_instance.sleep(self.reconcile_interval)
+        socketio_instance.start_background_task(run)
+
+    def _count_devices(self):
+        status = Device.__table__.c.status
+        rows = db.session.execute(select(status, func.count()).group_by(status))
+        return {f'devices:status:{value}': count for value, count in rows}
+
+    def _count_suites(self):
+        from models.test_result import TestResult, TestExecution
+
+        passed = func.sum(case((TestResult.status.in_(PASSED_STATUSES), 1), else_=0))
+        stmt = (select(TestExecution.test_suite_id, func.count(), passed)
+                .select_from(TestResult)
+                .join(TestExecution, TestResult.execution_id == TestExecution.id)
+                .group_by(TestExecution.test_suite_id))
+        values = {}
+        for suite_id, total, passed_count in db.session.execute(stmt):
+            values[f'suites:{suite_id}:total'] = total
+            values[f'suites:{suite_id}:passed'] = int(passed_count or 0)
+        return values
+
+    def _count_alerts(self):
+        alert = self.alert_model
+        stmt = select(alert.severity, func.count()).where(_open_alert_criterion(alert)).group_by(alert.severity)
+        return {f'alerts:open:{severity}': count for severity, count in db.session.execute(stmt)}
+
+    def _suite_for(self, execution_id):
+        with self._lock:
+            suite_id = self._suites.get(execution_id)
+            if suite_id is not None:
+                self._suites.move_to_end(execution_id)
+                return suite_id
+        from models.test_result import TestExecution
+
+        # 查询不持锁，并发的同一查询结果相同
+        suite_id = db.session.execute(
+            select(TestExecution.test_suite_id).where(TestExecution.id == execution_id)).scalar()
+        if suite_id is not None:
+            with self._lock:
+                self._suites[execution_id] = suite_id
+                self._suites.move_to_end(execution_id)
+                while len(self._suites) > SUITE_CACHE_SIZE:
+                    self._suites.popitem(last=False)
+        return suite_id
+
+
+def _open_alert_criterion(alert):
+    """未处理的告警：状态为空或不在已处理状态中（NOT IN 不包含 NULL，需要单独判断）"""
+    return or_(alert.status.is_(None), alert.status.notin_(CLOSED_ALERT_STATUSES))
+
+
+def _alert_open(obj, previous=False):
+    """告警实例（或其提交前的状态）是否未处理，返回 (是否未处理, 严重程度)"""
+    state = inspect(obj)
+    values = {}
+    for name in ('status', 'severity'):
+        history = state.attrs[name].history
+        values[name] = history.deleted[0] if previous and history.deleted else getattr(obj, name)
+    return values['status'] not in CLOSED_ALERT_STATUSES, values['severity']
+
+
+aggregates = DashboardAggregates()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_aggregate_changes(session, flush_context):
+    """flush时记录计数变化，提交后再累加"""
+    deltas = session.info.setdefault('dashboard_aggregates', Counter())
+    alert_model = aggregates.alert_model
+    for obj in session.new:
+        if isinstance(obj, Device):
+            deltas[f'devices:status:{obj.status}'] += 1
+        elif alert_model is not None and isinstance(obj, alert_model):
+            open_, severity = _alert_open(obj)
+            if open_:
+                deltas[f'alerts:open:{severity}'] += 1
+    for obj in session.dirty:
+        if isinstance(obj, Device):
+            history = inspect(obj).attrs.status.history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                deltas[f'devices:status:{history.deleted[0]}'] -= 1
+                deltas[f'devices:status:{history.added[0]}'] += 1
+        elif alert_model is not None and isinstance(obj, alert_model):
+            was_open, old_severity = _alert_open(obj, previous=True)
+            is_open, severity = _alert_open(obj)
+            if was_open:
+                deltas[f'alerts:open:{old_severity}'] -= 1
+            if is_open:
+                deltas[f'alerts:open:{severity}'] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Device):
+            deltas[f'devices:status:{obj.status}'] -= 1
+        elif alert_model is not None and isinstance(obj, alert_model):
+            open_, severity = _alert_open(obj)
+            if open_:
+                deltas[f'alerts:open:{severity}'] -= 1
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_aggregate_changes(session):
+    deltas = session.info.pop('dashboard_aggregates', None)
+    if deltas:
+        aggregates.apply(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_aggregate_changes(session):
+    session.info.pop('dashboard_aggregates', None)
+
+
+def init_dashboard_routes(app):
+    """注册汇总数字端点"""
+    from flask import jsonify
+    from flask_jwt_extended import jwt_required
+
+    @jwt_required()
+    def dashboard_summary():
+        return jsonify(aggregates.summary())
+
+    app.add_url_rule('/api/dashboard/summary', 'dashboard_summary', dashboard_summary)
@@ -0,0 +1,34 @@
+"""
+设备列表的键集分页端点
+
+设备蓝图（api.devices）上的 `GET /api/devices/page` 按 (updated_at, id) 倒序返回设备摘要：
+
+- 查询参数 status / device_type / location 为可选过滤条件，分别命中
+  `ix_devices_<列>_updated_at_id` 组合索引，无过滤时使用 `ix_devices_updated_at_id`；
+- `limit` 为每页条数（默认50，最大500），`cursor` 为上一页响应中的 `next_cursor`；
+- 游标无法解析时返回400。
+"""
+from flask import jsonify, request
+from flask_jwt_extended import jwt_required
+
+from core.pagination import CursorError, page_size
+
+FILTER_FIELDS = ('status', 'device_type', 'location')
+
+
+def device_page():
+    from models.device import Device
+
+    criteria = [getattr(Device, name) == request.args[name]
+                for name in FILTER_FIELDS if request.args.get(name)]
+    try:
+        devices, next_cursor = Device.keyset_page(
+            *criteria, cursor=request.args.get('cursor') or None, limit=page_size(request.args.get('limit')))
+    except CursorError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify({'devices': devices, 'next_cursor': next_cursor})
+
+
+def init_device_list_routes(bp):
+    """在设备蓝图上注册分页端点，须在蓝图注册到应用之前调用"""
+    bp.add_url_rule('/page', 'device_page', jwt_required()(device_page), methods=['GET'])
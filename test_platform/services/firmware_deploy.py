@@ -0,0 +1,548 @@
+"""
+固件批量部署
+
+一次给实验室里成百上千台设备下发固件：
+
+- 固件文件通过 `mmap` 按块读取，每块是映射上的 `memoryview`，直接交给socket发送，
+  不把整个镜像读进内存；
+- 部署在线程池中并发执行，并发数由 `FIRMWARE_MAX_CONCURRENCY` 限制，
+  所有设备共享一个全局带宽上限 `FIRMWARE_BANDWIDTH`（字节/秒，0为不限）；
+- 每台设备已传输的字节数定期（每 `FIRMWARE_CHECKPOINT_BYTES` 字节）写入
+  `FirmwareDeploymentCheckpoint`，状态与进度写入 `FirmwareDeployment`，两者在同一事务中提交；
+  中断后从最后的检查点续传，传输中出错时按 `FIRMWARE_RETRIES` 从检查点重试；
+- 发送时流式计算 SHA-256，结束时与设备返回的校验值比对；`Firmware.checksum` 按长度识别为
+  MD5 / SHA-1 / SHA-256 并同时计算比对，其他格式的校验值使部署直接失败。
+
+多个worker（进程或主机）之间通过检查点行上的租约协调：开始传输前用条件UPDATE领取部署
+（`claimed_by` 为空、租约已过期或本来就是自己），租约为 `FIRMWARE_LEASE_SECONDS` 秒，
+传输过程中随检查点续期；写检查点时若租约已被他人接手则停止传输。
+持有 core.leader 锁的进程每 `FIRMWARE_RESUME_INTERVAL` 秒调用一次 `resume_interrupted`，
+重新调度租约已过期（执行它的进程已退出）的未完成部署。
+
+设备端协议（`HttpTransport`，地址由 `FIRMWARE_AGENT_URL` 模板生成，默认
+``http://{ip_address}:8000/firmware``）::
+
+    POST {url}/begin   {"firmware_id", "version", "size", "sha256", "offset"} -> {"offset": n}
+    PUT  {url}/chunk   Content-Range: bytes a-b/size，请求体为该块数据
+    POST {url}/commit  {"sha256"} -> {"sha256": "..."}
+
+设备在 begin 中返回它实际已有的字节数，续传从检查点和该值中较小者开始。
+其他传输方式（如串口）实现相同的 begin / send / commit / close 接口后赋给 `deployer.transport`。
+"""
+import hashlib
+import http.client
+import json
+import logging
+import mmap
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'in_progress')
+# 十六进制校验值的长度 -> 算法
+CHECKSUM_ALGORITHMS = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+
+
+class DeploymentCancelled(Exception):
+    """部署被取消"""
+
+
+class ChecksumMismatch(Exception):
+    """固件校验值不一致"""
+
+
+class LeaseLost(Exception):
+    """部署的租约已被其他worker接手"""
+
+
+class BandwidthLimiter(object):
+    """所有传输共享的带宽上限，允许约1秒的突发"""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(self._next, now - 1.0) + size / self.rate
+            wait = self._next - now - 1.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class FirmwareImage(object):
+    """只读映射的固件镜像"""
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b'')
+
+    def chunks(self, offset=0):
+        """从 offset 开始按块返回 (offset, memoryview)"""
+        while offset < self.size:
+            end = min(offset + self.chunk_size, self.size)
+            yield offset, self._view[offset:end]
+            offset = end
+
+    def hashers(self, algorithms, offset=0):
+        """返回 {算法: hash对象}，每个都已累计了前 offset 字节（续传时使用）"""
+        digests = {name: hashlib.new(name) for name in algorithms}
+        if offset:
+            for digest in digests.values():
+                digest.update(self._view[:offset])
+        return digests
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # 异常回溯中可能仍引用着某个块，映射随之由GC回收
+                pass
+        self._file.close()
+
+
+class HttpTransport(object):
+    """通过设备上的HTTP代理下发固件，每台设备保持一个长连接"""
+
+    def __init__(self, url_template='http://{ip_address}:8000/firmware', timeout=30):
+        self.url_template = url_template
+        self.timeout = timeout
+
+    def begin(self, device, firmware, image, offset, sha256):
+        url = urlsplit(self.url_template.format(ip_address=device.ip_address, id=device.id))
+        conn_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        session = {'conn': conn_class(url.netloc, timeout=self.timeout), 'path': url.path.rstrip('/'),
+                   'size': image.size}
+        reply = self._json(session, 'POST', '/begin', {
+            'firmware_id': firmware.id,
+            'version': getattr(firmware, 'version', None),
+            'size': image.size,
+            'sha256': sha256,
+            'offset': offset
+        })
+        return session, min(offset, int(reply.get('offset', 0)))
+
+    def send(self, session, offset, chunk):
+        end = offset + len(chunk) - 1
+        conn = session['conn']
+        conn.request('PUT', session['path'] + '/chunk', body=chunk, headers={
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': f"bytes {offset}-{end}/{session['size']}"
+        })
+        response = conn.getresponse()
+        response.read()
+        if response.status >= 300:
+            raise IOError(f'chunk {offset}-{end} rejected: HTTP {response.status}')
+
+    def commit(self, session, sha256):
+        return self._json(session, 'POST', '/commit', {'sha256': sha256}).get('sha256')
+
+    def close(self, session):
+        session['conn'].close()
+
+    def _json(self, session, method, path, payload):
+        conn = session['conn']
+        conn.request(method, session['path'] + path, body=json.dumps(payload),
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        body = response.read()
+        if response.status >= 300:
+            raise IOError(f'{path} failed: HTTP {response.status} {body[:200]!r}')
+        return json.loads(body) if body else {}
+
+
+def expected_checksum(value):
+    """
+    解析 Firmware.checksum，返回 (算法, 小写十六进制)，没有记录校验值时返回 (None, None)。
+    无法识别的格式抛出 ValueError。
+    """
+    if value is None or not str(value).strip():
+        return None, None
+    digest = str(value).strip().lower()
+    algorithm = CHECKSUM_ALGORITHMS.get(len(digest))
+    if algorithm is None or any(c not in '0123456789abcdef' for c in digest):
+        raise ValueError(f'unsupported firmware checksum format: {value!r} '
+                         f'(expected hex MD5, SHA-1 or SHA-256)')
+    return algorithm, digest
+
+
+class FirmwareDeployer(object):
+    """固件部署调度器"""
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.transport = HttpTransport()
+        self.chunk_size = 256 * 1024
+        self.checkpoint_bytes = 4 * 1024 * 1024
+        self.retries = 3
+        self.max_concurrency = 32
+        self.lease_seconds = 120
+        self.resume_interval = 60
+        self.identity = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.limiter = BandwidthLimiter()
+        self._pool = None
+        self._active = {}          # deployment_id -> threading.Event（取消标志），仅本进程
+        self._lock = threading.Lock()
+        self._resuming = False
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0, 'resumed': 0, 'bytes_sent': 0,
+                      'claim_conflicts': 0, 'leases_lost': 0}
+
+    def init_app(self, app, socketio_instance=None):
+        self.app = app
+        self.socketio = socketio_instance
+        self.chunk_size = app.config.get('FIRMWARE_CHUNK_SIZE', self.chunk_size)
+        self.checkpoint_bytes = app.config.get('FIRMWARE_CHECKPOINT_BYTES', self.checkpoint_bytes)
+        self.retries = app.config.get('FIRMWARE_RETRIES', self.retries)
+        self.max_concurrency = app.config.get('FIRMWARE_MAX_CONCURRENCY', self.max_concurrency)
+        self.lease_seconds = app.config.get('FIRMWARE_LEASE_SECONDS', self.lease_seconds)
+        self.resume_interval = app.config.get('FIRMWARE_RESUME_INTERVAL', self.resume_interval)
+        self.limiter.rate = app.config.get('FIRMWARE_BANDWIDTH', 0)
+        self.transport = HttpTransport(
+            app.config.get('FIRMWARE_AGENT_URL', self.transport.url_template),
+            app.config.get('FIRMWARE_AGENT_TIMEOUT', self.transport.timeout))
+
+    def deploy(self, firmware_id, device_ids):
+        """
+        为每台设备创建（或复用未完成的）FirmwareDeployment 并开始传输，
+        返回 {device_id: deployment_id}。需在应用上下文中调用。
+        """
+        from models.firmware import FirmwareDeployment
+        from models.firmware_checkpoint import FirmwareDeploymentCheckpoint
+
+        device_ids = list(dict.fromkeys(device_ids))
+        existing = {
+            d.device_id: d for d in FirmwareDeployment.query.filter(
+                FirmwareDeployment.firmware_id == firmware_id,
+                FirmwareDeployment.device_id.in_(device_ids),
+                FirmwareDeployment.status.in_(ACTIVE_STATUSES)
+            )
+        }
+        created = []
+        for device_id in device_ids:
+            if device_id not in existing:
+                deployment = FirmwareDeployment(firmware_id=firmware_id, device_id=device_id,
+                                                status='pending', progress=0)
+                db.session.add(deployment)
+                existing[device_id] = deployment
+                created.append(deployment)
+        db.session.flush()
+        for deployment in created:
+            db.session.add(FirmwareDeploymentCheckpoint(deployment_id=deployment.id, bytes_transferred=0))
+        db.session.commit()
+
+        plan = {device_id: existing[device_id].id for device_id in device_ids}
+        for deployment_id in plan.values():
+            self.submit(deployment_id)
+        return plan
+
+    def resume_interrupted(self):
+        """
+        重新调度租约为空或已过期的未完成部署，返回调度的数量。
+        由持有 core.leader 锁的进程周期性调用；领取时的条件UPDATE保证即使多个进程同时调用，
+        每个部署也只会被一个worker执行。
+        """
+        from models.firmware import FirmwareDeployment
+        from models.firmware_checkpoint import FirmwareDeploymentCheckpoint as Checkpoint
+
+        with self.app.app_context():
+            stmt = select(FirmwareDeployment.id).outerjoin(
+                Checkpoint, Checkpoint.deployment_id == FirmwareDeployment.id
+            ).where(
+                FirmwareDeployment.status.in_(ACTIVE_STATUSES),
+                or_(Checkpoint.claimed_by.is_(None), Checkpoint.claimed_until.is_(None),
+                    Checkpoint.claimed_until < datetime.utcnow())
+            )
+            ids = list(db.session.execute(stmt).scalars())
+        return sum(1 for deployment_id in ids if self.submit(deployment_id))
+
+    def start_resumer(self, leader):
+        """后台每 resume_interval 秒检查一次，本进程持有 leader 锁时恢复中断的部署"""
+        with self._lock:
+            if self._resuming or not self.resume_interval:
+                return False
+            self._resuming = True
+
+        def run():
+            while True:
+                time.sleep(self.resume_interval)
+                if not leader.is_leader():
+                    continue
+                try:
+                    resumed = self.resume_interrupted()
+                    if resumed:
+                        logger.info(f"Resumed {resumed} interrupted firmware deployments")
+                except Exception as e:
+                    logger.error(f"Failed to resume firmware deployments: {e}")
+
+        threading.Thread(target=run, name='firmware-resume', daemon=True).start()
+        return True
+
+    def submit(self, deployment_id):
+        with self._lock:
+            if deployment_id in self._active:
+                return False
+            self._active[deployment_id] = threading.Event()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix='firmware')
+            pool = self._pool
+        pool.submit(self._run, deployment_id)
+        return True
+
+    def cancel(self, deployment_id):
+        """取消本进程中正在执行的部署"""
+        with self._lock:
+            flag = self._active.get(deployment_id)
+        if flag is not None:
+            flag.set()
+        return flag is not None
+
+    def active(self):
+        with self._lock:
+            return len(self._active)
+
+    def _run(self, deployment_id):
+        try:
+            with self.app.app_context():
+                try:
+                    claimed = self._claim(deployment_id)
+                except Exception as e:
+                    # 未领取成功时部署仍处于未完成状态，由 resume_interrupted 稍后重新调度
+                    db.session.rollback()
+                    logger.error(f"Failed to claim firmware deployment {deployment_id}: {e}")
+                    return
+                if not claimed:
+                    with self._lock:
+                        self.stats['claim_conflicts'] += 1
+                    return
+                try:
+                    self._deploy_one(deployment_id)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            logger.error(f"Firmware deployment {deployment_id} crashed: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(deployment_id, None)
+
+    def _claim(self, deployment_id):
+        """用条件UPDATE领取部署，返回是否领取成功"""
+        from models.firmware_checkpoint import FirmwareDeploymentCheckpoint as Checkpoint
+
+        now = datetime.utcnow()
+        if db.session.execute(select(Checkpoint.deployment_id).where(
+                Checkpoint.deployment_id == deployment_id)).first() is None:
+            # 检查点行由 deploy() 创建；迁移前创建的部署在第一次领取时补上
+            try:
+                db.session.add(Checkpoint(deployment_id=deployment_id, bytes_transferred=0))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+        result = db.session.execute(
+            update(Checkpoint).where(
+                Checkpoint.deployment_id == deployment_id,
+                or_(Checkpoint.claimed_by.is_(None), Checkpoint.claimed_until.is_(None),
+                    Checkpoint.claimed_until < now, Checkpoint.claimed_by == self.identity)
+            ).values(claimed_by=self.identity, claimed_until=now + timedelta(seconds=self.lease_seconds))
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _save(self, deployment_id, offset=None, release=False, **values):
+        """
+        续期租约并在同一事务中写入检查点（offset）和部署状态（values）。
+        租约已不属于本worker时回滚并抛出 LeaseLost。
+        """
+        from models.firmware import FirmwareDeployment
+        from models.firmware_checkpoint import FirmwareDeploymentCheckpoint as Checkpoint
+
+        now = datetime.utcnow()
+        lease = {'updated_at': now}
+        if release:
+            lease.update(claimed_by=None, claimed_until=None)
+        else:
+            lease['claimed_until'] = now + timedelta(seconds=self.lease_seconds)
+        if offset is not None:
+            lease['bytes_transferred'] = offset
+        try:
+            result = db.session.execute(
+                update(Checkpoint).where(Checkpoint.deployment_id == deployment_id,
+                                         Checkpoint.claimed_by == self.identity).values(**lease))
+            if result.rowcount != 1:
+                raise LeaseLost(f'deployment {deployment_id} is no longer claimed by {self.identity}')
+            if values:
+                db.session.execute(update(FirmwareDeployment).where(
+                    FirmwareDeployment.id == deployment_id).values(**values))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _saved_offset(self, deployment_id, size):
+        from models.firmware_checkpoint import FirmwareDeploymentCheckpoint as Checkpoint
+
+        offset = db.session.execute(select(Checkpoint.bytes_transferred).where(
+            Checkpoint.deployment_id == deployment_id)).scalar()
+        return min(int(offset or 0), size)
+
+    def _deploy_one(self, deployment_id):
+        from models.device import Device
+        from models.firmware import Firmware, FirmwareDeployment
+
+        job = {'deployment_id': deployment_id, 'firmware_id': None, 'device_id': None}
+        cancelled = self._active[deployment_id]
+        image = None
+        offset, size = 0, 0
+        try:
+            deployment = db.session.get(FirmwareDeployment, deployment_id)
+            if deployment is None or deployment.status not in ACTIVE_STATUSES:
+                self._save(deployment_id, release=True)
+                return
+            job.update(firmware_id=deployment.firmware_id, device_id=deployment.device_id)
+            firmware = db.session.get(Firmware, deployment.firmware_id)
+            device = db.session.get(Device, deployment.device_id)
+            if firmware is None or device is None:
+                raise LookupError(f'firmware {deployment.firmware_id} or device {deployment.device_id} not found')
+            algorithm, expected = expected_checksum(firmware.checksum)
+
+            image = FirmwareImage(firmware.file_path, self.chunk_size)
+            size = image.size
+            offset = self._saved_offset(deployment_id, size)
+            with self._lock:
+                self.stats['started'] += 1
+                if offset:
+                    self.stats['resumed'] += 1
+            self._save(deployment_id, status='in_progress', error_message=None,
+                       started_at=deployment.started_at or datetime.utcnow())
+
+            attempts = 0
+            while True:
+                try:
+                    offset, sha256 = self._transfer(job, device, firmware, image, offset,
+                                                    algorithm, expected, cancelled)
+                    break
+                except (DeploymentCancelled, ChecksumMismatch, LeaseLost):
+                    raise
+                except Exception as e:
+                    attempts += 1
+                    if attempts > self.retries:
+                        raise
+                    logger.warning(f"Firmware deployment {deployment_id} to device {device.id} failed "
+                                   f"at byte {offset} (attempt {attempts}), resuming: {e}")
+                    db.session.rollback()
+                    offset = self._saved_offset(deployment_id, size)
+                    time.sleep(min(2 ** attempts, 30))
+
+            self._save(deployment_id, offset=size, release=True, status='completed', progress=100,
+                       completed_at=datetime.utcnow(), error_message=None)
+            with self._lock:
+                self.stats['completed'] += 1
+            self._emit(job, 'completed', size, size, sha256=sha256)
+        except LeaseLost as e:
+            # 其他worker已接手（本进程卡住超过租约时长），不再改动部署状态
+            with self._lock:
+                self.stats['leases_lost'] += 1
+            logger.warning(f"Firmware deployment {deployment_id} stopped: {e}")
+        except DeploymentCancelled:
+            self._finish(job, 'cancelled', offset, size, status='cancelled')
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            logger.error(f"Firmware deployment {deployment_id} failed: {e}")
+            self._finish(job, 'failed', offset, size, error=str(e),
+                         status='failed', error_message=str(e)[:500])
+        finally:
+            if image is not None:
+                image.close()
+
+    def _finish(self, job, event, offset, size, error=None, **values):
+        """把部署标记为结束状态、释放租约并推送事件；写库失败时仍然推送"""
+        db.session.rollback()
+        try:
+            self._save(job['deployment_id'], release=True, **values)
+        except LeaseLost as e:
+            logger.warning(f"Firmware deployment {job['deployment_id']} not marked {event}: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Failed to mark firmware deployment {job['deployment_id']} {event}: {e}")
+        extra = {'error': error} if error is not None else {}
+        self._emit(job, event, offset, size, **extra)
+
+    def _transfer(self, job, device, firmware, image, offset, algorithm, expected, cancelled):
+        """从 offset 续传到结束并校验，返回 (offset, sha256)"""
+        deployment_id = job['deployment_id']
+        session, offset = self.transport.begin(device, firmware, image, offset,
+                                               expected if algorithm == 'sha256' else None)
+        try:
+            digests = image.hashers({'sha256', algorithm or 'sha256'}, offset)
+            last_checkpoint = offset
+            last_renewal = time.monotonic()
+            for chunk_offset, chunk in image.chunks(offset):
+                if cancelled.is_set():
+                    raise DeploymentCancelled()
+                self.limiter.consume(len(chunk))
+                self.transport.send(session, chunk_offset, chunk)
+                for digest in digests.values():
+                    digest.update(chunk)
+                offset = chunk_offset + len(chunk)
+                with self._lock:
+                    self.stats['bytes_sent'] += len(chunk)
+                if offset - last_checkpoint >= self.checkpoint_bytes:
+                    self._save(deployment_id, offset=offset, progress=round(offset * 100.0 / image.size, 1))
+                    self._emit(job, 'in_progress', offset, image.size)
+                    last_checkpoint, last_renewal = offset, time.monotonic()
+                elif time.monotonic() - last_renewal > self.lease_seconds / 3.0:
+                    # 限速时检查点间隔可能很长，按时间续期租约
+                    self._save(deployment_id)
+                    last_renewal = time.monotonic()
+
+            sha256 = digests['sha256'].hexdigest()
+            if expected:
+                actual = digests[algorithm].hexdigest()
+                if actual != expected:
+                    raise ChecksumMismatch(f'image {image.path} {algorithm} {actual} != {expected}')
+            reported = self.transport.commit(session, sha256)
+            if reported and reported.lower() != sha256:
+                raise ChecksumMismatch(f'device {device.id} reported sha256 {reported} != {sha256}')
+            return offset, sha256
+        finally:
+            self.transport.close(session)
+
+    def _emit(self, job, status, offset, size, **extra):
+        if self.socketio is None:
+            return
+        payload = dict(job)
+        payload.update({
+            'status': status,
+            'bytes': offset,
+            'size': size,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        payload.update(extra)
+        self.socketio.emit('firmware_deployment', payload)
+
+
+deployer = FirmwareDeployer()
@@ -0,0 +1,247 @@
+"""
+设备网络可达性扫描
+
+按 `Device.ip_address` 周期性探测所有设备，用 asyncio 在一个线程内并发发起TCP连接：
+
+- 并发数由 `REACHABILITY_CONCURRENCY`（默认500）限制；
+- 依次尝试 `REACHABILITY_PORTS`（默认 22, 80，设备 `network_config.probe_ports` 可覆盖），
+  连接成功或被拒绝（收到RST，说明主机在线）即判定可达；
+- 超时按每台主机的往返时间自适应（srtt + 4*rttvar，限制在
+  `REACHABILITY_MIN_TIMEOUT` ~ `REACHABILITY_MAX_TIMEOUT` 之间），从未探测过的主机使用
+  `REACHABILITY_TIMEOUT`；在线主机一次探测失败后用最大超时复核，避免抖动误判；
+- 只有状态发生变化（active <-> inactive）的设备才写回数据库，一次批量UPDATE；
+  处于 maintenance 的设备不探测；
+- 变化经 `host_status_update` 合并广播，每次探测结果（含 rtt_ms）都推入告警规则引擎。
+
+`REACHABILITY_INTERVAL` 大于0时在后台按该间隔（秒）循环扫描，默认关闭。每个worker都会启动该循环，
+但只有持有 core.leader 锁的进程真正扫描，其余进程跳过，避免多个worker重复探测和写库。
+扫描线程需要是真正的操作系统线程，见 services.serial_io 中关于 eventlet 的说明。
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import or_, select, update
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+UP, DOWN = 'active', 'inactive'
+SKIPPED_STATUSES = ('maintenance',)
+
+
+class HostTimer(object):
+    """单台主机的往返时间估计（与TCP重传超时的计算方式相同）"""
+    __slots__ = ('srtt', 'rttvar')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self, initial, low, high):
+        if self.srtt is None:
+            return initial
+        return min(max(self.srtt + 4 * self.rttvar, low), high)
+
+
+async def probe(host, ports, timeout):
+    """探测一台主机，返回往返时间（秒），不可达时返回 None"""
+    for port in ports:
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except ConnectionRefusedError:
+            return time.perf_counter() - started
+        except (asyncio.TimeoutError, OSError):
+            continue
+        rtt = time.perf_counter() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return rtt
+    return None
+
+
+class ReachabilityScanner(object):
+    """设备可达性扫描器"""
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.ports = (22, 80)
+        self.concurrency = 500
+        self.timeout = 1.0
+        self.min_timeout = 0.2
+        self.max_timeout = 3.0
+        self.interval = 0
+        self._timers = {}       # device_id -> HostTimer
+        self._lock = threading.Lock()
+        self._running = False
+        self.leader = None      # core.leader.LeaderLock，为 None 时本进程总是扫描
+        self.stats = {'sweeps': 0, 'hosts': 0, 'up': 0, 'down': 0, 'transitions': 0, 'duration': 0.0,
+                      'skipped_sweeps': 0}
+
+    def init_app(self, app, socketio_instance=None):
+        self.app = app
+        self.socketio = socketio_instance
+        self.ports = tuple(app.config.get('REACHABILITY_PORTS', self.ports))
+        self.concurrency = app.config.get('REACHABILITY_CONCURRENCY', self.concurrency)
+        self.timeout = app.config.get('REACHABILITY_TIMEOUT', self.timeout)
+        self.min_timeout = app.config.get('REACHABILITY_MIN_TIMEOUT', self.min_timeout)
+        self.max_timeout = app.config.get('REACHABILITY_MAX_TIMEOUT', self.max_timeout)
+        self.interval = app.config.get('REACHABILITY_INTERVAL', self.interval)
+
+    def start(self, leader=None):
+        """按 interval 在后台循环扫描；给出 leader 时只在持有该锁期间扫描"""
+        with self._lock:
+            if self._running or not self.interval:
+                return False
+            self._running = True
+            self.leader = leader
+
+        def run():
+            while True:
+                started = time.monotonic()
+                try:
+                    if self.leader is not None and not self.leader.is_leader():
+                        with self._lock:
+                            self.stats['skipped_sweeps'] += 1
+                    else:
+                        self.sweep()
+                except Exception as e:
+                    logger.error(f"Reachability sweep failed: {e}")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+        threading.Thread(target=run, name='reachability', daemon=True).start()
+        return True
+
+    def sweep(self):
+        """扫描一遍所有设备，返回状态发生变化的设备数"""
+        started = time.monotonic()
+        with self.app.app_context():
+            targets = self._load_targets()
+        results = asyncio.run(self._probe_all(targets))
+
+        transitions = []
+        events = []
+        up = 0
+        for target, rtt in zip(targets, results):
+            status = UP if rtt is not None else DOWN
+            up += status == UP
+            event = {
+                'device_id': target['id'],
+                'host_id': target['id'],
+                'hostname': target['name'],
+                'ip_address': target['ip_address'],
+                'device_type': target['device_type'],
+                'location': target['location'],
+                'status': status,
+                'metrics': {'reachable': int(rtt is not None)}
+            }
+            if rtt is not None:
+                event['metrics']['rtt_ms'] = round(rtt * 1000, 2)
+            events.append(event)
+            if status != target['status']:
+                event['previous_status'] = target['status']
+                transitions.append(event)
+
+        if transitions:
+            with self.app.app_context():
+                self._write_transitions(transitions)
+        self._publish(events, transitions)
+
+        with self._lock:
+            self.stats.update({
+                'sweeps': self.stats['sweeps'] + 1,
+                'hosts': len(targets),
+                'up': up,
+                'down': len(targets) - up,
+                'transitions': self.stats['transitions'] + len(transitions),
+                'duration': round(time.monotonic() - started, 3)
+            })
+        return len(transitions)
+
+    def _load_targets(self):
+        from models.device import Device
+
+        columns = Device.__table__.c
+        stmt = select(columns.id, columns.name, columns.ip_address, columns.status,
+                      columns.device_type, columns.location, columns.network_config).where(
+            columns.ip_address.isnot(None),
+            or_(columns.status.is_(None), columns.status.notin_(SKIPPED_STATUSES)))
+        targets = []
+        for row in db.session.execute(stmt):
+            target = dict(row._mapping)
+            config = target.pop('network_config') or {}
+            ports = config.get('probe_ports') if isinstance(config, dict) else None
+            target['ports'] = tuple(ports) if ports else self.ports
+            targets.append(target)
+        return targets
+
+    async def _probe_all(self, targets):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(target):
+            timer = self._timers.setdefault(target['id'], HostTimer())
+            async with semaphore:
+                rtt = await probe(target['ip_address'], target['ports'],
+                                  timer.timeout(self.timeout, self.min_timeout, self.max_timeout))
+                if rtt is None and target['status'] == UP:
+                    # 在线主机首次失败：用最大超时复核一次
+                    rtt = await probe(target['ip_address'], target['ports'], self.max_timeout)
+            if rtt is not None:
+                timer.observe(rtt)
+            return rtt
+
+        return await asyncio.gather(*(check(target) for target in targets))
+
+    def _write_transitions(self, transitions):
+        """批量写回状态变化，并通知绕过ORM事件的缓存"""
+        from models.device import Device
+        from auth.invalidation import invalidation_bus
+        from dashboard.device_sync import device_sync
+        from services.aggregates import aggregates
+
+        try:
+            db.session.execute(update(Device), [
+                {'id': event['device_id'], 'status': event['status']} for event in transitions
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        ids = [event['device_id'] for event in transitions]
+        invalidation_bus.publish(ids)
+        device_sync.notify(ids)
+        aggregates.device_status_changed(Counter(
+            (event['previous_status'], event['status']) for event in transitions))
+
+    def _publish(self, events, transitions):
+        from dashboard.broadcast import host_status_coalescer
+        from services.rule_engine import rule_engine
+
+        for event in events:
+            rule_engine.submit(event)
+        if not transitions or self.socketio is None:
+            return
+        if host_status_coalescer.socketio is None:
+            host_status_coalescer.init_socketio(self.socketio)
+        now = datetime.utcnow().isoformat()
+        for event in transitions:
+            host_status_coalescer.publish(dict(event, timestamp=now))
+
+
+scanner = ReachabilityScanner()
@@ -0,0 +1,157 @@
+"""
+报表流式导出
+
+导出几个月的测试结果时，先把整个结果集读进内存再拼成一个JSON文档会让worker的RSS暴涨。
+`GET /api/reports/export/<source>` 改为流式输出：
+
+- 查询在独立连接上以 `stream_results` + `yield_per` 执行（PostgreSQL 为服务端游标，
+  SQLite/MySQL 由驱动逐批取行），不经过ORM会话和identity map；
+- 行被写入约 `REPORT_EXPORT_CHUNK_BYTES`（默认64KB）的文本块后交给
+  Flask流式响应，内存占用与总行数无关；
+- `format=csv|ndjson`（默认csv）；`gzip=1` 时用 zlib 边压缩边输出 `.gz` 文件；
+- `start` / `end`（ISO时间，作用于 created_at）以及与列同名的查询参数作为等值过滤，
+  结果按主键排序。
+
+source: test_results / test_executions / devices / alerts
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from importlib import import_module
+
+from flask import Response, abort, current_app, request, stream_with_context
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select
+
+from database import db
+
+EXPORT_SOURCES = {
+    'test_results': ('models.test_result', 'TestResult'),
+    'test_executions': ('models.test_result', 'TestExecution'),
+    'devices': ('models.device', 'Device'),
+    'alerts': ('models.alert', 'Alert'),
+}
+# 不允许导出的列
+EXCLUDED_COLUMNS = {'password_hash'}
+RESERVED_PARAMS = {'format', 'gzip', 'start', 'end'}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=_json_default)
+    return value
+
+
+def _parse_time(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f'Invalid {name}: {value}')
+
+
+def build_export_query(table, args):
+    """根据查询参数构造导出查询，返回 (select, columns)"""
+    columns = [c for c in table.c if c.name not in EXCLUDED_COLUMNS]
+    query = select(*columns)
+    if 'created_at' in table.c:
+        if args.get('start'):
+            query = query.where(table.c.created_at >= _parse_time(args['start'], 'start'))
+        if args.get('end'):
+            query = query.where(table.c.created_at < _parse_time(args['end'], 'end'))
+    for name, value in args.items():
+        if name in RESERVED_PARAMS:
+            continue
+        if name not in table.c or name in EXCLUDED_COLUMNS:
+            abort(400, description=f'Unknown filter: {name}')
+        query = query.where(table.c[name] == value)
+    return query.order_by(*table.primary_key.columns), [c.name for c in columns]
+
+
+def iter_rows(query, yield_per=1000):
+    """在独立连接上流式执行查询，逐行产出"""
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=yield_per).execute(query)
+        yield from result
+
+
+def iter_csv(names, rows, chunk_bytes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(names, rows, chunk_bytes):
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(names, row)), ensure_ascii=False, default=_json_default) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    yield ''.join(parts).encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """边读边压缩成gzip格式"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_report(source):
+    if source not in EXPORT_SOURCES:
+        abort(404, description=f'Unknown report source: {source}')
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        abort(400, description=f'Unsupported format: {fmt}')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    module_name, class_name = EXPORT_SOURCES[source]
+    model = getattr(import_module(module_name), class_name)
+    query, names = build_export_query(model.__table__, request.args)
+
+    chunk_bytes = current_app.config.get('REPORT_EXPORT_CHUNK_BYTES', 64 * 1024)
+    rows = iter_rows(query, current_app.config.get('REPORT_EXPORT_YIELD_PER', 1000))
+    encode = iter_csv if fmt == 'csv' else iter_ndjson
+    chunks = encode(names, rows, chunk_bytes)
+
+    filename = f"{source}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def init_export_routes(app):
+    """注册流式导出端点"""
+    app.add_url_rule('/api/reports/export/<source>', 'export_report',
+                     jwt_required()(export_report), methods=['GET'])
@@ -0,0 +1,333 @@
+"""
+测试结果流式导入
+
+一次执行通常产生上千条用例结果，逐条POST既慢又放大事务数。
+测试结果蓝图（api.test_results）上的 `POST /api/test-results/ingest/<execution_id>` 接收整次执行的结果：
+
+- 请求体为 NDJSON（每行一个JSON对象）或 JUnit XML，按 Content-Type 或 `?format=ndjson|junit`
+  选择，支持 `Content-Encoding: gzip`；
+- 边读边解析（逐行读取 / `iterparse`），处理完的XML元素立即释放，不缓存整个请求体；
+- 每满 `INGEST_BATCH_SIZE` 条（默认1000）写入一批：PostgreSQL 上使用 COPY
+  （`INGEST_USE_COPY`，默认开启），其他数据库使用 executemany INSERT；
+- `TestExecution` 的 total_tests / passed_tests / failed_tests / skipped_tests 每批用一条
+  `UPDATE ... SET col = col + n` 累加，而不是每条结果更新一次（error 计入 failed_tests）；
+- 每批单独提交，解析中途出错时已写入的批次保留，响应中给出 `status: partial` 和出错位置；
+  无法解析的行只在响应中列出前 `MAX_REPORTED_ERRORS` 条，其余只计数。
+
+NDJSON字段：name / classname / status(passed, failed, error, skipped) / duration / message / output /
+test_case_id，常见别名（test_name、result、time、error_message、stdout 等）也会被识别。
+有 classname 时 `TestResult.test_name` 保存为 ``classname.name``。
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+from xml.etree.ElementTree import ParseError, iterparse
+
+from flask import current_app, jsonify, request
+from sqlalchemy import insert, update
+
+from database import db
+
+# NDJSON中各规范字段接受的键
+RECORD_ALIASES = {
+    'name': ('name', 'test_name', 'case', 'testcase'),
+    'classname': ('classname', 'class_name', 'suite', 'suite_name'),
+    'status': ('status', 'result', 'outcome'),
+    'duration': ('duration', 'time', 'elapsed', 'execution_time'),
+    'message': ('message', 'error_message', 'error', 'failure'),
+    'output': ('output', 'stdout', 'log'),
+    'test_case_id': ('test_case_id',),
+}
+STATUS_ALIASES = {
+    'pass': 'passed', 'passed': 'passed', 'ok': 'passed', 'success': 'passed',
+    'fail': 'failed', 'failed': 'failed', 'failure': 'failed',
+    'error': 'error', 'errored': 'error', 'broken': 'error',
+    'skip': 'skipped', 'skipped': 'skipped', 'ignored': 'skipped', 'xfail': 'skipped',
+}
+MAX_LINE_BYTES = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+
+# 每批结果写入后的回调 listener(execution_id, counts)，如仪表盘汇总
+result_listeners = []
+
+
+class IngestError(Exception):
+    """请求体无法继续解析"""
+
+
+class ErrorSample(object):
+    """解析错误：只保留前 limit 条，其余只计数"""
+
+    def __init__(self, limit=MAX_REPORTED_ERRORS):
+        self.limit = limit
+        self.items = []
+        self.count = 0
+
+    def append(self, error):
+        self.count += 1
+        if len(self.items) < self.limit:
+            self.items.append(error)
+
+    @property
+    def omitted(self):
+        return self.count - len(self.items)
+
+
+def _normalize_status(value):
+    return STATUS_ALIASES.get(str(value or '').strip().lower(), 'error')
+
+
+def _duration(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ndjson(stream, errors):
+    """逐行解析NDJSON，无法解析的行记录到 errors 后跳过"""
+    line_no = 0
+    while True:
+        line = stream.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        line_no += 1
+        if len(line) > MAX_LINE_BYTES:
+            raise IngestError(f'line {line_no} exceeds {MAX_LINE_BYTES} bytes')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as e:
+            errors.append({'line': line_no, 'error': str(e)})
+            continue
+        record = {}
+        for field, aliases in RECORD_ALIASES.items():
+            record[field] = next((item[k] for k in aliases if item.get(k) is not None), None)
+        record['status'] = _normalize_status(record['status'])
+        record['duration'] = _duration(record['duration'])
+        if isinstance(record['message'], (dict, list)):
+            record['message'] = json.dumps(record['message'], ensure_ascii=False)
+        yield record
+
+
+def parse_junit(stream, errors):
+    """用 iterparse 逐个产出 <testcase>，处理完的元素立即从树中移除"""
+    stack = []
+    suites = []
+    try:
+        for event, elem in iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                if elem.tag == 'testsuite':
+                    suites.append(elem.get('name'))
+                continue
+            stack.pop()
+            if elem.tag == 'testcase':
+                status, message = 'passed', None
+                for child in elem:
+                    if child.tag in ('failure', 'error', 'skipped'):
+                        status = {'failure': 'failed', 'error': 'error', 'skipped': 'skipped'}[child.tag]
+                        message = child.get('message') or (child.text or '').strip() or None
+                        break
+                output = elem.find('system-out')
+                yield {
+                    'name': elem.get('name'),
+                    'classname': elem.get('classname') or (suites[-1] if suites else None),
+                    'status': status,
+                    'duration': _duration(elem.get('time')),
+                    'message': message,
+                    'output': output.text if output is not None else None,
+                    'test_case_id': None,
+                }
+            elif elem.tag == 'testsuite' and suites:
+                suites.pop()
+            else:
+                continue
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+    except ParseError as e:
+        raise IngestError(f'invalid JUnit XML: {e}') from None
+
+
+class ResultIngestor(object):
+    """把规范化的结果记录分批写入 TestResult"""
+
+    def __init__(self, execution_id, batch_size=1000, use_copy=True):
+        from models.test_result import TestResult, TestExecution
+
+        self.result_model = TestResult
+        self.execution_model = TestExecution
+        self.execution_id = execution_id
+        self.batch_size = batch_size
+        self.name_length = TestResult.__table__.c.test_name.type.length
+        # COPY 依赖 psycopg2 的 copy_expert
+        self.use_copy = use_copy and db.engine.dialect.name == 'postgresql' and db.engine.dialect.driver == 'psycopg2'
+        self.inserted = 0
+        self.batches = 0
+        self.listeners = []     # listener(execution_id, counts)，每批写入后调用
+
+    def ingest(self, records):
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+        return self.inserted
+
+    def _rows(self, batch):
+        now = datetime.utcnow()
+        rows = []
+        for record in batch:
+            name = record.get('name')
+            if record.get('classname'):
+                name = f"{record['classname']}.{name}" if name else record['classname']
+            if name is not None:
+                name = str(name)[:self.name_length] if self.name_length else str(name)
+            rows.append({
+                'execution_id': self.execution_id,
+                'test_case_id': record.get('test_case_id'),
+                'test_name': name,
+                'status': record['status'],
+                'duration': record.get('duration'),
+                'error_message': record.get('message'),
+                'output': record.get('output'),
+                'created_at': now,
+            })
+        return rows
+
+    def _write(self, batch):
+        rows = self._rows(batch)
+        counts = {'total': len(batch), 'passed': 0, 'failed': 0, 'error': 0, 'skipped': 0}
+        for record in batch:
+            counts[record['status']] += 1
+
+        execution = self.execution_model
+        increments = {
+            execution.total_tests: counts['total'],
+            execution.passed_tests: counts['passed'],
+            execution.failed_tests: counts['failed'] + counts['error'],
+            execution.skipped_tests: counts['skipped'],
+        }
+        try:
+            if self.use_copy:
+                self._copy(rows)
+            else:
+                db.session.execute(insert(self.result_model), rows)
+            db.session.execute(
+                update(execution).where(execution.id == self.execution_id).values(
+                    {column: db.func.coalesce(column, 0) + n for column, n in increments.items() if n}))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.inserted += len(rows)
+        self.batches += 1
+        for listener in self.listeners:
+            listener(self.execution_id, counts)
+
+    def _copy(self, rows):
+        """PostgreSQL COPY ... FROM STDIN，与ORM会话处于同一事务"""
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[c]) for c in columns])
+        buffer.seek(0)
+        table = self.result_model.__table__.name
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+        finally:
+            cursor.close()
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _detect_format():
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    mimetype = request.mimetype or ''
+    if 'xml' in mimetype:
+        return 'junit'
+    return 'ndjson'
+
+
+def ingest_results(execution_id):
+    """
+    流式导入测试结果。
+    查询参数：format=ndjson|junit（可选，默认按Content-Type判断）
+    """
+    from models.test_result import TestExecution
+
+    if db.session.get(TestExecution, execution_id) is None:
+        return jsonify({'message': f'Test execution {execution_id} not found'}), 404
+    fmt = _detect_format()
+    if fmt not in ('ndjson', 'junit'):
+        return jsonify({'message': f'Unsupported format: {fmt}'}), 400
+
+    stream = request.stream
+    if (request.headers.get('Content-Encoding') or '').lower() == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    errors = ErrorSample()
+    records = parse_ndjson(stream, errors) if fmt == 'ndjson' else parse_junit(stream, errors)
+    ingestor = ResultIngestor(
+        execution_id,
+        batch_size=current_app.config.get('INGEST_BATCH_SIZE', 1000),
+        use_copy=current_app.config.get('INGEST_USE_COPY', True)
+    )
+    ingestor.listeners.extend(result_listeners)
+
+    status, code, failure = 'success', 200, None
+    try:
+        ingestor.ingest(records)
+    except (IngestError, OSError, EOFError) as e:
+        status, code, failure = 'partial', 400, str(e)
+    except Exception as e:
+        current_app.logger.error(f"Error ingesting results for execution {execution_id}: {e}")
+        status, code, failure = 'partial', 500, str(e)
+
+    payload = {
+        'status': status,
+        'execution_id': execution_id,
+        'inserted': ingestor.inserted,
+        'batches': ingestor.batches,
+        'skipped': errors.count,
+        'errors': errors.items,
+        'errors_omitted': errors.omitted
+    }
+    if failure:
+        payload['error'] = failure
+    return jsonify(payload), code
+
+
+def init_ingest_routes(bp):
+    """在测试结果蓝图上注册导入端点（使用设备token认证），须在蓝图注册到应用之前调用"""
+    from auth.services import token_required
+
+    @token_required(identity=True)
+    def ingest(current_device, execution_id):
+        return ingest_results(execution_id)
+
+    bp.add_url_rule('/ingest/<int:execution_id>', 'ingest_results', ingest, methods=['POST'])
@@ -0,0 +1,612 @@
+"""
+增量告警规则引擎
+
+轮询式监控每个周期都要用全部 `AlertRule` 扫描一遍状态。这里改为事件驱动：
+设备/主机状态变更（与 `host_status_update` 同源）推入引擎，规则事先编译并按
+引用的指标和设备属性建立索引，每个事件只评估可能适用的规则。
+
+规则字段（AlertRule 对象或字典均可）：
+    id, name, metric, operator(>, >=, <, <=, ==, !=, in, not_in), threshold,
+    severity, device_id / device_type / location（可选的设备过滤），
+    clear_threshold（可选，回差：恢复时使用的阈值），
+    dedup_seconds（可选，恢复后在该时间内不重复触发），enabled
+
+事件格式::
+
+    {'device_id': 1, 'device_type': 'router', 'location': 'lab1',
+     'metrics': {'cpu': 93.5}, 'status': 'offline'}
+
+`metrics` 之外的顶层标量字段（如 status）也会作为指标参与匹配。
+
+阈值在编译时校验：大小比较的阈值必须能转换为数值（数据库中的 '90' 按 90.0 处理），
+in / not_in 的阈值为列表或逗号分隔的字符串；无效的规则被跳过并记录日志。
+
+== / != 的阈值按指标值的类型比较：数据库中的 '1' 可以匹配指标 1、1.0 或 True。
+
+事件通过 `submit` 放入有界队列，由后台任务评估，不占用状态广播的调用路径；
+单条规则评估出错只记录日志，不影响其他规则。`AlertRule` 提交变更后本进程立即重新加载规则，
+其他worker每 `ALERT_RULES_RELOAD_SECONDS` 秒重新加载一次。
+
+状态事件到达客户端所连接的worker，每个worker都会评估。每个 (规则, 设备) 的告警状态
+（是否告警中、恢复时间、对应的 Alert 行）保存在状态存储中，状态转换用比较并交换完成，
+同一次触发或恢复只有一个worker成功，由它写入 `Alert` 表并推送：
+
+- 配置了Redis（`ALERT_RULES_REDIS`，否则使用非localhost的 `REDIS_URL`）时每个状态是一个Redis键，
+  告警中的状态保留 `ALERT_RULES_STATE_TTL` 秒（默认7天），恢复后的状态只保留去重时间；
+- 否则保存在进程内，最多 `ALERT_RULES_STATE_SIZE` 个（默认100000，超出时淘汰最久未变化的），
+  只适用于单进程；`WEB_CONCURRENCY` 大于1而没有配置Redis时拒绝启动。
+"""
+import logging
+import operator
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'in': lambda value, threshold: value in threshold,
+    'not_in': lambda value, threshold: value not in threshold,
+}
+# 恢复条件：对阈值比较取反时使用的运算符
+CLEAR_OPERATORS = {'>': '<=', '>=': '<', '<': '>=', '<=': '>'}
+SET_OPERATORS = ('in', 'not_in')
+FILTER_FIELDS = ('device_id', 'device_type', 'location')
+DEVICE_KEYS = ('device_id', 'host_id', 'hostname', 'ip_address')
+
+
+def _field(rule, name, default=None):
+    if isinstance(rule, dict):
+        return rule.get(name, default)
+    return getattr(rule, name, default)
+
+
+def _number(value, rule_id, name):
+    """大小比较的阈值必须是数值，数据库中以字符串保存的数值在这里转换"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid {name} {value!r} in rule {rule_id}")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name} {value!r} in rule {rule_id}") from None
+
+
+def _threshold(op, value, rule_id, name='threshold'):
+    """按运算符规范化阈值"""
+    if op in SET_OPERATORS:
+        if isinstance(value, str):
+            value = [v.strip() for v in value.split(',') if v.strip()]
+        try:
+            return frozenset(value or ())
+        except TypeError:
+            raise ValueError(f"Invalid {name} {value!r} in rule {rule_id}") from None
+    if op in CLEAR_OPERATORS:
+        return _number(value, rule_id, name)
+    if value is None:
+        raise ValueError(f"Missing {name} in rule {rule_id}")
+    return value
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return {'true': True, '1': True, 'false': False, '0': False}.get(str(value).strip().lower())
+
+
+def _equality(compare, threshold):
+    """== / != 比较：阈值先转换为指标值的类型，无法转换时按不相等处理"""
+    text = str(threshold).strip()
+    flag = _flag(threshold)
+    number = None
+    if not isinstance(threshold, bool):
+        try:
+            number = float(threshold)
+        except (TypeError, ValueError):
+            pass
+
+    def matches(value):
+        if isinstance(value, bool):
+            expected = flag
+        elif isinstance(value, (int, float)):
+            expected = number
+        else:
+            value, expected = str(value).strip(), text
+        if expected is None:
+            return compare is operator.ne
+        return compare(value, expected)
+    return matches
+
+
+def _coerce(value, threshold):
+    """阈值为数值时把指标值转换为数值"""
+    if isinstance(threshold, (int, float)) and not isinstance(value, (int, float)):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return value
+
+
+class CompiledRule(object):
+    """编译后的规则"""
+    __slots__ = ('id', 'name', 'metric', 'severity', 'filters', 'threshold',
+                 'fire', 'clear', 'dedup_seconds')
+
+    def __init__(self, rule):
+        self.id = _field(rule, 'id')
+        self.name = _field(rule, 'name') or f'rule-{self.id}'
+        self.metric = _field(rule, 'metric')
+        self.severity = _field(rule, 'severity', 'warning')
+        self.dedup_seconds = _number(_field(rule, 'dedup_seconds') or 0, self.id, 'dedup_seconds')
+        self.filters = {}
+        for field in FILTER_FIELDS:
+            value = _field(rule, field)
+            if value is not None:
+                self.filters[field] = str(value)
+
+        op = _field(rule, 'operator', '>')
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported operator {op!r} in rule {self.id}")
+        threshold = _threshold(op, _field(rule, 'threshold'), self.id)
+        self.threshold = threshold
+        if op in ('==', '!='):
+            self.fire = _equality(OPERATORS[op], threshold)
+        else:
+            compare = OPERATORS[op]
+            self.fire = lambda value: compare(value, threshold)
+        fire = self.fire
+
+        # 回差：指定 clear_threshold 时，越过该阈值才算恢复
+        clear_threshold = _field(rule, 'clear_threshold')
+        if clear_threshold is not None and op in CLEAR_OPERATORS:
+            clear_threshold = _number(clear_threshold, self.id, 'clear_threshold')
+            clear = OPERATORS[CLEAR_OPERATORS[op]]
+            self.clear = lambda value: clear(value, clear_threshold)
+        else:
+            self.clear = lambda value: not fire(value)
+
+    def matches_device(self, event):
+        for field, expected in self.filters.items():
+            if str(event.get(field)) != expected:
+                return False
+        return True
+
+
+class MemoryStateStore(object):
+    """进程内的告警状态，最多保留 max_size 个，只适用于单进程部署"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._states = OrderedDict()    # (rule_id, device_key) -> (firing, resolved_at, alert_id)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._states.get(key)
+
+    def swap(self, key, expected, state, ttl=None):
+        """当前状态等于 expected 时替换为 state（None 表示删除），返回是否成功"""
+        with self._lock:
+            if self._states.get(key) != expected:
+                return False
+            if state is None:
+                self._states.pop(key, None)
+                return True
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+            return True
+
+    def retain(self, rule_ids):
+        with self._lock:
+            for key in [k for k in self._states if k[0] not in rule_ids]:
+                del self._states[key]
+
+    def firing(self):
+        with self._lock:
+            return sum(1 for state in self._states.values() if state[0])
+
+    def __len__(self):
+        return len(self._states)
+
+
+class RedisStateStore(object):
+    """保存在Redis中的告警状态，所有worker共享；状态靠过期时间回收"""
+
+    PREFIX = 'alert_rules:state:'
+    # 当前值等于 ARGV[1] 时写入 ARGV[2]（空串表示删除），ARGV[3] 为过期秒数
+    SWAP_SCRIPT = """
+local current = redis.call('GET', KEYS[1]) or ''
+if current ~= ARGV[1] then return 0 end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+    def __init__(self, client, ttl=7 * 86400):
+        self.client = client
+        self.ttl = ttl
+        self._swap = client.register_script(self.SWAP_SCRIPT)
+
+    def _key(self, key):
+        return f'{self.PREFIX}{key[0]}:{key[1]}'
+
+    @staticmethod
+    def _encode(state):
+        if state is None:
+            return ''
+        firing, resolved_at, alert_id = state
+        return f"{int(firing)}:{resolved_at!r}:{'' if alert_id is None else alert_id}"
+
+    @staticmethod
+    def _decode(raw):
+        if not raw:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        firing, resolved_at, alert_id = raw.split(':')
+        return firing == '1', float(resolved_at), int(alert_id) if alert_id else None
+
+    def get(self, key):
+        return self._decode(self.client.get(self._key(key)))
+
+    def swap(self, key, expected, state, ttl=None):
+        ttl = max(1, int(ttl or self.ttl))
+        return bool(self._swap(keys=[self._key(key)],
+                               args=[self._encode(expected), self._encode(state), ttl]))
+
+    def retain(self, rule_ids):
+        pass        # 已删除规则的状态随过期时间回收
+
+    def firing(self):
+        return None
+
+    def __len__(self):
+        return 0
+
+
+class RuleEngine(object):
+    """按指标和设备属性索引的规则引擎"""
+
+    def __init__(self):
+        # sink(kind, alert)，kind 为 'fired' 或 'resolved'；触发时返回写入的 Alert id
+        self.sink = None
+        self._rules = {}
+        self._index = {}        # metric -> {(field, value) | None: [CompiledRule]}
+        self.state = MemoryStateStore()
+        self._lock = threading.Lock()
+        self.app = None
+        self._queue = None
+        self._reload_requested = threading.Event()
+        self.reload_interval = 60
+        self.events = 0
+        self.evaluations = 0
+        self.fired = 0
+        self.resolved = 0
+        self.suppressed = 0
+        self.invalid_rules = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def load_rules(self, rules):
+        """编译并索引规则，替换现有规则集；已停用和无效的规则被跳过"""
+        compiled = {}
+        index = {}
+        invalid = 0
+        for rule in rules:
+            if _field(rule, 'enabled', True) is False or not _field(rule, 'metric'):
+                continue
+            try:
+                c = CompiledRule(rule)
+            except ValueError as e:
+                invalid += 1
+                logger.error(f"Skipping invalid alert rule: {e}")
+                continue
+            compiled[c.id] = c
+            # 按最具选择性的过滤条件建索引，没有过滤条件的规则放在通配桶
+            key = None
+            for field in FILTER_FIELDS:
+                if field in c.filters:
+                    key = (field, c.filters[field])
+                    break
+            index.setdefault(c.metric, {}).setdefault(key, []).append(c)
+        with self._lock:
+            self._rules = compiled
+            self._index = index
+            self.invalid_rules = invalid
+        self.state.retain(set(compiled))
+        return len(compiled)
+
+    def init_app(self, app):
+        """选择状态存储：多worker部署必须使用Redis"""
+        self.app = app
+        redis_url = app.config.get('ALERT_RULES_REDIS')
+        if not redis_url:
+            redis_url = app.config.get('REDIS_URL')
+            if redis_url and redis_url.startswith('redis://localhost'):
+                redis_url = None
+        if redis_url:
+            import redis
+            self.state = RedisStateStore(
+                redis.Redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=2),
+                ttl=app.config.get('ALERT_RULES_STATE_TTL', 7 * 86400))
+            return
+        workers = int(app.config.get('WEB_CONCURRENCY') or os.environ.get('WEB_CONCURRENCY') or 1)
+        if workers > 1:
+            raise RuntimeError(
+                f'Alert rule state needs Redis with {workers} workers: '
+                'set ALERT_RULES_REDIS or a non-localhost REDIS_URL')
+        self.state = MemoryStateStore(app.config.get('ALERT_RULES_STATE_SIZE', 100000))
+
+    def start(self, app, socketio_instance=None):
+        """启动后台评估任务；未启动时 submit 在调用线程中评估"""
+        self.app = app
+        self.reload_interval = app.config.get('ALERT_RULES_RELOAD_SECONDS', self.reload_interval)
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = queue.Queue(maxsize=app.config.get('ALERT_RULES_QUEUE_SIZE', 10000))
+        if socketio_instance is not None:
+            socketio_instance.start_background_task(self._run)
+        else:
+            threading.Thread(target=self._run, name='rule-engine', daemon=True).start()
+
+    def submit(self, event):
+        """提交一个状态事件，队列满时丢弃并计数"""
+        if self._queue is None:
+            self._process_safely(event)
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def request_reload(self):
+        """AlertRule 变更后请求重新加载规则"""
+        self._reload_requested.set()
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(None)   # 唤醒后台任务
+            except queue.Full:
+                pass
+
+    def reload(self):
+        """从数据库重新加载规则"""
+        from models.alert import AlertRule
+
+        self._reload_requested.clear()
+        with self.app.app_context():
+            count = self.load_rules(AlertRule.query.all())
+        return count
+
+    def _run(self):
+        next_reload = time.monotonic() + self.reload_interval
+        while True:
+            try:
+                event = self._queue.get(timeout=max(next_reload - time.monotonic(), 0.01))
+            except queue.Empty:
+                event = None
+            if self._reload_requested.is_set() or time.monotonic() >= next_reload:
+                next_reload = time.monotonic() + self.reload_interval
+                try:
+                    self.reload()
+                except Exception as e:
+                    logger.error(f"Failed to reload alert rules: {e}")
+            if event is not None:
+                self._process_safely(event)
+
+    def _process_safely(self, event):
+        try:
+            self.process(event)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.exception(f"Alert rule evaluation failed: {e}")
+
+    def process(self, event, now=None):
+        """处理一个状态事件，返回本次触发/恢复的告警列表"""
+        now = time.time() if now is None else now
+        device_key = next((event.get(k) for k in DEVICE_KEYS if event.get(k) is not None), None)
+        values = {k: v for k, v in event.items()
+                  if k not in FILTER_FIELDS and isinstance(v, (int, float, str, bool))}
+        values.update(event.get('metrics') or {})
+
+        results = []
+        with self._lock:
+            self.events += 1
+            for metric, value in values.items():
+                buckets = self._index.get(metric)
+                if not buckets:
+                    continue
+                for rule in self._candidates(buckets, event):
+                    if not rule.matches_device(event):
+                        continue
+                    self.evaluations += 1
+                    try:
+                        result = self._evaluate(rule, device_key, _coerce(value, rule.threshold), event, now)
+                    except Exception as e:
+                        # 单条规则出错不影响其他规则
+                        self.errors += 1
+                        logger.error(f"Error evaluating alert rule {rule.id} on {metric}={value!r}: {e}")
+                        continue
+                    if result is not None:
+                        results.append(result)
+
+        if self.sink is not None:
+            for kind, alert in results:
+                try:
+                    alert_id = self.sink(kind, alert)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    logger.error(f"Error publishing alert from rule {alert['rule_id']}: {e}")
+                    continue
+                if kind == 'fired' and alert_id is not None:
+                    # 记下 Alert 行，恢复时由同一条状态找到它
+                    key = (alert['rule_id'], alert['device'])
+                    self.state.swap(key, (True, 0.0, None), (True, 0.0, alert_id))
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rules': len(self._rules),
+                'metrics': len(self._index),
+                'events': self.events,
+                'evaluations': self.evaluations,
+                'fired': self.fired,
+                'resolved': self.resolved,
+                'suppressed': self.suppressed,
+                'invalid_rules': self.invalid_rules,
+                'errors': self.errors,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'firing': self.state.firing()
+            }
+
+    def _candidates(self, buckets, event):
+        rules = list(buckets.get(None, ()))
+        for field in FILTER_FIELDS:
+            value = event.get(field)
+            if value is not None:
+                rules.extend(buckets.get((field, str(value)), ()))
+        return rules
+
+    def _evaluate(self, rule, device_key, value, event, now):
+        if value is None:
+            return None
+        key = (rule.id, device_key)
+        state = self.state.get(key)
+        firing = state is not None and state[0]
+
+        if not firing and rule.fire(value):
+            if state is not None and now - state[1] < rule.dedup_seconds:
+                self.suppressed += 1
+                return None
+            if not self.state.swap(key, state, (True, 0.0, None)):
+                return None     # 其他worker已处理这次触发
+            self.fired += 1
+            return 'fired', self._alert(rule, device_key, value, event, now)
+
+        if firing and rule.clear(value):
+            # 没有去重时间时恢复后不需要保留状态
+            resolved = (False, now, None) if rule.dedup_seconds else None
+            if not self.state.swap(key, state, resolved, ttl=rule.dedup_seconds):
+                return None
+            self.resolved += 1
+            return 'resolved', dict(self._alert(rule, device_key, value, event, now), alert_id=state[2])
+        return None
+
+    def _alert(self, rule, device_key, value, event, now):
+        alert = {
+            'rule_id': rule.id,
+            'rule_name': rule.name,
+            'metric': rule.metric,
+            'value': value,
+            'severity': rule.severity,
+            'device': device_key,
+            'timestamp': now
+        }
+        for field in FILTER_FIELDS:
+            if event.get(field) is not None:
+                alert[field] = event[field]
+        return alert
+
+
+rule_engine = RuleEngine()
+
+
+def _mark_rules_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['alert_rules_changed'] = True
+
+
+def _reload_after_commit(session):
+    if session.info.pop('alert_rules_changed', False):
+        rule_engine.request_reload()
+
+
+def _discard_after_rollback(session):
+    session.info.pop('alert_rules_changed', None)
+
+
+def _device_id(alert):
+    try:
+        return int(alert.get('device_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def save_alert(kind, alert):
+    """
+    把触发的告警写入 `Alert` 表并返回其 id；恢复时把仍未处理的告警标记为 resolved。
+    需要在应用上下文中调用。
+    """
+    from database import db
+    from models.alert import Alert
+    from services.aggregates import CLOSED_ALERT_STATUSES
+
+    if kind == 'fired':
+        row = Alert(device_id=_device_id(alert), severity=alert['severity'], status='active',
+                    message=f"{alert['rule_name']}: {alert['metric']}={alert['value']!r} "
+                            f"on {alert['device']}")
+        db.session.add(row)
+        db.session.commit()
+        return row.id
+    if alert.get('alert_id') is None:
+        return None
+    row = db.session.get(Alert, alert['alert_id'])
+    if row is not None and row.status not in CLOSED_ALERT_STATUSES:
+        row.status = 'resolved'
+        db.session.commit()
+    return row.id if row is not None else None
+
+
+def init_rule_engine(app, socketio_instance):
+    """
+    启动后台评估任务（由它加载 AlertRule）。触发的告警写入 `Alert` 表（告警确认与
+    仪表盘计数都基于它），再推送给订阅了匹配过滤条件的客户端。
+    加载失败（如数据库尚未迁移）只记录日志，后台任务会定期重试。
+    """
+    from models.alert import AlertRule
+    from dashboard.subscriptions import publish_alert
+
+    def sink(kind, alert):
+        with app.app_context():
+            alert_id = save_alert(kind, alert)
+        if alert_id is not None:
+            alert['alert_id'] = alert_id
+        event = 'new_alert' if kind == 'fired' else 'alert_resolved'
+        publish_alert(socketio_instance, alert, event=event)
+        return alert_id
+    rule_engine.init_app(app)
+    rule_engine.sink = sink
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        if not sa_event.contains(AlertRule, name, _mark_rules_changed):
+            sa_event.listen(AlertRule, name, _mark_rules_changed)
+    if not sa_event.contains(Session, 'after_commit', _reload_after_commit):
+        sa_event.listen(Session, 'after_commit', _reload_after_commit)
+        sa_event.listen(Session, 'after_rollback', _discard_after_rollback)
+
+    # 规则由后台任务在启动后加载，不在 create_app 中查询数据库
+    rule_engine.start(app, socketio_instance)
+    rule_engine.request_reload()
+    return rule_engine
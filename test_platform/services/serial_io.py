@@ -0,0 +1,469 @@
+"""
+串口设备I/O引擎
+
+`Device.serial_port` 指向被测板卡的串口。这里用一个 asyncio 事件循环
+（运行在独立线程中）在单进程内复用所有串口：
+
+- POSIX 下直接把串口fd注册到事件循环（`add_reader` / `add_writer`），
+  没有“每个串口一个线程”；没有fd的平台退回定时轮询 `in_waiting`；
+- 读取时用 `os.readv` 直接写入预分配的 `bytearray`，按分隔符切行只在
+  `memoryview` 上移动偏移，只在交出一整行时复制一次；写入不完时保存
+  `memoryview` 切片，等fd可写后继续；
+- `expect` / `request` 等待匹配的行，支持超时；
+- 每个串口统计收发字节数、吞吐量、行数、超时次数以及请求-响应延迟。
+
+配置项：
+    SERIAL_BAUDRATE         默认波特率（115200）
+    SERIAL_LINE_DELIMITER   行分隔符（默认 "\\n"，行尾的 "\\r" 会被去掉）
+    SERIAL_BUFFER_SIZE      每个串口的接收缓冲区字节数（65536），
+                            缓冲区写满仍没有分隔符时按一行截断输出
+    SERIAL_EXPECT_TIMEOUT   expect / request 的默认超时秒数（5）
+    SERIAL_POLL_INTERVAL    无fd时的轮询间隔秒数（0.01）
+
+Flask代码中使用同步接口::
+
+    serial_manager.open('/dev/ttyUSB0')
+    line = serial_manager.request('/dev/ttyUSB0', 'version', expect=re.compile(rb'^fw (\\S+)'))
+
+事件循环线程需要是真正的操作系统线程；在 eventlet 下运行时应在 monkey_patch 时
+排除 thread，或由独立进程承载本引擎。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1024
+
+
+class ExpectTimeout(TimeoutError):
+    """在超时时间内没有收到匹配的行"""
+
+
+class LineFramer(object):
+    """基于预分配缓冲区的按行切分"""
+
+    def __init__(self, size=65536, delimiter=b'\n'):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.delimiter = delimiter
+        self.start = 0      # 未消费数据的起点
+        self.end = 0        # 已写入数据的终点
+        self.scanned = 0    # 已确认不含分隔符的位置，避免重复扫描
+        self.overflows = 0
+
+    def space(self):
+        """返回可写入的内存视图，缓冲区尾部写满时把未消费的数据移到开头"""
+        if self.end == len(self.buffer) and self.start:
+            remaining = self.end - self.start
+            self.view[:remaining] = self.view[self.start:self.end]
+            self.scanned -= self.start
+            self.start, self.end = 0, remaining
+        return self.view[self.end:]
+
+    def readinto(self, reader):
+        """调用 reader(memoryview) 把数据直接读进缓冲区，返回读取的字节数"""
+        n = reader(self.space())
+        if n:
+            self.end += n
+        return n
+
+    def feed(self, data):
+        """写入已有的数据（轮询路径），返回切出的完整行"""
+        data = memoryview(data)
+        lines = []
+        while len(data):
+            space = self.space()
+            n = min(len(data), len(space))
+            space[:n] = data[:n]
+            self.end += n
+            data = data[n:]
+            lines.extend(self.lines())
+        return lines
+
+    def lines(self):
+        """切出缓冲区中所有完整的行"""
+        lines = []
+        buffer = self.buffer
+        delimiter = self.delimiter
+        while True:
+            index = buffer.find(delimiter, max(self.start, self.scanned), self.end)
+            if index < 0:
+                break
+            end = index
+            if delimiter == b'\n' and end > self.start and buffer[end - 1] == 13:
+                end -= 1
+            lines.append(bytes(self.view[self.start:end]))
+            self.start = self.scanned = index + len(delimiter)
+        self.scanned = max(self.start, self.end - len(delimiter) + 1)
+
+        if self.start == self.end:
+            self.start = self.end = self.scanned = 0
+        elif self.start == 0 and self.end == len(buffer):
+            # 整个缓冲区都没有分隔符，截断输出，避免卡死
+            lines.append(bytes(self.view[:self.end]))
+            self.start = self.end = self.scanned = 0
+            self.overflows += 1
+        return lines
+
+
+def _matcher(pattern, encoding):
+    """把 expect 的模式编译成 line -> 结果或None 的函数"""
+    if callable(pattern):
+        return lambda line: line if pattern(line) else None
+    if hasattr(pattern, 'search'):
+        if isinstance(pattern.pattern, str):
+            return lambda line: pattern.search(line.decode(encoding, 'replace'))
+        return pattern.search
+    if isinstance(pattern, str):
+        pattern = pattern.encode(encoding)
+    return lambda line: line if pattern in line else None
+
+
+class SerialChannel(object):
+    """一个串口的读写、行分发和统计，方法只能在事件循环线程中调用"""
+
+    def __init__(self, manager, port, serial_port, buffer_size, delimiter):
+        self.manager = manager
+        self.port = port
+        self.serial = serial_port
+        self.loop = manager.loop
+        self.delimiter = delimiter
+        self.encoding = 'utf-8'
+        self.framer = LineFramer(buffer_size, delimiter)
+        self.listeners = []
+        self._expects = []      # [matcher, future]
+        self._out = deque()     # 待写的 memoryview
+        self._poller = None
+        self.closed = False
+        self.opened_at = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lines = 0
+        self.requests = 0
+        self.timeouts = 0
+        self.latency = deque(maxlen=LATENCY_SAMPLES)
+
+        try:
+            self.fd = serial_port.fileno()
+        except (AttributeError, OSError, NotImplementedError):
+            self.fd = None
+        if self.fd is not None:
+            os.set_blocking(self.fd, False)
+            self.loop.add_reader(self.fd, self._on_readable)
+        else:
+            self._poller = self.loop.call_soon(self._poll)
+
+    # 读取
+
+    def _readinto(self, view):
+        return os.readv(self.fd, [view])
+
+    def _on_readable(self):
+        try:
+            n = self.framer.readinto(self._readinto)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.close(e)
+            return
+        if not n:
+            # 对端关闭（如pty主端退出）
+            self.close(EOFError(f'{self.port} closed'))
+            return
+        self.bytes_in += n
+        self._dispatch(self.framer.lines())
+
+    def _poll(self):
+        try:
+            waiting = self.serial.in_waiting
+            if waiting:
+                data = self.serial.read(waiting)
+                self.bytes_in += len(data)
+                self._dispatch(self.framer.feed(data))
+        except Exception as e:
+            self.close(e)
+            return
+        self._poller = self.loop.call_later(self.manager.poll_interval, self._poll)
+
+    def _dispatch(self, lines):
+        for line in lines:
+            self.lines += 1
+            for expect in self._expects:
+                matcher, future = expect
+                if future.done():
+                    continue
+                result = matcher(line)
+                if result is not None:
+                    future.set_result(result)
+                    self._expects.remove(expect)
+                    break
+            for listener in self.listeners:
+                try:
+                    listener(self.port, line)
+                except Exception as e:
+                    logger.error(f"Serial listener for {self.port} failed: {e}")
+
+    # 写入
+
+    def write(self, data):
+        """非阻塞写入，写不完的部分在fd可写时继续"""
+        if self.closed:
+            raise ConnectionError(f'{self.port} is closed')
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        view = memoryview(data)
+        if self.fd is None:
+            self.bytes_out += self.serial.write(view) or 0
+            return
+        if self._out:
+            self._out.append(view)
+            return
+        written = self._write_some(view)
+        if written < len(view):
+            self._out.append(view[written:])
+            self.loop.add_writer(self.fd, self._on_writable)
+
+    def write_line(self, data):
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        self.write(data + self.delimiter)
+
+    def _write_some(self, view):
+        try:
+            written = os.write(self.fd, view)
+        except BlockingIOError:
+            return 0
+        self.bytes_out += written
+        return written
+
+    def _on_writable(self):
+        try:
+            while self._out:
+                view = self._out[0]
+                written = self._write_some(view)
+                if written < len(view):
+                    self._out[0] = view[written:]
+                    return
+                self._out.popleft()
+        except OSError as e:
+            self.close(e)
+            return
+        self.loop.remove_writer(self.fd)
+
+    # expect / request
+
+    async def expect(self, pattern, timeout=None):
+        """
+        等待下一条匹配的行。
+        pattern 可以是 bytes/str 子串、已编译的正则或 line -> bool 的函数；
+        正则返回 match 对象，其他返回整行 bytes。
+        """
+        future = self._add_expect(pattern)
+        return await self._wait(future, pattern, timeout)
+
+    async def request(self, command, expect, timeout=None):
+        """发送一行命令并等待匹配的响应，记录往返延迟"""
+        # 先登记等待再写入，避免响应早于登记到达
+        future = self._add_expect(expect)
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            self.write_line(command)
+        except Exception:
+            self._drop_expect(future)
+            raise
+        result = await self._wait(future, expect, timeout)
+        self.latency.append(time.perf_counter() - started)
+        return result
+
+    def _add_expect(self, pattern):
+        if self.closed:
+            raise ConnectionError(f'{self.port} is closed')
+        future = self.loop.create_future()
+        self._expects.append([_matcher(pattern, self.encoding), future])
+        return future
+
+    def _drop_expect(self, future):
+        self._expects = [e for e in self._expects if e[1] is not future]
+
+    async def _wait(self, future, pattern, timeout):
+        timeout = self.manager.expect_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ExpectTimeout(f'{self.port}: no line matching {pattern!r} within {timeout}s') from None
+        finally:
+            self._drop_expect(future)
+
+    # 关闭与统计
+
+    def close(self, error=None):
+        if self.closed:
+            return
+        self.closed = True
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            if self._out:
+                self.loop.remove_writer(self.fd)
+        if self._poller is not None:
+            self._poller.cancel()
+        for _, future in self._expects:
+            if not future.done():
+                future.set_exception(ConnectionError(f'{self.port} closed: {error}' if error else f'{self.port} closed'))
+        self._expects = []
+        self._out.clear()
+        try:
+            self.serial.close()
+        except Exception:
+            pass
+        if error is not None:
+            logger.warning(f"Serial port {self.port} closed: {error}")
+        self.manager._forget(self)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.opened_at, 1e-9)
+        latency = sorted(self.latency)
+        result = {
+            'port': self.port,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'in_bytes_per_sec': round(self.bytes_in / elapsed, 1),
+            'out_bytes_per_sec': round(self.bytes_out / elapsed, 1),
+            'lines': self.lines,
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'overflows': self.framer.overflows,
+            'pending_writes': sum(len(v) for v in self._out)
+        }
+        if latency:
+            result['latency_ms'] = {
+                'p50': round(latency[len(latency) // 2] * 1000, 3),
+                'p95': round(latency[min(len(latency) - 1, int(len(latency) * 0.95))] * 1000, 3),
+                'max': round(latency[-1] * 1000, 3)
+            }
+        return result
+
+
+class SerialIOManager(object):
+    """在一个事件循环中复用所有串口"""
+
+    def __init__(self):
+        self.baudrate = 115200
+        self.delimiter = b'\n'
+        self.buffer_size = 65536
+        self.expect_timeout = 5.0
+        self.poll_interval = 0.01
+        self.loop = None
+        self._thread = None
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.baudrate = app.config.get('SERIAL_BAUDRATE', self.baudrate)
+        delimiter = app.config.get('SERIAL_LINE_DELIMITER', self.delimiter)
+        self.delimiter = delimiter.encode() if isinstance(delimiter, str) else delimiter
+        self.buffer_size = app.config.get('SERIAL_BUFFER_SIZE', self.buffer_size)
+        self.expect_timeout = app.config.get('SERIAL_EXPECT_TIMEOUT', self.expect_timeout)
+        self.poll_interval = app.config.get('SERIAL_POLL_INTERVAL', self.poll_interval)
+
+    def start(self):
+        """按需启动事件循环线程"""
+        with self._lock:
+            if self.loop is not None:
+                return self.loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='serial-io', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self.loop = loop
+            return loop
+
+    def run(self, coro, timeout=None):
+        """在事件循环中执行协程并同步等待结果（供非事件循环线程调用）"""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def call(self, func, *args):
+        """在事件循环中调用普通函数并同步等待结果"""
+        async def wrapper():
+            return func(*args)
+        return self.run(wrapper())
+
+    # 事件循环内的接口
+
+    async def open_async(self, port, baudrate=None, **kwargs):
+        """打开串口（已打开时直接返回），kwargs 原样传给 pyserial"""
+        channel = self._channels.get(port)
+        if channel is not None:
+            return channel
+        import serial
+        serial_port = serial.serial_for_url(
+            port, baudrate=baudrate or self.baudrate, timeout=0, **kwargs)
+        channel = SerialChannel(self, port, serial_port, self.buffer_size, self.delimiter)
+        self._channels[port] = channel
+        return channel
+
+    def channel(self, port):
+        channel = self._channels.get(port)
+        if channel is None:
+            raise KeyError(f'Serial port {port} is not open')
+        return channel
+
+    def _forget(self, channel):
+        if self._channels.get(channel.port) is channel:
+            del self._channels[channel.port]
+
+    # 同步接口
+
+    def open(self, port, baudrate=None, **kwargs):
+        self.run(self.open_async(port, baudrate, **kwargs))
+        return port
+
+    def close(self, port):
+        channel = self._channels.get(port)
+        if channel is not None:
+            self.call(channel.close)
+
+    def close_all(self):
+        for port in list(self._channels):
+            self.close(port)
+
+    def write_line(self, port, data):
+        self.call(lambda: self.channel(port).write_line(data))
+
+    def expect(self, port, pattern, timeout=None):
+        timeout = self.expect_timeout if timeout is None else timeout
+        return self.run(self._on_channel(port, 'expect', pattern, timeout))
+
+    def request(self, port, command, expect, timeout=None):
+        timeout = self.expect_timeout if timeout is None else timeout
+        return self.run(self._on_channel(port, 'request', command, expect, timeout))
+
+    def add_listener(self, port, listener):
+        """注册逐行回调 listener(port, line)，回调在事件循环线程中执行，不能阻塞"""
+        self.call(lambda: self.channel(port).listeners.append(listener))
+
+    async def _on_channel(self, port, method, *args):
+        return await getattr(self.channel(port), method)(*args)
+
+    def stats(self):
+        if self.loop is None:
+            return {'ports': 0, 'channels': []}
+        channels = self.call(lambda: [c.stats() for c in self._channels.values()])
+        return {'ports': len(channels), 'channels': channels}
+
+
+serial_manager = SerialIOManager()
@@ -0,0 +1,464 @@
+"""
+设备遥测时序存储
+
+`Device` 只有静态列，采集到的样本（CPU、温度、串口吞吐等）需要单独存放：
+
+- 内存中每个 (设备, 指标) 一组 `array` 环形缓冲区保存原始样本；
+- 写入时增量维护 1s / 1m / 1h 三级汇总（min / max / avg / count），
+  仪表盘查询长时间范围时直接读汇总，不扫描原始点；
+- 后台定期把新完成的汇总追加写入 `TELEMETRY_DIR` 下的块文件，每个块内按列存放，
+  内存中放不下的历史数据从这些文件读取。
+
+约束：
+
+- 只接受已注册的指标（`TELEMETRY_METRICS`）和已存在设备的整数id，
+  序列总数不超过 `TELEMETRY_MAX_SERIES`；缓冲区随数据增长按需分配；
+- 每个序列内的样本必须按时间递增，早于最后一个样本的点被拒绝；样本时间由客户端提供，
+  超前服务器时间 `TELEMETRY_MAX_CLOCK_SKEW` 秒（默认60）以上的样本直接拒绝，
+  否则一个时钟错误的样本会让该序列之后的所有样本都被当作乱序丢弃；
+- 存储在每个worker进程中各自维护，同一文件可能被多个worker写入：写块时持有文件排他锁，
+  每个块一次写入，与文件中最后一个桶起始时间相同的桶合并进去，更早的桶被丢弃，
+  因此文件中的块始终按时间排列。其他worker尚未落盘的数据在下次 flush 后可见。
+"""
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:   # Windows开发环境下不加锁
+    fcntl = None
+
+# 汇总粒度（秒）及内存中保留的桶数
+ROLLUPS = {
+    '1s': (1, 3600),
+    '1m': (60, 1440),
+    '1h': (3600, 24 * 30),
+}
+# 块文件：头部为 (记录数, 第一个桶起始时间, 最后一个桶起始时间)，
+# 随后依次为 start/min/max/avg/count 五列，尾部再写一次记录数，便于从文件末尾找到最后一个块
+BLOCK_HEADER = struct.Struct('<Idd')
+BLOCK_FOOTER = struct.Struct('<I')
+ROLLUP_COLUMNS = ('start', 'min', 'max', 'avg', 'count')
+DEFAULT_METRICS = ('cpu', 'memory', 'disk', 'temperature',
+                   'network_rx', 'network_tx', 'serial_rx', 'serial_tx')
+
+logger = logging.getLogger(__name__)
+
+
+class RingArray(object):
+    """有容量上限的 double 环形数组，按写入顺序读取；未写满前按需增长"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = array('d')
+        self.size = 0
+        self.head = 0   # 写满后下一个写入位置
+
+    def append(self, value):
+        if self.size < self.capacity:
+            self.data.append(value)
+            self.size += 1
+            return
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+
+    def values(self):
+        if self.size < self.capacity or not self.head:
+            return self.data[:]
+        return self.data[self.head:] + self.data[:self.head]
+
+
+class RollupSeries(object):
+    """一种粒度的增量汇总"""
+
+    def __init__(self, step, capacity, persist=False):
+        self.step = step
+        self.persist = persist
+        self.columns = {name: RingArray(capacity) for name in ROLLUP_COLUMNS}
+        self.current = None   # [start, min, max, sum, count]
+        self.unflushed = []   # 已完成但尚未写入文件的桶（仅在需要落盘时记录）
+
+    def add(self, ts, value):
+        start = ts - ts % self.step
+        current = self.current
+        if current is not None and current[0] == start:
+            if value < current[1]:
+                current[1] = value
+            if value > current[2]:
+                current[2] = value
+            current[3] += value
+            current[4] += 1
+            return
+        if current is not None:
+            self._close(current)
+        self.current = [start, value, value, value, 1]
+
+    def _close(self, bucket):
+        start, low, high, total, count = bucket
+        row = (start, low, high, total / count, count)
+        for name, value in zip(ROLLUP_COLUMNS, row):
+            self.columns[name].append(value)
+        if self.persist:
+            self.unflushed.append(row)
+
+    def rows(self, start, end, include_current=True):
+        cols = [self.columns[name].values() for name in ROLLUP_COLUMNS]
+        rows = [row for row in zip(*cols) if start <= row[0] < end]
+        if include_current and self.current is not None and start <= self.current[0] < end:
+            s, low, high, total, count = self.current
+            rows.append((s, low, high, total / count, count))
+        return rows
+
+
+class TelemetrySeries(object):
+    """单个 (设备, 指标) 的原始样本和各级汇总"""
+
+    def __init__(self, raw_capacity, persist=False):
+        self.timestamps = RingArray(raw_capacity)
+        self.values = RingArray(raw_capacity)
+        self.rollups = {name: RollupSeries(step, capacity, persist)
+                        for name, (step, capacity) in ROLLUPS.items()}
+        self.last_ts = None
+        self.lock = threading.Lock()
+
+    def add(self, ts, value):
+        """写入一个样本，早于最后一个样本时拒绝并返回 False"""
+        with self.lock:
+            if self.last_ts is not None and ts < self.last_ts:
+                return False
+            self.last_ts = ts
+            self.timestamps.append(ts)
+            self.values.append(value)
+            for rollup in self.rollups.values():
+                rollup.add(ts, value)
+            return True
+
+    def raw(self, start, end):
+        with self.lock:
+            return [(t, v) for t, v in zip(self.timestamps.values(), self.values.values())
+                    if start <= t < end]
+
+    @property
+    def oldest_raw(self):
+        with self.lock:
+            return self.timestamps.values()[0] if self.timestamps.size else None
+
+
+class TelemetryStore(object):
+    """设备遥测存储"""
+
+    def __init__(self, raw_capacity=3600, directory=None, metrics=DEFAULT_METRICS, max_series=10000,
+                 max_clock_skew=60):
+        self.raw_capacity = raw_capacity
+        self.max_clock_skew = max_clock_skew
+        self.directory = directory
+        self.metrics = frozenset(metrics)
+        self.max_series = max_series
+        self.device_exists = None   # device_exists(device_id)，为 None 时不检查设备是否存在
+        self._known_devices = set()
+        self._series = {}
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.merged_rows = 0
+        self.dropped_rows = 0
+
+    def init_app(self, app):
+        self.raw_capacity = app.config.get('TELEMETRY_RAW_POINTS', self.raw_capacity)
+        self.directory = app.config.get('TELEMETRY_DIR', self.directory)
+        self.metrics = frozenset(app.config.get('TELEMETRY_METRICS', self.metrics))
+        self.max_series = app.config.get('TELEMETRY_MAX_SERIES', self.max_series)
+        self.max_clock_skew = app.config.get('TELEMETRY_MAX_CLOCK_SKEW', self.max_clock_skew)
+        self.device_exists = _device_exists
+        if self.directory:
+            self.directory = os.path.realpath(self.directory)
+            os.makedirs(self.directory, exist_ok=True)
+
+    def record(self, device_id, metric, value, ts=None):
+        """
+        写入一个样本；设备、指标、数值或时间无效（包括超前服务器时间）时抛出 ValueError，
+        乱序样本被拒绝并返回 False
+        """
+        device_id = self._check_device(device_id)
+        self._check_metric(metric)
+        ts = self._check_timestamp(ts)
+        accepted = self._get(device_id, metric).add(ts, float(value))
+        with self._lock:
+            if accepted:
+                self.samples += 1
+            else:
+                self.rejected += 1
+        return accepted
+
+    def record_many(self, device_id, samples, ts=None):
+        """写入同一时刻的多个指标，samples 为 {metric: value}；先全部校验再写入，返回接受的样本数"""
+        device_id = self._check_device(device_id)
+        if not isinstance(samples, dict):
+            raise ValueError('metrics must be an object')
+        ts = self._check_timestamp(ts)
+        values = {}
+        for metric, value in samples.items():
+            self._check_metric(metric)
+            values[metric] = float(value)
+        return sum(1 for metric, value in values.items() if self.record(device_id, metric, value, ts))
+
+    def query(self, device_id, metric, start, end=None, resolution=None):
+        """
+        查询时间范围内的数据。
+        resolution 为 raw / 1s / 1m / 1h，不指定时按范围自动选择：
+        原始点仍在内存中时返回原始点，否则使用能覆盖范围的最细汇总。
+        返回 {'resolution': ..., 'points': [...]}，汇总点为 (start, min, max, avg, count)。
+        """
+        end = time.time() if end is None else end
+        device_id = _device_key(device_id)
+        self._check_metric(metric)
+        if resolution not in (None, 'raw') and resolution not in ROLLUPS:
+            raise ValueError(f'Unknown resolution {resolution!r}')
+        series = self._series.get((device_id, metric))
+        if resolution is None:
+            resolution = self._pick_resolution(series, start, end)
+        if resolution == 'raw':
+            return {'resolution': 'raw', 'points': series.raw(start, end) if series is not None else []}
+
+        points = []
+        if series is not None:
+            with series.lock:
+                points = series.rollups[resolution].rows(start, end)
+        # 内存中最早的桶之前的数据从块文件读取
+        oldest = points[0][0] if points else end
+        if self.directory and start < oldest:
+            points = self._read_blocks(device_id, metric, resolution, start, oldest) + points
+        return {'resolution': resolution, 'points': points}
+
+    def flush(self):
+        """把已完成的汇总桶追加写入块文件，返回写入的行数"""
+        if not self.directory:
+            return 0
+        with self._lock:
+            items = list(self._series.items())
+        written = 0
+        for (device_id, metric), series in items:
+            for name, rollup in series.rollups.items():
+                with series.lock:
+                    rows, rollup.unflushed = rollup.unflushed, []
+                if rows:
+                    self._append_block(device_id, metric, name, rows)
+                    written += len(rows)
+        self.flushed_rows += written
+        return written
+
+    def stats(self):
+        with self._lock:
+            return {'series': len(self._series), 'samples': self.samples, 'rejected': self.rejected,
+                    'flushed_rows': self.flushed_rows, 'merged_rows': self.merged_rows,
+                    'dropped_rows': self.dropped_rows}
+
+    def start_flusher(self, socketio_instance, interval=60):
+        """在后台定期 flush"""
+        def run():
+            while True:
+                socketio_instance.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Telemetry flush failed: {e}")
+        socketio_instance.start_background_task(run)
+
+    def _check_device(self, device_id):
+        device_id = _device_key(device_id)
+        if device_id in self._known_devices or self.device_exists is None:
+            return device_id
+        if not self.device_exists(device_id):
+            raise ValueError(f'Unknown device {device_id}')
+        with self._lock:
+            self._known_devices.add(device_id)
+        return device_id
+
+    def _check_timestamp(self, ts):
+        """样本时间：未指定时为当前时间；非有限数或超前服务器时间过多时拒绝"""
+        now = time.time()
+        if ts is None:
+            return now
+        ts = float(ts)
+        if not math.isfinite(ts):
+            raise ValueError(f'Invalid timestamp {ts!r}')
+        if ts > now + self.max_clock_skew:
+            with self._lock:
+                self.rejected += 1
+            raise ValueError(f'Timestamp {ts} is more than {self.max_clock_skew}s ahead of server time')
+        return ts
+
+    def _check_metric(self, metric):
+        if metric not in self.metrics:
+            raise ValueError(f'Unknown metric {metric!r}')
+
+    def _get(self, device_id, metric):
+        key = (device_id, metric)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    if len(self._series) >= self.max_series:
+                        raise ValueError(f'Telemetry series limit ({self.max_series}) reached')
+                    series = self._series[key] = TelemetrySeries(self.raw_capacity, bool(self.directory))
+        return series
+
+    def _pick_resolution(self, series, start, end):
+        oldest = series.oldest_raw if series is not None else None
+        if oldest is not None and start >= oldest:
+            return 'raw'
+        span = end - start
+        if span <= 3600:
+            return '1s'
+        if span <= 86400:
+            return '1m'
+        return '1h'
+
+    def _path(self, device_id, metric, resolution):
+        """块文件路径；设备id必须是整数，解析后的路径必须位于存储目录下"""
+        device_id = _device_key(device_id)
+        self._check_metric(metric)
+        path = os.path.realpath(os.path.join(self.directory, str(device_id), f'{metric}.{resolution}.blk'))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            raise ValueError(f'Invalid telemetry path for device {device_id}, metric {metric!r}')
+        return path
+
+    def _append_block(self, device_id, metric, resolution, rows):
+        """
+        在文件排他锁下追加一个块（一次写入）。
+        与文件中最后一个桶起始时间相同的桶合并进该桶，更早的桶丢弃。
+        """
+        path = self._path(device_id, metric, resolution)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 需要原地改写最后一行，不能使用追加模式打开
+        with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+            _lock_file(f, exclusive=True)
+            try:
+                last = _last_row(f)
+                if last is not None:
+                    block, last_row = last
+                    kept = []
+                    for row in rows:
+                        if row[0] > last_row[0]:
+                            kept.append(row)
+                        elif row[0] == last_row[0]:
+                            last_row = _merge_rows(last_row, row)
+                            _rewrite_row(f, block, last_row)
+                            self.merged_rows += 1
+                        else:
+                            self.dropped_rows += 1
+                    rows = kept
+                if rows:
+                    f.seek(0, os.SEEK_END)
+                    f.write(_encode_block(rows))
+                    f.flush()
+            finally:
+                _lock_file(f, unlock=True)
+
+    def _read_blocks(self, device_id, metric, resolution, start, end):
+        path = self._path(device_id, metric, resolution)
+        if not os.path.exists(path):
+            return []
+        points = []
+        column_size = array('d').itemsize
+        with open(path, 'rb') as f:
+            _lock_file(f, exclusive=False)
+            try:
+                while True:
+                    header = f.read(BLOCK_HEADER.size)
+                    if len(header) < BLOCK_HEADER.size:
+                        break
+                    count, first, last = BLOCK_HEADER.unpack(header)
+                    body = count * column_size * len(ROLLUP_COLUMNS)
+                    # 块按时间顺序排列（写入时保证），可按头部整块跳过
+                    if last < start:
+                        f.seek(body + BLOCK_FOOTER.size, os.SEEK_CUR)
+                        continue
+                    if first >= end:
+                        break
+                    columns = []
+                    for _ in ROLLUP_COLUMNS:
+                        column = array('d')
+                        column.fromfile(f, count)
+                        columns.append(column)
+                    f.seek(BLOCK_FOOTER.size, os.SEEK_CUR)
+                    points.extend(row for row in zip(*columns) if start <= row[0] < end)
+            finally:
+                _lock_file(f, unlock=True)
+        return points
+
+
+def _device_key(device_id):
+    """设备id只接受整数（或十进制数字字符串）"""
+    if isinstance(device_id, bool):
+        raise ValueError('device_id must be an integer')
+    if isinstance(device_id, int):
+        return device_id
+    if isinstance(device_id, str) and device_id.isdigit():
+        return int(device_id)
+    raise ValueError('device_id must be an integer')
+
+
+def _device_exists(device_id):
+    from database import db
+    from models.device import Device
+    return db.session.get(Device, device_id) is not None
+
+
+def _lock_file(f, exclusive=True, unlock=False):
+    if fcntl is None:
+        return
+    if unlock:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def _encode_block(rows):
+    columns = list(zip(*rows))
+    return b''.join([BLOCK_HEADER.pack(len(rows), rows[0][0], rows[-1][0])]
+                    + [array('d', column).tobytes() for column in columns]
+                    + [BLOCK_FOOTER.pack(len(rows))])
+
+
+def _last_row(f):
+    """返回文件中最后一个桶 (块起始偏移, 行)，空文件返回 None"""
+    end = f.seek(0, os.SEEK_END)
+    if end < BLOCK_HEADER.size + BLOCK_FOOTER.size:
+        return None
+    f.seek(end - BLOCK_FOOTER.size)
+    (count,) = BLOCK_FOOTER.unpack(f.read(BLOCK_FOOTER.size))
+    column_size = array('d').itemsize
+    offset = end - BLOCK_FOOTER.size - count * column_size * len(ROLLUP_COLUMNS) - BLOCK_HEADER.size
+    if count == 0 or offset < 0:
+        raise ValueError(f'Corrupt telemetry block file {f.name}')
+    row = []
+    for index in range(len(ROLLUP_COLUMNS)):
+        f.seek(offset + BLOCK_HEADER.size + (index * count + count - 1) * column_size)
+        row.append(array('d', f.read(column_size))[0])
+    return (offset, count), tuple(row)
+
+
+def _rewrite_row(f, block, row):
+    """原地改写块中的最后一行"""
+    offset, count = block
+    column_size = array('d').itemsize
+    for index, value in enumerate(row):
+        f.seek(offset + BLOCK_HEADER.size + (index * count + count - 1) * column_size)
+        f.write(array('d', [value]).tobytes())
+
+
+def _merge_rows(a, b):
+    """合并两个起始时间相同的汇总桶 (start, min, max, avg, count)"""
+    count = a[4] + b[4]
+    return (a[0], min(a[1], b[1]), max(a[2], b[2]), (a[3] * a[4] + b[3] * b[4]) / count, count)
+
+
+telemetry_store = TelemetryStore()
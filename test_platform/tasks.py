@@ -1,21 +1,316 @@
-from flask import current_app
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 
-# from some_task_queue_library import task
+# 任务可能运行在没有应用上下文的工作进程中，因此使用模块级logger
+logger = logging.getLogger(__name__)
 
-# @task
-def run_test_suite(test_config):
+# 命令结束后等待输出读取线程的最长时间；脱离进程组的后台进程可能一直占着管道
+READER_JOIN_TIMEOUT = 5
+
+
+def _pump_output(stream, chunks, log_sink, execution_id):
+    """逐行读取子进程输出，保存下来并实时转发给日志流"""
+    for line in stream:
+        chunks.append(line)
+        if log_sink is not None:
+            log_sink(execution_id, line.rstrip('\n'))
+    stream.close()
+
+
+def _run_command(command, timeout, test_config, log_sink, execution_id):
+    """
+    执行单条命令，返回 (returncode, stdout, stderr)；超时时杀掉进程并抛出 TimeoutExpired。
+    命令在独立的会话（进程组）中运行，超时时连同 shell 派生的子进程一起杀掉，
+    否则子进程会继续占着输出管道。
     """
-    一个示例性的后台任务，用于运行测试。
-    这个函数会被一个任务队列（如Celery）调用，而不是直接被Flask应用调用。
+    proc = subprocess.Popen(
+        command,
+        shell=isinstance(command, str),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        cwd=test_config.get('cwd'),
+        env=test_config.get('env'),
+        start_new_session=True
+    )
+    stdout, stderr = [], []
+    readers = [threading.Thread(target=_pump_output, args=(proc.stdout, stdout, log_sink, execution_id),
+                                daemon=True),
+               threading.Thread(target=_pump_output, args=(proc.stderr, stderr, log_sink, execution_id),
+                                daemon=True)]
+    for reader in readers:
+        reader.start()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join(READER_JOIN_TIMEOUT)
+            if reader.is_alive():
+                logger.warning(f"Output of command {command!r} is still open after it exited, "
+                               f"a background process may be holding it")
+    return proc.returncode, ''.join(stdout), ''.join(stderr)
+
+
+def run_test_suite(test_config, log_sink=None):
+    """
+    执行一个测试套件。
+    这个函数既可以由本地执行器（TestSuiteExecutor）调度，也可以被任务队列（如Celery）
+    包装后调用，它本身不依赖Flask应用上下文，可以在子进程中运行。
 
     :param test_config: 包含所有测试所需参数的字典
+        - commands: 依次执行的命令列表（也可以用 command 指定单条命令）
+        - timeout: 整个套件的超时时间（秒），超时抛出 subprocess.TimeoutExpired
+        - cwd / env: 命令的工作目录和环境变量
+        - stop_on_failure: 某条命令失败后是否停止，默认 True
+        - execution_id: 测试执行ID，与 log_sink 一起使用
+    :param log_sink: 可选的 log_sink(execution_id, *lines)，命令输出按行实时写入
     """
-    current_app.logger.info(f"Received task to run test with config: {test_config}")
-    # 1. 设置测试环境
-    # 2. 调用测试脚本/命令
-    # 3. 收集结果
-    # 4. 通过WebSocket实时回传日志 (from .ws import stream_log_to_client)
-    # 5. 更新数据库中的任务状态 (from .app import db)
-    # 6. 测试完成后，通过WebSocket广播节点状态变更 (from .ws import broadcast_node_status)
-    current_app.logger.info("Task finished.")
-    return {"status": "success", "result": "...some result data..."}
\ No newline at end of file
+    logger.info(f"Received task to run test with config: {test_config}")
+    commands = test_config.get('commands')
+    if commands is None:
+        commands = [test_config['command']] if test_config.get('command') else []
+    execution_id = test_config.get('execution_id')
+    if execution_id is None:
+        log_sink = None
+
+    timeout = test_config.get('timeout')
+    deadline = time.monotonic() + timeout if timeout else None
+    started = time.monotonic()
+    status = 'success'
+    results = []
+
+    for command in commands:
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(command, timeout)
+        if log_sink is not None:
+            log_sink(execution_id, f'$ {command}')
+        command_started = time.monotonic()
+        returncode, stdout, stderr = _run_command(command, remaining, test_config, log_sink, execution_id)
+        results.append({
+            'command': command,
+            'returncode': returncode,
+            'stdout': stdout,
+            'stderr': stderr,
+            'duration': time.monotonic() - command_started
+        })
+        if returncode != 0:
+            status = 'failed'
+            if test_config.get('stop_on_failure', True):
+                break
+
+    logger.info("Task finished.")
+    return {"status": status, "results": results, "duration": time.monotonic() - started}
+
+
+class _QueueSink(object):
+    """进程池中的日志出口：把日志行放进跨进程队列，由主进程转发给日志流"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, execution_id, *lines):
+        self.queue.put((execution_id, lines))
+
+
+class _SuiteJob(object):
+    __slots__ = ('test_config', 'device_id', 'retries', 'attempts', 'future')
+
+    def __init__(self, test_config, device_id, retries):
+        self.test_config = test_config
+        self.device_id = device_id
+        self.retries = retries
+        self.attempts = 0
+        self.future = Future()
+
+
+class TestSuiteExecutor(object):
+    """
+    测试套件执行器
+
+    - backend: eager（在调用线程中同步执行，无需broker，便于调试）、
+      thread（线程池）或 process（进程池）；
+    - 同一设备同一时刻只运行一个套件，其余套件在该设备的队列中等待，
+      不会占用工作线程；
+    - 执行抛出异常（包括超时）时按 retries 重试；
+    - test_config 带 execution_id 时，命令输出实时写入日志流（log_streamer），
+      执行开始时打开该执行的日志，最终完成或失败后关闭。
+    """
+
+    BACKENDS = ('eager', 'thread', 'process')
+
+    def __init__(self, backend='thread', max_workers=4):
+        self.backend = backend
+        self.max_workers = max_workers
+        self._pool = None
+        self._busy = set()       # 正在执行套件的设备
+        self._waiting = {}       # device_id -> deque(_SuiteJob)
+        self._lock = threading.Lock()
+        self.log_streamer = None
+        self._log_manager = None  # 进程池时用于转发日志的 multiprocessing.Manager
+        self._log_queue = None
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'retried': 0}
+
+    def init_app(self, app, log_streamer=None):
+        backend = app.config.get('TASK_EXECUTOR_BACKEND', self.backend)
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown task executor backend: {backend}")
+        self.shutdown()
+        self.backend = backend
+        self.max_workers = app.config.get('TASK_EXECUTOR_WORKERS', self.max_workers)
+        self.log_streamer = log_streamer
+
+    def submit(self, test_config, device_id=None, retries=0):
+        """提交一个测试套件，返回 concurrent.futures.Future"""
+        job = _SuiteJob(test_config, device_id, retries)
+        if self.log_streamer is not None and test_config.get('execution_id') is not None:
+            self.log_streamer.open(test_config['execution_id'])
+        with self._lock:
+            self.stats['submitted'] += 1
+            if device_id is not None:
+                if device_id in self._busy:
+                    self._waiting.setdefault(device_id, deque()).append(job)
+                    return job.future
+                self._busy.add(device_id)
+        self._dispatch(job)
+        return job.future
+
+    def queued(self, device_id=None):
+        """返回等待中的套件数"""
+        with self._lock:
+            if device_id is not None:
+                return len(self._waiting.get(device_id, ()))
+            return sum(len(q) for q in self._waiting.values())
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+        if self._log_manager is not None:
+            self._log_manager.shutdown()
+            self._log_manager = self._log_queue = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.backend == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='test-suite')
+        return self._pool
+
+    def _log_sink(self):
+        """返回传给 run_test_suite 的日志出口"""
+        if self.log_streamer is None:
+            return None
+        if self.backend != 'process':
+            return self.log_streamer.write
+        with self._lock:
+            if self._log_queue is None:
+                self._log_manager = multiprocessing.Manager()
+                self._log_queue = self._log_manager.Queue()
+                threading.Thread(target=self._forward_logs, args=(self._log_queue,),
+                                 name='test-suite-logs', daemon=True).start()
+            return _QueueSink(self._log_queue)
+
+    def _forward_logs(self, queue):
+        """把子进程放进队列的日志行转发给日志流；lines 为 None 表示该执行结束"""
+        while True:
+            try:
+                execution_id, lines = queue.get()
+            except (EOFError, OSError):
+                return
+            if lines is None:
+                self.log_streamer.close(execution_id)
+            else:
+                self.log_streamer.write(execution_id, *lines)
+
+    def _close_log(self, job):
+        execution_id = job.test_config.get('execution_id')
+        if self.log_streamer is None or execution_id is None:
+            return
+        if self.backend == 'process' and self._log_queue is not None:
+            # 与子进程写入的日志走同一个队列，保证结束标记排在最后
+            self._log_queue.put((execution_id, None))
+        else:
+            self.log_streamer.close(execution_id)
+
+    def _dispatch(self, job):
+        job.attempts += 1
+        if self.backend == 'eager':
+            future = Future()
+            try:
+                future.set_result(run_test_suite(job.test_config, self._log_sink()))
+            except Exception as e:
+                future.set_exception(e)
+            self._on_done(job, future)
+            return
+        try:
+            future = self._get_pool().submit(run_test_suite, job.test_config, self._log_sink())
+        except Exception as e:
+            # 提交失败（进程池损坏、已关闭等）按执行失败处理：重试或释放设备
+            logger.error(f"Failed to submit test suite on device {job.device_id}: {e}")
+            if isinstance(e, BrokenExecutor):
+                self._pool = None
+            future = Future()
+            future.set_exception(e)
+            self._on_done(job, future)
+            return
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+    def _on_done(self, job, future):
+        error = future.exception()
+        if error is not None and job.attempts <= job.retries:
+            logger.warning(f"Test suite on device {job.device_id} failed "
+                           f"(attempt {job.attempts}), retrying: {error}")
+            with self._lock:
+                self.stats['retried'] += 1
+            self._dispatch(job)
+            return
+
+        with self._lock:
+            if error is None:
+                self.stats['completed'] += 1
+            else:
+                self.stats['failed'] += 1
+        self._close_log(job)
+        if error is None:
+            result = future.result()
+            result.update({'device_id': job.device_id, 'attempts': job.attempts})
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(error)
+        self._release(job.device_id)
+
+    def _release(self, device_id):
+        """设备空闲后调度它的下一个等待中的套件"""
+        if device_id is None:
+            return
+        with self._lock:
+            queue = self._waiting.get(device_id)
+            if not queue:
+                self._waiting.pop(device_id, None)
+                self._busy.discard(device_id)
+                return
+            job = queue.popleft()
+        self._dispatch(job)
+
+
+executor = TestSuiteExecutor()
@@ -0,0 +1,68 @@
+"""基准测试的计时与汇总辅助函数"""
+import os
+import statistics
+import threading
+import time
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_ints(name, default):
+    return [int(v) for v in os.environ.get(name, default).split(',') if v.strip()]
+
+
+def report(title, **values):
+    """打印一行基准结果"""
+    parts = []
+    for name, value in values.items():
+        parts.append(f'{name}={value:.3f}' if isinstance(value, float) else f'{name}={value}')
+    print(f'\n[bench] {title}: ' + ' '.join(parts))
+
+
+def latency_summary(latencies):
+    """延迟列表（秒）-> 毫秒的 p50 / p95 / max"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'p50_ms': statistics.median(ordered) * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def run_concurrently(call, threads, total):
+    """用 threads 个线程共执行 total 次 call(n)，返回 (耗时, 每次的延迟, 异常列表)"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+    start = threading.Event()
+
+    def worker():
+        start.wait()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            began = time.perf_counter()
+            try:
+                call(n)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    began = time.perf_counter()
+    start.set()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - began, latencies, errors
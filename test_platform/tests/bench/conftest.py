@@ -0,0 +1,63 @@
+"""
+性能基准
+
+默认跳过，设置 BENCHMARKS=1 后运行，结果打印到标准输出::
+
+    BENCHMARKS=1 python -m pytest tests/bench -s
+
+断言只检查数量级（缓存比不缓存快、内存不随行数增长等），避免在慢机器上误报；
+规模用各文件说明的环境变量调整，计时和汇总的辅助函数在 bench_utils 中。
+需要并发访问数据库的基准使用 `file_app`：临时目录中的SQLite文件库，引擎参数与 create_app 相同。
+"""
+import os
+
+import pytest
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get('BENCHMARKS'):
+        return
+    skip = pytest.mark.skip(reason='benchmarks run only with BENCHMARKS=1')
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    for item in items:
+        if str(item.fspath).startswith(bench_dir):
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """返回 make(tuned=True, **config)：SQLite文件库上的最小应用，已建表并推入应用上下文"""
+    database = pytest.importorskip('database')
+    pytest.importorskip('models')
+    from flask import Flask
+    from flask_jwt_extended import JWTManager
+    from core.engine import engine_options, tune_engine
+
+    contexts = []
+
+    def make(tuned=True, **config):
+        app = Flask(__name__)
+        app.config.update(
+            TESTING=True,
+            SECRET_KEY='bench-secret',
+            JWT_SECRET_KEY='bench-secret',
+            SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / f"bench-{len(contexts)}.db"}',
+            **config
+        )
+        if tuned:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app)
+        database.db.init_app(app)
+        JWTManager(app)
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        if tuned:
+            tune_engine(app, database.db.engine)
+        database.db.create_all()
+        return app
+
+    yield make
+    for context in reversed(contexts):
+        database.db.session.remove()
+        database.db.engine.dispose()
+        context.pop()
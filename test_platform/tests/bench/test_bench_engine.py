@@ -0,0 +1,106 @@
+"""
+数据库引擎调优下的并发请求（user-014）
+
+BENCH_ENGINE_THREADS 个线程（默认16）共发出 BENCH_ENGINE_REQUESTS 个请求（默认2000），
+交替访问 `/api/devices/page` 和 `/api/auth/status`，同时有一个线程持续更新设备行，
+模拟心跳写入。分别在 engine_options/tune_engine 调优后的引擎和默认引擎上运行，
+报告吞吐、延迟、错误数以及调优引擎的 `pool_metrics` 快照。
+"""
+import threading
+
+import pytest
+from flask import Blueprint
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, update
+
+from bench_utils import env_int, latency_summary, report, run_concurrently
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+pytest.importorskip('models.user')
+
+DEVICES = 500
+# pool_metrics 中的累计计数，报告本次运行的增量
+CUMULATIVE = ('connects', 'checkouts', 'checkins', 'invalidations', 'hold_seconds_total', 'waits',
+              'wait_seconds_total', 'wait_timeouts')
+
+
+def build(file_app, tuned):
+    from auth.routes import bp as auth_bp
+    from auth.services import create_token
+    from database import db
+    from models.device import Device
+    from services.device_list import init_device_list_routes
+
+    app = file_app(tuned=tuned)
+    devices_bp = Blueprint('devices', __name__, url_prefix='/api/devices')
+    init_device_list_routes(devices_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(devices_bp)
+    db.session.execute(insert(Device), [{
+        'name': f'device-{n}', 'device_type': 'router', 'fingerprint': f'engine-fp-{n:05d}',
+        'status': 'active', 'location': f'lab-{n % 10}',
+    } for n in range(DEVICES)])
+    db.session.commit()
+    with app.test_request_context():
+        admin = {'Authorization': f'Bearer {create_access_token(identity="admin")}'}
+        device = {'Authorization': f'Bearer {create_token(db.session.get(Device, 1))}'}
+    return app, admin, device
+
+
+def heartbeats(app, stop, errors):
+    """持续更新设备状态，直到 stop 被设置"""
+    from database import db
+    from models.device import Device
+
+    n = 0
+    with app.app_context():
+        while not stop.is_set():
+            n += 1
+            try:
+                db.session.execute(update(Device).where(Device.id == n % DEVICES + 1).values(
+                    status='active' if n % 2 else 'offline'))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+        db.session.remove()
+
+
+@pytest.mark.parametrize('tuned', [True, False], ids=['tuned', 'default'])
+def test_concurrent_requests(file_app, tuned):
+    from core.engine import pool_metrics
+    from database import db
+
+    app, admin, device = build(file_app, tuned)
+    threads = env_int('BENCH_ENGINE_THREADS', 16)
+    requests = env_int('BENCH_ENGINE_REQUESTS', 2000)
+    before = pool_metrics.snapshot()
+
+    def call(n):
+        client = app.test_client()
+        if n % 2:
+            response = client.get('/api/auth/status', headers=device)
+        else:
+            response = client.get(f'/api/devices/page?location=lab-{n % 10}&limit=50', headers=admin)
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    stop, write_errors = threading.Event(), []
+    writer = threading.Thread(target=heartbeats, args=(app, stop, write_errors))
+    writer.start()
+    try:
+        elapsed, latencies, errors = run_concurrently(call, threads, requests)
+    finally:
+        stop.set()
+        writer.join(30)
+
+    label = 'tuned' if tuned else 'default'
+    report(f'concurrent requests ({label} engine)', threads=threads, requests=requests,
+           requests_per_s=len(latencies) / elapsed, errors=len(errors), write_errors=len(write_errors),
+           **latency_summary(latencies))
+    if tuned:
+        snapshot = pool_metrics.snapshot(db.engine)
+        for key in CUMULATIVE:
+            snapshot[key] -= before[key]
+        report('pool_metrics', **snapshot)
+        assert not errors and not write_errors, (errors + write_errors)[:3]
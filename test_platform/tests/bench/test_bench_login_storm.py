@@ -0,0 +1,69 @@
+"""
+断电重启后的设备登录风暴（user-012）
+
+BENCH_LOGIN_AGENTS 个设备（默认200）由 BENCH_LOGIN_THREADS 个线程（默认32）同时调用
+`/api/auth/device-login`，先冷缓存一轮、再热缓存一轮，报告吞吐与延迟，
+并确认 last_login_at 被合并成少量批量UPDATE。BENCH_LOGIN_HASH 设置密码哈希方法，
+默认降低了迭代次数以便快速运行，评估生产配置时改为 werkzeug 的默认值（pbkdf2:sha256:600000）。
+"""
+import os
+
+import pytest
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from bench_utils import env_int, latency_summary, report, run_concurrently
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+pytest.importorskip('models.user')
+
+
+@pytest.fixture
+def login_writer():
+    from auth.login import credential_cache, last_login_writer
+    saved = last_login_writer.app, last_login_writer.interval
+    credential_cache.clear()
+    yield last_login_writer
+    last_login_writer.flush()
+    last_login_writer.app, last_login_writer.interval = saved
+    credential_cache.clear()
+
+
+def test_login_storm(file_app, login_writer):
+    from auth.login import credential_cache
+    from auth.routes import bp
+    from database import db
+    from models.device import Device
+
+    app = file_app(LOGIN_FLUSH_INTERVAL=0.5)
+    app.register_blueprint(bp)
+    login_writer.init_app(app)
+    agents = env_int('BENCH_LOGIN_AGENTS', 200)
+    threads = env_int('BENCH_LOGIN_THREADS', 32)
+    password_hash = generate_password_hash('agent-password', method=os.environ.get(
+        'BENCH_LOGIN_HASH', 'pbkdf2:sha256:20000'))
+    db.session.execute(insert(Device), [{
+        'name': f'agent-{n}', 'device_type': 'router', 'fingerprint': f'agent-fp-{n:06d}',
+        'password_hash': password_hash,
+    } for n in range(agents)])
+    db.session.commit()
+
+    def login(n):
+        response = app.test_client().post('/api/auth/device-login', json={
+            'fingerprint': f'agent-fp-{n:06d}', 'password': 'agent-password'})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    for phase in ('cold', 'warm'):
+        elapsed, latencies, errors = run_concurrently(login, threads, agents)
+        report(f'device-login storm ({phase} cache)', agents=agents, threads=threads,
+               logins_per_s=len(latencies) / elapsed, errors=len(errors), **latency_summary(latencies))
+        assert not errors, errors[:3]
+
+    flushes_before = login_writer.flushes
+    login_writer.flush()
+    logged_in = db.session.scalar(select(func.count()).select_from(Device).where(Device.last_login_at.isnot(None)))
+    report('last_login_at writes', devices=logged_in, batched_flushes=login_writer.flushes,
+           timer_flushes=flushes_before, credential_cache_hits=credential_cache.stats()['hits'])
+    assert logged_in == agents
+    assert login_writer.flushes < agents
@@ -0,0 +1,59 @@
+"""
+Socket.IO 跨worker广播的投递延迟（user-004）
+
+多个 SocketIO 服务端共用同一个消息队列（默认 memory://，BENCH_MQ_URL 可指向真实的Redis），
+由第一个worker连续广播，统计每条消息到达每个worker的延迟，worker数由 BENCH_MQ_WORKERS
+（默认 1,2,4,8）给出，每轮 BENCH_MQ_MESSAGES 条消息（默认200）。
+memory:// 的绝对延迟主要取决于kombu的轮询，这里只要求延迟不随worker数明显增长。
+"""
+import os
+import threading
+import time
+import uuid
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from bench_utils import env_int, env_ints, latency_summary, report
+
+
+def start_workers(count, url):
+    channel = f'bench-{uuid.uuid4().hex}'
+    received = []
+    lock = threading.Lock()
+    workers = []
+    for _ in range(count):
+        worker = SocketIO(Flask(__name__), message_queue=url, channel=channel, async_mode='threading')
+        manager = worker.server.manager
+
+        def record(message, deliver=manager._handle_emit):
+            now = time.perf_counter()
+            with lock:
+                received.append(now - message['data']['sent'])
+            deliver(message)
+        manager._handle_emit = record
+        manager.initialize()
+        workers.append(worker)
+    time.sleep(0.3)     # 等待各worker订阅完成
+    return workers, received
+
+
+def test_delivery_latency_stays_bounded_as_workers_grow():
+    url = os.environ.get('BENCH_MQ_URL', 'memory://')
+    messages = env_int('BENCH_MQ_MESSAGES', 200)
+    results = {}
+    for count in env_ints('BENCH_MQ_WORKERS', '1,2,4,8'):
+        workers, received = start_workers(count, url)
+        for n in range(messages):
+            workers[0].emit('host_status_update', {'n': n, 'sent': time.perf_counter()}, to='dashboard')
+        deadline = time.monotonic() + 10
+        while len(received) < messages * count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        summary = latency_summary(received)
+        results[count] = summary
+        report(f'message queue fan-out, {count} workers', delivered=f'{len(received)}/{messages * count}',
+               **summary)
+        assert len(received) == messages * count
+
+    baseline = results[min(results)]['p95_ms']
+    assert max(s['p95_ms'] for s in results.values()) < 2 * baseline + 100
@@ -0,0 +1,67 @@
+"""
+报表流式导出的内存占用（user-022）
+
+对 BENCH_EXPORT_ROWS 中的每个行数（默认 10000,100000）各建一个SQLite文件库，
+流式读取 `/api/reports/export/devices`，用 tracemalloc 记录峰值内存并报告导出速度。
+峰值应基本不随行数增长；评估千万行导出时设置 BENCH_EXPORT_ROWS=10000,10000000（需要几GB磁盘和较长时间）。
+"""
+import time
+import tracemalloc
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from bench_utils import env_ints, report
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+BATCH = 10000
+
+
+def fill(rows):
+    from database import db
+    from models.device import Device
+
+    for start in range(0, rows, BATCH):
+        db.session.execute(insert(Device), [{
+            'name': f'device-{n}', 'device_type': 'router' if n % 2 else 'switch',
+            'location': f'lab-{n % 10}', 'status': 'active', 'fingerprint': f'fp-{n:09d}',
+            'description': 'x' * 100,
+        } for n in range(start, min(start + BATCH, rows))])
+        db.session.commit()
+
+
+def test_export_peak_memory_is_flat_in_row_count(file_app):
+    from services.report_export import init_export_routes
+
+    peaks = {}
+    for rows in env_ints('BENCH_EXPORT_ROWS', '10000,100000'):
+        app = file_app(REPORT_EXPORT_CHUNK_BYTES=64 * 1024)
+        init_export_routes(app)
+        fill(rows)
+        with app.test_request_context():
+            headers = {'Authorization': f'Bearer {create_access_token(identity="admin")}'}
+
+        response = app.test_client().get('/api/reports/export/devices', headers=headers, buffered=False)
+        assert response.status_code == 200
+        total = 0
+        began = time.perf_counter()
+        tracemalloc.start()
+        try:
+            for chunk in response.response:
+                total += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            response.close()
+        elapsed = time.perf_counter() - began
+
+        peaks[rows] = peak
+        report(f'device export, {rows} rows', mb=total / 2 ** 20, rows_per_s=rows / elapsed,
+               peak_kb=peak / 1024)
+        assert total > rows * 100
+
+    smallest, largest = min(peaks), max(peaks)
+    assert peaks[largest] < 2 * peaks[smallest] + 1024 * 1024
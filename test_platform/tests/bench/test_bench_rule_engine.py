@@ -0,0 +1,60 @@
+"""
+规则引擎在大量规则下的事件吞吐（user-016）
+
+BENCH_RULES 条规则（默认10000）分布在20个指标上：大部分按设备、一部分按设备类型过滤，
+少量不带过滤条件；BENCH_RULE_DEVICES 台设备（默认1000）共产生 BENCH_RULE_EVENTS 个事件
+（默认20000，指标值大多低于阈值），同步调用 `process`，报告每秒事件数、每个事件评估的规则数和触发/恢复次数。
+目标是1万条规则下每秒处理至少1000个事件。
+"""
+import random
+import time
+
+from bench_utils import env_int, report
+from services.rule_engine import RuleEngine
+
+METRICS = [f'metric_{n}' for n in range(20)]
+DEVICE_TYPES = ('router', 'switch', 'firewall', 'server')
+
+
+def make_rules(count, devices, rng):
+    rules = []
+    for n in range(count):
+        rule = {'id': n + 1, 'name': f'rule-{n}', 'metric': rng.choice(METRICS), 'operator': '>',
+                'threshold': rng.randint(60, 95), 'clear_threshold': 50, 'severity': 'warning'}
+        kind = rng.random()
+        if kind < 0.8:
+            rule['device_id'] = rng.randint(1, devices)
+        elif kind < 0.95:
+            rule['device_type'] = rng.choice(DEVICE_TYPES)
+        rules.append(rule)
+    return rules
+
+
+def make_event(rng, devices):
+    device_id = rng.randint(1, devices)
+    return {'device_id': device_id, 'device_type': DEVICE_TYPES[device_id % len(DEVICE_TYPES)],
+            'status': 'online', 'metrics': {m: rng.gauss(40, 15) for m in rng.sample(METRICS, 4)}}
+
+
+def test_ten_thousand_rules_keep_up_with_a_thousand_events_per_second():
+    rng = random.Random(16)
+    rule_count = env_int('BENCH_RULES', 10000)
+    devices = env_int('BENCH_RULE_DEVICES', 1000)
+    events = [make_event(rng, devices) for _ in range(env_int('BENCH_RULE_EVENTS', 20000))]
+    engine = RuleEngine()
+
+    began = time.perf_counter()
+    engine.load_rules(make_rules(rule_count, devices, rng))
+    load_ms = (time.perf_counter() - began) * 1000
+
+    began = time.perf_counter()
+    for event in events:
+        engine.process(event)
+    elapsed = time.perf_counter() - began
+
+    stats = engine.stats()
+    report('rule engine', rules=stats['rules'], load_ms=load_ms, events=len(events),
+           events_per_s=len(events) / elapsed, evaluations_per_event=stats['evaluations'] / len(events),
+           fired=stats['fired'], resolved=stats['resolved'], firing=stats['firing'], errors=stats['errors'])
+    assert stats['errors'] == 0
+    assert len(events) / elapsed >= 1000
@@ -0,0 +1,50 @@
+"""
+设备token校验缓存的吞吐（user-001）
+
+比较每次请求都 jwt.decode + 查库、缓存命中后取完整设备、缓存命中直接使用身份记录三种情况。
+BENCH_AUTH_REQUESTS 设置每种情况的请求数（默认2000）。
+"""
+import time
+
+import pytest
+
+from bench_utils import env_int, report
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+
+def test_cached_token_checks_beat_decoding_and_querying(app, make_device):
+    from auth.services import create_token, token_required
+    from auth.token_cache import token_cache
+
+    @token_required
+    def full(current_device):
+        return current_device.name
+
+    @token_required(identity=True)
+    def identity(current_device):
+        return current_device.name
+
+    app.add_url_rule('/full', 'full', full)
+    app.add_url_rule('/identity', 'identity', identity)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {create_token(make_device())}'}
+    requests = env_int('BENCH_AUTH_REQUESTS', 2000)
+
+    def measure(path, clear):
+        token_cache.clear()
+        began = time.perf_counter()
+        for _ in range(requests):
+            if clear:
+                token_cache.clear()
+            assert client.get(path, headers=headers).status_code == 200
+        return requests / (time.perf_counter() - began)
+
+    uncached = measure('/full', clear=True)
+    cached_full = measure('/full', clear=False)
+    cached_identity = measure('/identity', clear=False)
+    report('token_required', requests=requests, uncached_rps=uncached,
+           cached_device_rps=cached_full, cached_identity_rps=cached_identity)
+
+    assert cached_identity > uncached
@@ -0,0 +1,170 @@
+"""
+测试公共夹具
+
+应用模块以 test_platform 为导入根（`from database import db`、`from models.device import Device`），
+这里把该目录加入 sys.path。依赖数据库的测试使用 `app` 夹具：内存SQLite上的最小Flask应用，
+只初始化数据库，不经过 create_app 启动后台线程。
+"""
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app():
+    database = pytest.importorskip('database')
+    pytest.importorskip('models')
+    from flask import Flask
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SECRET_KEY='test-secret',
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+    )
+    database.db.init_app(app)
+    with app.app_context():
+        database.db.create_all()
+        yield app
+        database.db.session.remove()
+        database.db.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    from database import db
+    return db
+
+
+@pytest.fixture
+def make_device(db):
+    from models.device import Device
+
+    counter = {'n': 0}
+
+    def make(**values):
+        counter['n'] += 1
+        n = counter['n']
+        values.setdefault('name', f'device-{n}')
+        values.setdefault('device_type', 'router')
+        values.setdefault('fingerprint', f'fp-{n:04d}')
+        device = Device(**values)
+        db.session.add(device)
+        db.session.commit()
+        return device
+    return make
+
+
+class FakeRedis(object):
+    """
+    进程内的Redis替身（发布/订阅、字符串和有序集合的少量命令），
+    多个实例共享同一个 broker 时模拟多个worker连到同一个Redis
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker if broker is not None else {
+            'subscribers': [], 'data': {}, 'lock': threading.RLock()}
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def set(self, key, value, nx=False):
+        with self.broker['lock']:
+            if nx and key in self.broker['data']:
+                return None
+            self.broker['data'][key] = str(value).encode()
+            return True
+
+    def get(self, key):
+        return self.broker['data'].get(key)
+
+    def incrby(self, key, amount):
+        with self.broker['lock']:
+            value = int(self.broker['data'].get(key, 0)) + amount
+            self.broker['data'][key] = str(value).encode()
+            return value
+
+    def zadd(self, key, mapping):
+        with self.broker['lock']:
+            self.broker['data'].setdefault(key, {}).update(
+                {member.encode(): score for member, score in mapping.items()})
+            return len(mapping)
+
+    def zremrangebyrank(self, key, start, end):
+        with self.broker['lock']:
+            zset = self.broker['data'].get(key, {})
+            ranked = sorted(zset, key=zset.get)
+            end = len(ranked) + end if end < 0 else end
+            for member in ranked[start:end + 1]:
+                del zset[member]
+
+    def zrangebyscore(self, key, low, high):
+        zset = self.broker['data'].get(key, {})
+        exclusive = str(low).startswith('(')
+        low = float(str(low).lstrip('('))
+        high = float('inf') if high == '+inf' else float(high)
+        return [member for member in sorted(zset, key=zset.get)
+                if (zset[member] > low if exclusive else zset[member] >= low) and zset[member] <= high]
+
+    def publish(self, channel, data):
+        with self.broker['lock']:
+            targets = [q for ch, q in self.broker['subscribers'] if ch == channel]
+        for q in targets:
+            q.put({'type': 'message', 'channel': channel, 'data': data})
+        return len(targets)
+
+    def pubsub(self, **kwargs):
+        return _FakePubSub(self.broker)
+
+
+class _FakePipeline(object):
+    """命令在 execute 时持锁依次执行，模拟 MULTI/EXEC"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.client.broker['lock']:
+            return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class _FakePubSub(object):
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = queue.Queue()
+        self.channels = []
+
+    def subscribe(self, channel):
+        with self.broker['lock']:
+            self.broker['subscribers'].append((channel, self.queue))
+        self.channels.append(channel)
+        self.queue.put({'type': 'subscribe', 'channel': channel, 'data': 1})
+
+    def listen(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        with self.broker['lock']:
+            self.broker['subscribers'] = [(ch, q) for ch, q in self.broker['subscribers'] if q is not self.queue]
+        self.queue.put(None)
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis
@@ -0,0 +1,78 @@
+"""仪表盘汇总计数：告警确认增量与多worker部署检查"""
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.alert')
+
+from dashboard.acks import AckBatcher  # noqa: E402
+from models.alert import Alert  # noqa: E402
+from services import aggregates as aggregates_module  # noqa: E402
+from services.aggregates import DashboardAggregates  # noqa: E402
+
+
+class FakeSocketIO(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, to=None):
+        self.emitted.append((to, payload))
+
+    def start_background_task(self, target):
+        pass    # 测试中直接调用 flush
+
+
+@pytest.fixture
+def aggregates(app, monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    instance = DashboardAggregates()
+    instance.init_app(app)
+    monkeypatch.setattr(aggregates_module, 'aggregates', instance)
+    return instance
+
+
+def open_alerts(aggregates):
+    aggregates._cache = None
+    return aggregates.summary()['alerts']['open_by_severity']
+
+
+def test_acknowledging_subtracts_severities_without_reconciling(app, db, aggregates):
+    alerts = [Alert(severity='critical', status='active'), Alert(severity='critical', status='active'),
+              Alert(severity='warning', status=None), Alert(severity='critical', status='resolved')]
+    db.session.add_all(alerts)
+    db.session.commit()
+    aggregates.reconcile(parts=('alerts',))
+    assert open_alerts(aggregates) == {'critical': 2, 'warning': 1}   # 状态为空的告警也算未处理
+
+    batcher = AckBatcher()
+    batcher.init_socketio(FakeSocketIO())
+    batcher.submit(app, 'sid', [alerts[0].id, alerts[2].id, alerts[3].id], 'admin')
+    batcher.flush()
+
+    assert open_alerts(aggregates) == {'critical': 1}
+    assert aggregates.reconciles == 1
+    _, receipt = batcher.socketio.emitted[0]
+    assert receipt['acknowledged'] == [alerts[0].id, alerts[2].id] and receipt['skipped'] == [alerts[3].id]
+
+
+def test_refuses_process_local_counters_with_several_workers(app, monkeypatch):
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    app.config.pop('REDIS_URL', None)
+
+    with pytest.raises(RuntimeError):
+        DashboardAggregates().init_app(app)
+
+    app.config['REDIS_URL'] = 'redis://redis:6379/0'
+    DashboardAggregates().init_app(app)
+
+
+def test_suite_lookups_are_cached_least_recently_used(db, aggregates, monkeypatch):
+    pytest.importorskip('models.test_result')
+    from models.test_result import TestExecution
+
+    monkeypatch.setattr(aggregates_module, 'SUITE_CACHE_SIZE', 2)
+    db.session.add_all([TestExecution(id=n, test_suite_id=n * 10) for n in (1, 2, 3)])
+    db.session.commit()
+
+    assert [aggregates._suite_for(n) for n in (1, 2, 1, 3)] == [10, 20, 10, 30]
+    assert list(aggregates._suites) == [1, 3]      # 2 最久未使用，被淘汰
+    assert aggregates._suite_for(404) is None and 404 not in aggregates._suites
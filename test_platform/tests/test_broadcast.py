@@ -0,0 +1,80 @@
+"""主机状态合并广播：合并与发送失败后的恢复"""
+import threading
+import time
+
+import pytest
+
+from dashboard.broadcast import StatusCoalescer
+
+
+class FlakySocketIO(object):
+    """前 failures 次 emit 抛出异常，模拟消息队列不可用"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.emitted = []
+
+    def emit(self, event, payload, to=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('message queue down')
+        self.emitted.append((to, payload))
+
+    def start_background_task(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_latest_status_per_host_is_sent_once():
+    coalescer = StatusCoalescer(window=0.05)
+    socketio = FlakySocketIO()
+    coalescer.init_socketio(socketio)
+
+    for status in ('offline', 'online', 'offline'):
+        coalescer.publish({'host_id': 1, 'status': status})
+    coalescer.publish({'host_id': 2, 'status': 'online'})
+
+    assert wait_for(lambda: socketio.emitted)
+    _, payload = socketio.emitted[0]
+    assert [h['status'] for h in payload['hosts']] == ['offline', 'online']
+    assert (payload['received'], payload['coalesced']) == (4, 2)
+
+
+def test_flusher_survives_a_failing_emit():
+    coalescer = StatusCoalescer(window=0.02)
+    socketio = FlakySocketIO(failures=1)
+    coalescer.init_socketio(socketio)
+
+    coalescer.publish({'host_id': 1, 'status': 'offline'})
+    assert wait_for(lambda: coalescer.stats()['errors'] == 1 and not coalescer._flusher_running)
+
+    coalescer.publish({'host_id': 1, 'status': 'online'})
+    assert wait_for(lambda: socketio.emitted)
+    assert socketio.emitted[0][1]['hosts'] == [{'host_id': 1, 'status': 'online'}]
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_flusher_restarts_after_it_dies():
+    coalescer = StatusCoalescer(window=0.02)
+    socketio = FlakySocketIO()
+    coalescer.init_socketio(socketio)
+    real_sleep, socketio.sleep = socketio.sleep, lambda seconds: 1 / 0
+
+    coalescer.publish({'host_id': 1, 'status': 'offline'})
+    assert wait_for(lambda: not coalescer._flusher_running)
+
+    socketio.sleep = real_sleep
+    coalescer.publish({'host_id': 2, 'status': 'online'})
+    assert wait_for(lambda: socketio.emitted)
+    assert len(socketio.emitted[0][1]['hosts']) == 2
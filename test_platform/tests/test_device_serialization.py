@@ -0,0 +1,60 @@
+"""设备序列化：字段投影、批量序列化与字段校验"""
+import pytest
+from sqlalchemy import event, inspect
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from models.device import Device  # noqa: E402
+
+
+@pytest.fixture
+def devices(make_device):
+    return [make_device(location=f'lab-{n}', network_config={'vlan': n}, user_agent='x' * 500)
+            for n in range(5)]
+
+
+def test_to_dict_never_exposes_the_password_hash(devices):
+    devices[0].set_password('secret')
+
+    data = devices[0].to_dict()
+
+    assert tuple(data) == Device.SERIALIZABLE_FIELDS and 'password_hash' not in data
+    assert data['network_config'] == {'vlan': 0}
+    assert isinstance(data['created_at'], str) and data['last_login_at'] is None
+
+
+@pytest.mark.parametrize('fields', [['name', 'password_hash'], ['no_such_field']])
+def test_unknown_fields_are_rejected(devices, fields):
+    with pytest.raises(ValueError):
+        Device.check_fields(fields)
+    with pytest.raises(ValueError):
+        devices[0].to_dict(fields)
+    with pytest.raises(ValueError):
+        Device.bulk_to_dict(fields=fields)
+
+
+def test_query_fields_defers_large_columns(db, devices):
+    expected = devices[0].to_dict(['id', 'name'])
+    db.session.expunge_all()
+
+    device = Device.query_fields(['id', 'name']).first()
+
+    assert {'network_config', 'user_agent'} <= inspect(device).unloaded
+    assert device.to_dict(['id', 'name']) == expected
+
+
+def test_bulk_to_dict_matches_to_dict_in_one_query(db, devices):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        rows = Device.bulk_to_dict(Device.location != 'lab-0', limit=3, offset=1)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert len(statements) == 1
+    assert rows == [d.to_dict(Device.SUMMARY_FIELDS) for d in devices[2:5]]
@@ -0,0 +1,82 @@
+"""设备列表增量同步的共享版本序列"""
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from dashboard.device_sync import DeviceChangeLog, RedisChangeLog  # noqa: E402
+
+
+@pytest.fixture
+def workers(fake_redis):
+    """两个worker共用同一个Redis"""
+    broker = fake_redis()
+    logs = []
+    for _ in range(2):
+        log = DeviceChangeLog()
+        log.store = RedisChangeLog(fake_redis(broker.broker), history=5)
+        logs.append(log)
+    return logs
+
+
+def test_delta_from_another_worker(workers, make_device):
+    worker_a, worker_b = workers
+    device = make_device()
+    epoch, version = worker_a.record([], [])
+
+    worker_b.record([device.id], [99])
+    response = worker_a.sync(epoch, version)
+
+    assert response['type'] == 'delta'
+    assert [d['id'] for d in response['changed']] == [device.id]
+    assert response['removed'] == [99]
+    assert response['version'] == version + 2
+
+
+def test_truncated_history_falls_back_to_snapshot(workers, make_device):
+    worker_a, worker_b = workers
+    make_device()
+    epoch, version = worker_a.record([], [])
+
+    worker_b.record(range(100, 110), [])
+
+    assert worker_a.sync(epoch, version)['type'] == 'snapshot'
+    assert worker_a.sync(epoch, version + 6)['type'] == 'delta'
+
+
+@pytest.mark.parametrize('version', ['abc', None, -1, [1], 10 ** 6])
+def test_invalid_or_future_versions_get_a_snapshot(workers, make_device, version):
+    make_device()
+    epoch, _ = workers[0].record([], [])
+
+    response = workers[0].sync(epoch, version)
+
+    assert response['type'] == 'snapshot'
+    assert len(response['devices']) == 1
+
+
+def test_epoch_mismatch_gets_a_snapshot(workers, make_device):
+    make_device()
+    assert workers[0].sync('stale-epoch', 0)['type'] == 'snapshot'
+
+
+def test_store_outage_asks_clients_to_resync(workers, make_device):
+    class Broken(object):
+        def pipeline(self, transaction=True):
+            raise ConnectionError('redis down')
+
+    class Recorder(object):
+        def __init__(self):
+            self.emitted = []
+
+        def emit(self, event, data, to=None):
+            self.emitted.append(data)
+
+    log = workers[0]
+    log.store.client = Broken()
+    log.socketio = Recorder()
+
+    log._publish([{'id': 1}], [])
+
+    assert log.socketio.emitted[0]['resync'] is True
+    assert log.sync('any', 0)['type'] == 'snapshot'
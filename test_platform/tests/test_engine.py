@@ -0,0 +1,72 @@
+"""连接池统计：占用时长与等待时长"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import QueuePool
+
+from core.engine import PoolMetrics
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.db"}', poolclass=QueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.3)
+    yield engine
+    engine.dispose()
+
+
+def hold_connection(engine, seconds):
+    """在另一个线程里占住唯一的连接 seconds 秒，返回已拿到连接后的线程"""
+    acquired = threading.Event()
+
+    def run():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            acquired.set()
+            time.sleep(seconds)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    acquired.wait(5)
+    return thread
+
+
+def test_wait_time_covers_queueing_for_a_busy_pool(engine):
+    metrics = PoolMetrics()
+    metrics.attach(engine)
+
+    thread = hold_connection(engine, 0.15)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    thread.join()
+
+    snapshot = metrics.snapshot(engine)
+    assert snapshot['waits'] == 2
+    assert snapshot['wait_seconds_max'] >= 0.1
+    assert snapshot['wait_seconds_total'] >= snapshot['wait_seconds_max']
+    assert snapshot['in_use'] == 0
+
+
+def test_wait_timeouts_are_counted(engine):
+    metrics = PoolMetrics()
+    metrics.attach(engine)
+
+    thread = hold_connection(engine, 0.6)
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    thread.join()
+
+    assert metrics.snapshot(engine)['wait_timeouts'] == 1
+
+
+def test_pool_is_instrumented_again_after_dispose(engine):
+    metrics = PoolMetrics()
+    metrics.attach(engine)
+    engine.dispose()
+
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+
+    assert metrics.snapshot(engine)['waits'] == 1
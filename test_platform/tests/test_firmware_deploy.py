@@ -0,0 +1,175 @@
+"""固件部署：租约领取、失败状态与校验值格式"""
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.firmware')
+
+from models.firmware import Firmware, FirmwareDeployment  # noqa: E402
+from models.firmware_checkpoint import FirmwareDeploymentCheckpoint  # noqa: E402
+from services.firmware_deploy import FirmwareDeployer, LeaseLost, expected_checksum  # noqa: E402
+
+IMAGE = bytes(range(256)) * 40
+
+
+class RecordingTransport(object):
+    """记录收到的数据，commit 时返回实际内容的 sha256"""
+
+    def __init__(self):
+        self.received = bytearray()
+        self.begin_sha256 = 'unset'
+
+    def begin(self, device, firmware, image, offset, sha256):
+        self.begin_sha256 = sha256
+        return {}, offset
+
+    def send(self, session, offset, chunk):
+        self.received[offset:offset + len(chunk)] = bytes(chunk)
+
+    def commit(self, session, sha256):
+        return hashlib.sha256(self.received).hexdigest()
+
+    def close(self, session):
+        pass
+
+
+class Events(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload):
+        self.emitted.append(payload)
+
+
+def make_deployer(app, identity):
+    deployer = FirmwareDeployer()
+    deployer.init_app(app, Events())
+    deployer.identity = identity
+    deployer.chunk_size = 1024
+    deployer.retries = 0
+    deployer.transport = RecordingTransport()
+    return deployer
+
+
+def run(deployer, deployment_id):
+    """在当前线程中执行一个部署（与线程池中的执行路径相同）"""
+    deployer._active[deployment_id] = threading.Event()
+    deployer._run(deployment_id)
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'firmware.bin'
+    path.write_bytes(IMAGE)
+    return str(path)
+
+
+@pytest.fixture
+def make_deployment(db, make_device, image_path):
+    def make(checksum=None, file_path=image_path):
+        device = make_device()
+        firmware = Firmware(version='1.0', file_path=file_path, checksum=checksum)
+        db.session.add(firmware)
+        db.session.flush()
+        deployment = FirmwareDeployment(firmware_id=firmware.id, device_id=device.id, status='pending', progress=0)
+        db.session.add(deployment)
+        db.session.flush()
+        db.session.add(FirmwareDeploymentCheckpoint(deployment_id=deployment.id, bytes_transferred=0))
+        db.session.commit()
+        return deployment.id
+    return make
+
+
+def reload(db, model, key):
+    db.session.expire_all()
+    return db.session.get(model, key)
+
+
+def test_only_one_worker_can_claim_a_deployment(app, db, make_deployment):
+    deployment_id = make_deployment()
+    worker_a, worker_b = make_deployer(app, 'a'), make_deployer(app, 'b')
+
+    assert worker_a._claim(deployment_id)
+    assert not worker_b._claim(deployment_id)
+    with pytest.raises(LeaseLost):
+        worker_b._save(deployment_id, offset=10)
+
+    # 租约过期（worker a 已退出）后由 b 接手，a 之后的写入被拒绝
+    checkpoint = reload(db, FirmwareDeploymentCheckpoint, deployment_id)
+    checkpoint.claimed_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert worker_b._claim(deployment_id)
+    with pytest.raises(LeaseLost):
+        worker_a._save(deployment_id, offset=10)
+
+
+def test_resume_skips_deployments_leased_by_a_live_worker(app, db, make_deployment):
+    leased, orphaned = make_deployment(), make_deployment()
+    owner, resumer = make_deployer(app, 'owner'), make_deployer(app, 'resumer')
+    owner._claim(leased)
+    submitted = []
+    resumer.submit = lambda deployment_id: submitted.append(deployment_id) or True
+
+    assert resumer.resume_interrupted() == 1
+    assert submitted == [orphaned]
+
+
+def test_completed_deployment_releases_the_lease(app, db, make_deployment):
+    deployment_id = make_deployment(checksum=hashlib.sha256(IMAGE).hexdigest())
+    deployer = make_deployer(app, 'a')
+
+    run(deployer, deployment_id)
+
+    deployment = reload(db, FirmwareDeployment, deployment_id)
+    checkpoint = db.session.get(FirmwareDeploymentCheckpoint, deployment_id)
+    assert (deployment.status, deployment.progress) == ('completed', 100)
+    assert (checkpoint.bytes_transferred, checkpoint.claimed_by) == (len(IMAGE), None)
+    assert bytes(deployer.transport.received) == IMAGE
+    assert deployer.transport.begin_sha256 == hashlib.sha256(IMAGE).hexdigest()
+
+
+def test_md5_checksum_is_verified(app, db, make_deployment):
+    deployment_id = make_deployment(checksum=hashlib.md5(IMAGE).hexdigest().upper())
+    deployer = make_deployer(app, 'a')
+
+    run(deployer, deployment_id)
+
+    assert reload(db, FirmwareDeployment, deployment_id).status == 'completed'
+    assert deployer.transport.begin_sha256 is None
+
+
+@pytest.mark.parametrize('checksum, error', [
+    (hashlib.md5(b'other').hexdigest(), 'md5'),
+    ('sha256:abc', 'unsupported firmware checksum format'),
+])
+def test_bad_checksum_fails_the_deployment(app, db, make_deployment, checksum, error):
+    deployment_id = make_deployment(checksum=checksum)
+    deployer = make_deployer(app, 'a')
+
+    run(deployer, deployment_id)
+
+    deployment = reload(db, FirmwareDeployment, deployment_id)
+    assert deployment.status == 'failed' and error in deployment.error_message
+
+
+def test_error_before_transfer_marks_failed_and_emits(app, db, make_deployment, tmp_path):
+    deployment_id = make_deployment(file_path=str(tmp_path / 'missing.bin'))
+    deployer = make_deployer(app, 'a')
+
+    run(deployer, deployment_id)
+
+    deployment = reload(db, FirmwareDeployment, deployment_id)
+    assert deployment.status == 'failed' and deployment.error_message
+    assert db.session.get(FirmwareDeploymentCheckpoint, deployment_id).claimed_by is None
+    assert [e['status'] for e in deployer.socketio.emitted] == ['failed']
+    assert deployer.stats['failed'] == 1 and not deployer._active
+
+
+def test_checksum_formats():
+    assert expected_checksum(None) == (None, None)
+    assert expected_checksum(' ' + 'A' * 40) == ('sha1', 'a' * 40)
+    with pytest.raises(ValueError):
+        expected_checksum('z' * 64)
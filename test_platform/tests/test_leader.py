@@ -0,0 +1,38 @@
+"""跨进程领导者锁（文件锁后备）"""
+import os
+import subprocess
+import sys
+
+from core.leader import LeaderLock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_lock(tmp_path):
+    lock = LeaderLock('test')
+    lock.directory = str(tmp_path)
+    return lock
+
+
+def acquire_in_other_process(tmp_path):
+    """在另一个进程里尝试获取一次锁，返回是否成功（该进程随即退出）"""
+    code = ("import sys; from core.leader import LeaderLock; "
+            f"lock = LeaderLock('test'); lock.directory = {str(tmp_path)!r}; "
+            "sys.exit(0 if lock.acquire() else 3)")
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT).returncode == 0
+
+
+def test_only_one_process_holds_the_file_lock(tmp_path):
+    lock = make_lock(tmp_path)
+    assert lock.acquire() and lock.is_leader()
+    assert lock.acquire()   # 续期保持持有
+
+    assert not acquire_in_other_process(tmp_path)
+
+
+def test_lock_is_released_when_the_holder_exits(tmp_path):
+    assert acquire_in_other_process(tmp_path)
+
+    lock = make_lock(tmp_path)
+    assert lock.acquire()
+    assert lock.stats['acquired'] == 1
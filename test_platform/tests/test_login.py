@@ -0,0 +1,78 @@
+"""设备登录凭据缓存与跨进程失效"""
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from auth import login as login_module  # noqa: E402
+from auth.invalidation import InvalidationBus  # noqa: E402
+from auth.login import CredentialCache, credential_cache, find_credential, verify_password  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    credential_cache.clear()
+    yield
+    credential_cache.clear()
+
+
+def test_password_change_invalidates_on_commit(db, make_device):
+    device = make_device(password_hash='old')
+    assert find_credential(device.fingerprint).password_hash == 'old'
+
+    device.password_hash = 'new'
+    db.session.commit()
+
+    assert credential_cache.get(device.fingerprint) is None
+    assert find_credential(device.fingerprint).password_hash == 'new'
+
+
+def test_invalidation_reaches_other_worker(fake_redis, make_device):
+    broker = fake_redis()
+    worker_a, worker_b = InvalidationBus(), InvalidationBus()
+    worker_a.client = fake_redis(broker.broker)
+    worker_b.client = fake_redis(broker.broker)
+    cache_b = CredentialCache()
+    worker_b.register(cache_b.invalidate_devices)
+    worker_b.start()
+    assert wait_for(worker_b.serving)
+
+    device = make_device(password_hash='old')
+    cache_b.put(device)
+    assert cache_b.get(device.fingerprint) is not None
+
+    worker_a.publish([device.id])
+
+    assert wait_for(lambda: cache_b.get(device.fingerprint) is None)
+
+
+def test_cache_bypassed_while_subscription_is_down(fake_redis, make_device, monkeypatch):
+    bus = InvalidationBus()
+    bus.client = fake_redis()
+    monkeypatch.setattr(login_module, 'invalidation_bus', bus)
+    device = make_device(password_hash='old')
+
+    credential_cache.put(device)
+
+    assert not bus.serving()
+    assert credential_cache.get(device.fingerprint) is None
+
+
+def test_password_check_does_not_import_eventlet(monkeypatch):
+    monkeypatch.delitem(sys.modules, 'eventlet', raising=False)
+
+    assert verify_password(generate_password_hash('secret', method='pbkdf2:sha256:1000'), 'secret')
+    assert 'eventlet' not in sys.modules
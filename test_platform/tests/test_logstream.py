@@ -0,0 +1,75 @@
+"""测试日志实时推送与执行器的衔接"""
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from dashboard.logstream import LogStreamer
+import tasks
+
+
+class RecordingSocketIO(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def make_streamer(**config):
+    app = Flask(__name__)
+    app.config.update(LOG_STREAM_FRAME_MS=10, **config)
+    streamer = LogStreamer()
+    socketio = RecordingSocketIO()
+    streamer.init_app(app, socketio)
+    return app, streamer, socketio
+
+
+def test_subscribe_requires_running_execution():
+    _, streamer, _ = make_streamer()
+
+    assert streamer.subscribe('sid', 42) is False
+    assert streamer.stats()['executions'] == 0
+
+    streamer.open(42)
+    assert streamer.subscribe('sid', 42) is True
+
+
+def test_finished_and_idle_buffers_are_evicted():
+    _, streamer, _ = make_streamer(LOG_STREAM_RETAIN_SECONDS=0, LOG_STREAM_IDLE_SECONDS=0)
+    streamer.write(1, 'done')
+    streamer.close(1)
+    streamer.write(2, 'stuck')
+
+    streamer._evict(force=True)
+
+    assert streamer.stats()['executions'] == 0
+
+
+def test_runner_output_reaches_subscriber():
+    app, streamer, socketio = make_streamer()
+    executor = tasks.TestSuiteExecutor(backend='thread', max_workers=1)
+    executor.init_app(app, log_streamer=streamer)
+    command = [sys.executable, '-c', 'print("line 1"); print("line 2")']
+
+    future = executor.submit({'commands': [command], 'execution_id': 7})
+    streamer.subscribe('sid', 7, tail=1000)
+    result = future.result(timeout=10)
+
+    deadline = time.monotonic() + 5
+    while not any(data.get('final') for _, data, _ in socketio.emitted) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    lines = [line for _, data, _ in socketio.emitted for line in data.get('lines', ())]
+    assert result['results'][0]['stdout'] == 'line 1\nline 2\n'
+    assert 'line 1' in lines and 'line 2' in lines
+    assert socketio.emitted[-1][1] == {'execution_id': 7, 'final': True}
+    executor.shutdown()
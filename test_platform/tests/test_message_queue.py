@@ -0,0 +1,54 @@
+"""Socket.IO 跨worker广播的消息队列"""
+import time
+import uuid
+
+import pytest
+from flask import Flask
+from flask_socketio import SocketIO
+
+pytest.importorskip('database')
+
+from app import get_socketio_message_queue  # noqa: E402
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    return app
+
+
+@pytest.mark.parametrize('config, expected', [
+    ({'SOCKETIO_MESSAGE_QUEUE': 'amqp://broker//'}, 'amqp://broker//'),
+    ({'SOCKETIO_MESSAGE_QUEUE': 'none', 'REDIS_URL': 'redis://redis:6379/0'}, None),
+    ({'REDIS_URL': 'redis://redis:6379/0'}, 'redis://redis:6379/0'),
+    ({'REDIS_URL': 'redis://localhost:6379/0'}, None),
+    ({}, None),
+])
+def test_queue_selection(config, expected, monkeypatch):
+    monkeypatch.delenv('SOCKETIO_MESSAGE_QUEUE', raising=False)
+    assert get_socketio_message_queue(make_app(**config)) == expected
+
+
+def test_emit_reaches_other_worker():
+    """一个worker发出的广播经队列到达另一个worker"""
+    channel = f'test-{uuid.uuid4().hex}'
+    app = make_app(SOCKETIO_MESSAGE_QUEUE='memory://')
+    queue = get_socketio_message_queue(app)
+    worker_a = SocketIO(make_app(), message_queue=queue, channel=channel, async_mode='threading')
+    worker_b = SocketIO(make_app(), message_queue=queue, channel=channel, async_mode='threading')
+
+    received = []
+    manager = worker_b.server.manager
+    deliver = manager._handle_emit
+    manager._handle_emit = lambda message: (received.append(message), deliver(message))
+    manager.initialize()
+    time.sleep(0.2)
+
+    worker_a.emit('host_status_update', {'hosts': [1]}, to='dashboard')
+
+    deadline = time.monotonic() + 5
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert received, 'message did not reach the second worker'
+    assert received[0]['event'] == 'host_status_update'
+    assert received[0]['room'] == 'dashboard'
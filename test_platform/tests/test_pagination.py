@@ -0,0 +1,116 @@
+"""键集分页：游标校验、翻页与查询计划"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, event
+
+from core.pagination import CursorError, decode_cursor, encode_cursor
+
+keys_table = Table('keyset', MetaData(), Column('updated_at', DateTime), Column('id', Integer),
+                   Column('name', String))
+KEYS = (keys_table.c.updated_at, keys_table.c.id)
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 1, 2, 3, 4, 5), 42]
+    assert decode_cursor(encode_cursor(values), KEYS) == values
+
+
+@pytest.mark.parametrize('values', [
+    [datetime(2026, 1, 1)],                      # 键的个数不对
+    [None, 1],                                   # 排序键不会为 NULL
+    ['2026-01-01', 1],                           # 日期时间应为 {"dt": ...}
+    [datetime(2026, 1, 1), '1'],
+    [datetime(2026, 1, 1), True],
+    [datetime(2026, 1, 1), [1]],
+    [{'dt': 'yesterday'}, 1],
+    [{'dt': '2026-01-01', 'x': 1}, 1],
+])
+def test_malformed_cursor_raises_cursor_error(values):
+    cursor = encode_cursor(values)
+
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, KEYS)
+
+
+@pytest.mark.parametrize('cursor', ['!!!', 'bm90IGpzb24', encode_cursor({'a': 1}), 12])
+def test_undecodable_cursor_raises_cursor_error(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, KEYS)
+
+
+@pytest.fixture
+def devices(db, make_device):
+    pytest.importorskip('models.device')
+    start = datetime(2026, 1, 1)
+    made = []
+    for n in range(7):
+        made.append(make_device(status='active' if n % 2 else 'inactive'))
+    # 部分设备的 updated_at 相同，靠 id 决定顺序
+    for n, device in enumerate(made):
+        device.updated_at = start + timedelta(minutes=n // 2)
+    db.session.commit()
+    return made
+
+
+def collect_pages(Device, *criteria, limit=2):
+    ids, cursor = [], None
+    while True:
+        page, cursor = Device.keyset_page(*criteria, cursor=cursor, limit=limit)
+        ids.extend(d['id'] for d in page)
+        if cursor is None:
+            return ids
+
+
+def test_pages_follow_updated_at_then_id(devices):
+    from models.device import Device
+
+    expected = [d.id for d in sorted(devices, key=lambda d: (d.updated_at, d.id), reverse=True)]
+    assert collect_pages(Device) == expected
+    assert collect_pages(Device, Device.status == 'active') == [
+        i for i in expected if i in {d.id for d in devices if d.status == 'active'}]
+
+
+def test_deep_page_uses_composite_index(db, devices):
+    """有游标的过滤翻页应按组合索引范围扫描，不需要额外排序"""
+    from models.device import Device
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    _, cursor = Device.keyset_page(Device.status == 'active', limit=1)
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        Device.keyset_page(Device.status == 'active', cursor=cursor, limit=1)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    statement, parameters = statements[-1]
+    plan = ' '.join(str(row[-1]) for row in db.session.connection().exec_driver_sql(
+        f'EXPLAIN QUERY PLAN {statement}', parameters))
+    assert 'ix_devices_status_updated_at_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_device_page_endpoint_pages_and_rejects_bad_cursors(app, devices):
+    from flask import Blueprint
+    from flask_jwt_extended import JWTManager, create_access_token
+    from services.device_list import init_device_list_routes
+
+    JWTManager(app)
+    bp = Blueprint('devices', __name__)
+    init_device_list_routes(bp)
+    app.register_blueprint(bp, url_prefix='/api/devices')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {create_access_token(identity="admin")}'}
+
+    first = client.get('/api/devices/page?limit=2&status=active', headers=headers).get_json()
+    assert len(first['devices']) == 2 and first['next_cursor']
+    rest = client.get(f"/api/devices/page?limit=2&status=active&cursor={first['next_cursor']}",
+                      headers=headers).get_json()
+    assert [d['status'] for d in rest['devices']] == ['active'] and rest['next_cursor'] is None
+
+    response = client.get('/api/devices/page?cursor=not-a-cursor', headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,75 @@
+"""设备可达性扫描：扫描目标与领导者锁"""
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('database')
+
+from services.reachability import ReachabilityScanner  # noqa: E402
+
+
+class FakeLeader(object):
+    def __init__(self, leader):
+        self.leader = leader
+
+    def is_leader(self):
+        return self.leader
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_only_the_leader_sweeps():
+    scanner = ReachabilityScanner()
+    scanner.interval = 0.01
+    sweeps = threading.Event()
+    scanner.sweep = sweeps.set
+    leader = FakeLeader(False)
+
+    assert scanner.start(leader)
+    assert wait_for(lambda: scanner.stats['skipped_sweeps'] >= 3)
+    assert not sweeps.is_set()
+
+    leader.leader = True
+    assert sweeps.wait(2)
+
+
+@pytest.fixture
+def listener():
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    yield server.getsockname()[1]
+    server.close()
+
+
+def test_devices_without_status_are_probed(app, db, make_device, listener):
+    from models.device import Device
+
+    unknown = make_device(ip_address='127.0.0.1')
+    make_device(ip_address='127.0.0.2', status='maintenance')
+    active = make_device(ip_address='127.0.0.3', status='active')
+    # 早期数据中 status 可能为 NULL（模型默认值只在ORM插入时生效）
+    db.session.execute(db.update(Device).where(Device.id == unknown.id).values(status=None))
+    db.session.commit()
+    scanner = ReachabilityScanner()
+    scanner.init_app(app)
+    scanner.ports = (listener,)
+
+    assert sorted(t['id'] for t in scanner._load_targets()) == [unknown.id, active.id]
+
+    written = []
+    scanner._write_transitions = written.extend
+    scanner._publish = lambda events, transitions: None
+    scanner.sweep()
+
+    assert [(e['device_id'], e['previous_status'], e['status']) for e in written] == [
+        (unknown.id, None, 'active')]
@@ -0,0 +1,80 @@
+"""设备批量注册的逐条校验与状态码"""
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.user')
+
+
+@pytest.fixture
+def client(app):
+    from auth.routes import bp
+    app.register_blueprint(bp)
+    return app.test_client()
+
+
+def register(client, devices):
+    return client.post('/api/auth/register/bulk', json={'devices': devices})
+
+
+@pytest.mark.parametrize('item, error', [
+    ({'fingerprint': 123}, 'Fingerprint is required'),
+    ({'fingerprint': '   '}, 'Fingerprint is required'),
+    ({'fingerprint': 'fp', 'name': ['x']}, 'name must be a string'),
+    ({'fingerprint': 'fp', 'ip_address': {'a': 1}}, 'ip_address must be a string'),
+    ({'fingerprint': 'x' * 256}, 'fingerprint must be at most 255 characters'),
+    ('not-an-object', 'Item must be an object'),
+])
+def test_all_invalid_items_return_400(client, item, error):
+    response = register(client, [item])
+
+    assert response.status_code == 400
+    assert response.get_json()['results'] == [{'index': 0, 'status': 'invalid', 'error': error}]
+
+
+def test_mixed_results_return_207(client):
+    response = register(client, [{'fingerprint': 'fp-1'}, {'fingerprint': ['fp-2']}, {'fingerprint': 'fp-1'}])
+
+    assert response.status_code == 207
+    body = response.get_json()
+    assert [r['status'] for r in body['results']] == ['created', 'invalid', 'conflict']
+    assert body['created'] == 1 and body['failed'] == 2
+
+
+def test_all_created_returns_201_and_all_conflicts_409(client):
+    assert register(client, [{'fingerprint': 'fp-1'}, {'fingerprint': 'fp-2'}]).status_code == 201
+    assert register(client, [{'fingerprint': 'fp-1'}]).status_code == 409
+
+
+def test_rows_with_different_fields_keep_model_defaults(client, db):
+    from models.device import Device
+
+    response = register(client, [{'fingerprint': 'fp-1', 'location': 'lab-1'}, {'fingerprint': 'fp-2'}])
+
+    assert response.status_code == 201
+    devices = db.session.execute(db.select(Device).order_by(Device.fingerprint)).scalars().all()
+    assert [(d.location, d.status) for d in devices] == [('lab-1', 'active'), (None, 'active')]
+    assert all(d.created_at and d.updated_at for d in devices)
+
+
+def test_concurrent_registration_becomes_a_conflict(client, db, monkeypatch):
+    from auth import services
+    from models.device import Device
+
+    check = services._without_conflicts
+    calls = []
+
+    def racing_check(candidates, values, results):
+        rows = check(candidates, values, results)
+        if not calls:
+            # 另一个请求在冲突检查之后、插入之前注册了 fp-2
+            db.session.add(Device(fingerprint='fp-2', name='other', device_type='router'))
+            db.session.commit()
+        calls.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(services, '_without_conflicts', racing_check)
+    response = register(client, [{'fingerprint': 'fp-1'}, {'fingerprint': 'fp-2'}])
+
+    assert response.status_code == 207
+    assert [r['status'] for r in response.get_json()['results']] == ['created', 'conflict']
+    assert calls == [2, 1]
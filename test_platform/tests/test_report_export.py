@@ -0,0 +1,96 @@
+"""报表流式导出：格式、过滤与内存占用"""
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from flask_jwt_extended import JWTManager, create_access_token  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from models.device import Device  # noqa: E402
+from services.report_export import init_export_routes  # noqa: E402
+
+ROWS = 20000
+
+
+@pytest.fixture
+def client(app):
+    JWTManager(app)
+    app.config['REPORT_EXPORT_CHUNK_BYTES'] = 16 * 1024
+    init_export_routes(app)
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(app):
+    return {'Authorization': f'Bearer {create_access_token(identity="admin")}'}
+
+
+@pytest.fixture
+def devices(db):
+    db.session.execute(insert(Device), [{
+        'name': f'device-{n}',
+        'device_type': 'router' if n % 2 else 'switch',
+        'location': f'lab-{n % 10}',
+        'status': 'active',
+        'fingerprint': f'fp-{n:06d}',
+        'password_hash': 'secret',
+        'description': 'x' * 100,
+    } for n in range(ROWS)])
+    db.session.commit()
+
+
+def test_export_memory_does_not_grow_with_row_count(client, headers, devices):
+    response = client.get('/api/reports/export/devices', headers=headers, buffered=False)
+    assert response.status_code == 200
+
+    total, largest = 0, 0
+    tracemalloc.start()
+    try:
+        for chunk in response.response:
+            total += len(chunk)
+            largest = max(largest, len(chunk))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        response.close()
+
+    assert total > 4 * 1024 * 1024
+    assert largest < 64 * 1024                # 按块输出，而不是一次性拼出整个文件
+    assert peak < total / 4, f'peak {peak} bytes for a {total} byte export'
+
+
+def test_csv_export_filters_and_hides_password_hash(client, headers, devices):
+    response = client.get('/api/reports/export/devices?device_type=router&location=lab-1', headers=headers)
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == ROWS // 10
+    assert {r['device_type'] for r in rows} == {'router'} and 'password_hash' not in rows[0]
+    assert [int(r['id']) for r in rows] == sorted(int(r['id']) for r in rows)
+
+
+def test_gzip_ndjson_round_trip(client, headers, devices):
+    response = client.get('/api/reports/export/devices?format=ndjson&gzip=1&location=lab-3', headers=headers)
+
+    assert response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz"')
+    lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+    assert len(lines) == ROWS // 10
+    assert json.loads(lines[0])['location'] == 'lab-3'
+
+
+@pytest.mark.parametrize('query, status', [
+    ('devices?password_hash=secret', 400),
+    ('devices?no_such_column=1', 400),
+    ('devices?format=xml', 400),
+    ('devices?start=yesterday', 400),
+    ('users', 404),
+])
+def test_invalid_requests_are_rejected(client, headers, query, status):
+    assert client.get(f'/api/reports/export/{query}', headers=headers).status_code == status
@@ -0,0 +1,77 @@
+"""测试结果流式导入：列映射、计数累加与错误列表上限"""
+import json
+
+import pytest
+from flask import Blueprint
+
+pytest.importorskip('database')
+pytest.importorskip('models.test_result')
+
+from auth.services import create_token  # noqa: E402
+from auth.token_cache import token_cache  # noqa: E402
+from models.test_result import TestExecution, TestResult  # noqa: E402
+from services.result_ingest import MAX_REPORTED_ERRORS, init_ingest_routes  # noqa: E402
+
+
+@pytest.fixture
+def client(app):
+    bp = Blueprint('test_results', __name__)
+    init_ingest_routes(bp)
+    app.register_blueprint(bp, url_prefix='/api/test-results')
+    token_cache.clear()
+    return app.test_client()
+
+
+@pytest.fixture
+def headers(make_device):
+    return {'Authorization': f'Bearer {create_token(make_device())}'}
+
+
+@pytest.fixture
+def execution(db):
+    execution = TestExecution(status='running')
+    db.session.add(execution)
+    db.session.commit()
+    return execution
+
+
+def ndjson(*items):
+    return '\n'.join(item if isinstance(item, str) else json.dumps(item) for item in items)
+
+
+def test_results_are_written_to_test_result_columns(client, headers, db, execution):
+    body = ndjson(
+        {'name': 'test_boot', 'classname': 'suite.Boot', 'status': 'pass', 'time': '1.5', 'test_case_id': 7},
+        {'test_name': 'test_flash', 'result': 'failure', 'error_message': 'timeout', 'stdout': 'log'},
+        {'name': 'test_error', 'status': 'broken'},
+        {'name': 'test_skip', 'status': 'skipped'},
+    )
+
+    response = client.post(f'/api/test-results/ingest/{execution.id}', data=body, headers=headers)
+
+    assert response.status_code == 200
+    rows = TestResult.query.filter_by(execution_id=execution.id).order_by(TestResult.id).all()
+    assert [(r.test_name, r.status) for r in rows] == [
+        ('suite.Boot.test_boot', 'passed'), ('test_flash', 'failed'),
+        ('test_error', 'error'), ('test_skip', 'skipped')]
+    assert (rows[0].duration, rows[0].test_case_id) == (1.5, 7)
+    assert (rows[1].error_message, rows[1].output) == ('timeout', 'log')
+    db.session.refresh(execution)
+    assert (execution.total_tests, execution.passed_tests, execution.failed_tests,
+            execution.skipped_tests) == (4, 1, 2, 1)
+
+
+def test_reported_errors_are_capped(client, headers, execution):
+    bad_lines = ['not json'] * (MAX_REPORTED_ERRORS + 50)
+    body = ndjson(*bad_lines, {'name': 'test_ok', 'status': 'passed'})
+
+    payload = client.post(f'/api/test-results/ingest/{execution.id}', data=body, headers=headers).get_json()
+
+    assert payload['inserted'] == 1
+    assert payload['skipped'] == MAX_REPORTED_ERRORS + 50
+    assert len(payload['errors']) == MAX_REPORTED_ERRORS
+    assert payload['errors_omitted'] == 50
+
+
+def test_unknown_execution_returns_404(client, headers):
+    assert client.post('/api/test-results/ingest/999', data='', headers=headers).status_code == 404
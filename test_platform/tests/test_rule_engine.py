@@ -0,0 +1,229 @@
+"""增量告警规则引擎：阈值、回差与异常隔离"""
+import time
+
+import pytest
+from flask import Flask
+
+from services.rule_engine import CompiledRule, MemoryStateStore, RedisStateStore, RuleEngine
+
+
+def cpu_rule(**values):
+    rule = {'id': 1, 'metric': 'cpu', 'operator': '>', 'threshold': 90, 'severity': 'critical'}
+    rule.update(values)
+    return rule
+
+
+def cpu_event(value, device_id=1):
+    return {'device_id': device_id, 'metrics': {'cpu': value}}
+
+
+def kinds(results):
+    return [kind for kind, _ in results]
+
+
+def test_hysteresis_resolves_only_below_clear_threshold():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule(clear_threshold=80)])
+
+    assert kinds(engine.process(cpu_event(95))) == ['fired']
+    assert kinds(engine.process(cpu_event(85))) == []   # 低于触发阈值但未越过恢复阈值
+    assert kinds(engine.process(cpu_event(96))) == []   # 仍在告警中，不重复触发
+    assert kinds(engine.process(cpu_event(79))) == ['resolved']
+    assert kinds(engine.process(cpu_event(85))) == []
+
+
+def test_state_is_kept_per_device():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule()])
+
+    assert kinds(engine.process(cpu_event(95, device_id=1))) == ['fired']
+    assert kinds(engine.process(cpu_event(95, device_id=2))) == ['fired']
+    assert kinds(engine.process(cpu_event(10, device_id=1))) == ['resolved']
+    assert engine.stats()['firing'] == 1
+
+
+def test_dedup_suppresses_refire_after_resolve():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule(dedup_seconds=60)])
+
+    engine.process(cpu_event(95), now=1000)
+    engine.process(cpu_event(10), now=1010)
+    assert engine.process(cpu_event(95), now=1030) == []
+    assert kinds(engine.process(cpu_event(95), now=1080)) == ['fired']
+    assert engine.stats()['suppressed'] == 1
+
+
+def test_string_thresholds_from_the_database_are_coerced():
+    rule = CompiledRule(cpu_rule(threshold='90', clear_threshold='80', dedup_seconds='30'))
+
+    assert rule.threshold == 90.0 and rule.dedup_seconds == 30.0
+    assert rule.fire(95.0) and not rule.fire(85.0)
+    assert CompiledRule(cpu_rule(operator='in', threshold='offline, error')).threshold == {'offline', 'error'}
+
+
+@pytest.mark.parametrize('values', [
+    {'threshold': 'high'},
+    {'threshold': None},
+    {'clear_threshold': 'low'},
+    {'operator': '~='},
+])
+def test_invalid_rules_are_skipped(values):
+    engine = RuleEngine()
+
+    assert engine.load_rules([cpu_rule(id=1, **values), cpu_rule(id=2)]) == 1
+    assert engine.stats()['invalid_rules'] == 1
+    assert kinds(engine.process(cpu_event(95))) == ['fired']
+
+
+def test_failing_rule_does_not_stop_other_rules():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule(id=1), cpu_rule(id=2, operator='==', threshold='busy')])
+    # 有问题的规则：比较时抛出异常
+    broken = engine._rules[2]
+    broken.fire = lambda value: 1 / 0
+
+    assert kinds(engine.process(cpu_event(95))) == ['fired']
+    assert engine.stats()['errors'] == 1
+
+
+def test_failing_sink_is_contained():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule()])
+    engine.sink = lambda kind, alert: 1 / 0
+
+    assert kinds(engine.process(cpu_event(95))) == ['fired']
+    assert engine.stats()['errors'] == 1
+
+
+def test_submit_evaluates_in_background():
+    engine = RuleEngine()
+    engine.load_rules([cpu_rule()])
+    fired = []
+    engine.sink = lambda kind, alert: fired.append(kind)
+    engine.reload = lambda: None
+    app = Flask(__name__)
+    engine.start(app)
+
+    engine.submit(cpu_event(95))
+    engine.submit({'device_id': 1, 'metrics': {'cpu': object()}})
+
+    deadline = time.monotonic() + 2
+    while not fired and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert fired == ['fired']
+
+
+def test_alert_rule_commit_requests_reload(app, db, monkeypatch):
+    pytest.importorskip('models.alert')
+    from models.alert import AlertRule
+    from services import rule_engine as rule_engine_module
+
+    engine = RuleEngine()
+    monkeypatch.setattr(rule_engine_module, 'rule_engine', engine)
+    monkeypatch.setattr(engine, 'start', lambda app, socketio_instance=None: None)
+    rule_engine_module.init_rule_engine(app, socketio_instance=None)
+    assert engine.stats()['rules'] == 0
+
+    db.session.add(AlertRule(id=1, name='cpu', metric='cpu', operator='>', threshold='90'))
+    db.session.commit()
+
+    assert engine._reload_requested.is_set()
+    engine.reload()
+    assert engine.stats()['rules'] == 1
+
+
+@pytest.mark.parametrize('threshold, value, fired', [
+    ('1', 1, True), ('1', 1.0, True), ('1', True, True), ('true', True, True),
+    ('90.5', 90.5, True), ('offline', 'offline', True), (1, '1', True),
+    ('1', 2, False), ('busy', 3, False), ('0', True, False),
+])
+def test_equality_thresholds_follow_the_metric_type(threshold, value, fired):
+    assert CompiledRule(cpu_rule(operator='==', threshold=threshold)).fire(value) is fired
+    assert CompiledRule(cpu_rule(operator='!=', threshold=threshold)).fire(value) is not fired
+
+
+def test_state_is_bounded_and_dropped_after_resolve():
+    engine = RuleEngine()
+    engine.state = MemoryStateStore(max_size=3)
+    engine.load_rules([cpu_rule()])
+
+    for device_id in range(10):
+        engine.process(cpu_event(95, device_id=device_id))
+    assert len(engine.state) == 3
+
+    engine.process(cpu_event(10, device_id=9))
+    assert len(engine.state) == 2     # 没有去重时间，恢复后不保留状态
+
+
+def test_only_one_worker_fires_with_a_shared_state_store():
+    shared = MemoryStateStore()
+    workers = []
+    for _ in range(2):
+        engine = RuleEngine()
+        engine.state = shared
+        engine.load_rules([cpu_rule()])
+        workers.append(engine)
+
+    assert kinds(workers[0].process(cpu_event(95))) == ['fired']
+    assert kinds(workers[1].process(cpu_event(97))) == []
+    assert kinds(workers[1].process(cpu_event(10))) == ['resolved']
+    assert kinds(workers[0].process(cpu_event(10))) == []
+
+
+class ScriptedRedis(object):
+    """只实现状态存储用到的 GET 和比较并交换脚本"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def register_script(self, script):
+        def swap(keys, args):
+            current = self.data.get(keys[0], b'').decode()
+            if current != args[0]:
+                return 0
+            if args[1]:
+                self.data[keys[0]] = args[1].encode()
+            else:
+                self.data.pop(keys[0], None)
+            return 1
+        return swap
+
+
+def test_redis_state_round_trips_through_compare_and_swap():
+    store = RedisStateStore(ScriptedRedis())
+    key = (1, '10.0.0.1:22')
+
+    assert store.swap(key, None, (True, 0.0, None))
+    assert not store.swap(key, None, (True, 0.0, None))
+    assert store.swap(key, (True, 0.0, None), (True, 0.0, 42))
+    assert store.get(key) == (True, 0.0, 42)
+    assert store.swap(key, (True, 0.0, 42), (False, 1000.5, None), ttl=30)
+    assert store.get(key) == (False, 1000.5, None)
+
+
+def test_fired_alerts_are_saved_and_resolved(app, db, monkeypatch):
+    pytest.importorskip('models.alert')
+    from models.alert import Alert
+    from services import rule_engine as rule_engine_module
+
+    published = []
+
+    class FakeSocketIO(object):
+        def emit(self, event, alert, to=None):
+            published.append((event, dict(alert)))
+
+    engine = RuleEngine()
+    monkeypatch.setattr(rule_engine_module, 'rule_engine', engine)
+    monkeypatch.setattr(engine, 'start', lambda app, socketio_instance=None: None)
+    rule_engine_module.init_rule_engine(app, FakeSocketIO())
+    engine.load_rules([cpu_rule()])
+    engine.process(cpu_event(95, device_id=3))
+    engine.process(cpu_event(10, device_id=3))
+
+    alert = db.session.execute(db.select(Alert)).scalar_one()
+    assert (alert.device_id, alert.severity, alert.status) == (3, 'critical', 'resolved')
+    assert [(event, a['alert_id']) for event, a in published] == [
+        ('new_alert', alert.id), ('alert_resolved', alert.id)]
@@ -0,0 +1,130 @@
+"""串口I/O引擎：通过pty模拟板卡，验证按行切分、request / expect 与关闭"""
+import os
+import re
+import select
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('serial')
+
+from services.serial_io import ExpectTimeout, LineFramer, SerialIOManager  # noqa: E402
+
+
+class FakeBoard(object):
+    """pty主端上的板卡：按命令回复，也可以主动输出"""
+
+    def __init__(self, replies):
+        # 保持从端打开，否则没有读者时主端读取会返回EIO
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.replies = replies
+        self.received = b''
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self.master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            self.received += data
+            while b'\n' in self.received:
+                line, self.received = self.received.split(b'\n', 1)
+                for chunk in self.replies.get(line.strip(), ()):
+                    os.write(self.master, chunk)
+
+    def send(self, data):
+        os.write(self.master, data)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(1)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+@pytest.fixture
+def manager():
+    manager = SerialIOManager()
+    manager.expect_timeout = 2.0
+    yield manager
+    manager.close_all()
+    if manager.loop is not None:
+        manager.loop.call_soon_threadsafe(manager.loop.stop)
+
+
+@pytest.fixture
+def board():
+    # 响应分两次写出，且以 \r\n 结尾，检验跨读取拼行
+    board = FakeBoard({b'version': [b'boot log\r\nfw 1.', b'2.3\r\n']})
+    yield board
+    board.close()
+
+
+def test_request_matches_response_split_across_reads(manager, board):
+    manager.open(board.port)
+
+    match = manager.request(board.port, 'version', expect=re.compile(rb'^fw (\S+)$'))
+
+    assert match.group(1) == b'1.2.3'
+    stats = manager.stats()['channels'][0]
+    assert stats['requests'] == 1 and stats['lines'] == 2
+    assert stats['bytes_out'] == len(b'version\n') and stats['bytes_in'] == len(b'boot log\r\nfw 1.2.3\r\n')
+    assert 'latency_ms' in stats
+
+
+def test_expect_and_listeners_see_unsolicited_lines(manager, board):
+    manager.open(board.port)
+    seen = []
+    manager.add_listener(board.port, lambda port, line: seen.append(line))
+
+    # expect 等待的是登记之后到达的行
+    threading.Timer(0.1, board.send, (b'kernel panic\n',)).start()
+
+    assert manager.expect(board.port, 'panic') == b'kernel panic'
+    assert seen == [b'kernel panic']
+
+
+def test_expect_timeout_is_counted(manager, board):
+    manager.open(board.port)
+
+    with pytest.raises(ExpectTimeout):
+        manager.request(board.port, 'unknown', expect='never', timeout=0.2)
+
+    assert manager.stats()['channels'][0]['timeouts'] == 1
+
+
+def test_pending_expect_fails_when_the_board_goes_away(manager):
+    board = FakeBoard({})
+    manager.open(board.port)
+    errors = []
+    waiter = threading.Thread(target=lambda: errors.append(_expect_error(manager, board.port)))
+    waiter.start()
+    time.sleep(0.2)
+
+    board.close()
+    waiter.join(3)
+
+    assert isinstance(errors[0], ConnectionError)
+    assert manager.stats()['ports'] == 0
+
+
+def _expect_error(manager, port):
+    try:
+        manager.expect(port, 'never', timeout=2)
+    except Exception as e:
+        return e
+
+
+def test_framer_truncates_a_full_buffer_without_delimiter():
+    framer = LineFramer(size=8)
+
+    assert framer.feed(b'abcdefghij\nxy\n') == [b'abcdefgh', b'ij', b'xy']
+    assert framer.overflows == 1
@@ -0,0 +1,48 @@
+"""Socket.IO连接认证：接受平台签发的用户token"""
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from auth.services import login_secret  # noqa: E402
+from dashboard.sockets import _authenticated_user  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'jwt-secret'
+    JWTManager(app)
+    with app.test_request_context('/socket.io/'):
+        yield app
+
+
+def login_token(secret=None, **claims):
+    payload = {'user_id': 1, 'username': 'alice', 'exp': datetime.utcnow() + timedelta(hours=1)}
+    payload.update(claims)
+    return jwt.encode(payload, secret or login_secret(), algorithm='HS256')
+
+
+def test_login_tokens_authenticate(app):
+    assert _authenticated_user({'token': login_token()}) == 'alice'
+    assert _authenticated_user({'token': login_token(username=None)}) == 1
+
+
+def test_jwt_extended_tokens_still_authenticate(app):
+    assert _authenticated_user({'token': create_access_token(identity='bob')}) == 'bob'
+
+
+@pytest.mark.parametrize('auth', [
+    None,
+    {'token': 'garbage'},
+    {'token': login_token(secret='wrong')},
+    {'token': login_token(exp=datetime.utcnow() - timedelta(minutes=1))},
+    {'token': login_token(user_id=None)},     # 设备token没有 user_id
+])
+def test_invalid_tokens_are_rejected(app, auth):
+    assert _authenticated_user(auth) is None
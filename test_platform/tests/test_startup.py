@@ -0,0 +1,85 @@
+"""延迟加载蓝图：首次命中时导入，路由表不变"""
+import sys
+import textwrap
+
+import pytest
+from flask import Flask
+
+from core.startup import LazyBlueprint, StartupProfiler
+
+MODULE = textwrap.dedent('''
+    from flask import Blueprint, g, jsonify
+
+    bp = Blueprint('widgets', __name__)
+
+
+    @bp.before_request
+    def mark():
+        g.marked = True
+
+
+    @bp.after_request
+    def header(response):
+        response.headers['X-Widgets'] = '1'
+        return response
+
+
+    @bp.route('/')
+    def index():
+        return jsonify(widgets=[], marked=g.marked)
+
+
+    @bp.route('/<int:widget_id>', methods=['GET', 'DELETE'])
+    def widget(widget_id):
+        return jsonify(id=widget_id)
+''')
+
+
+@pytest.fixture
+def lazy_app(tmp_path, monkeypatch):
+    (tmp_path / 'lazy_widgets.py').write_text(MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'lazy_widgets', raising=False)
+    app = Flask(__name__)
+    lazy = LazyBlueprint(app, 'lazy_widgets', '/api/widgets')
+
+    @app.route('/api/widgets/summary')
+    def summary():
+        return 'summary'
+    yield app, lazy
+    sys.modules.pop('lazy_widgets', None)
+
+
+def test_blueprint_is_imported_on_first_hit_only(lazy_app):
+    app, lazy = lazy_app
+    client = app.test_client()
+    rules = sorted(str(r) for r in app.url_map.iter_rules())
+
+    assert client.get('/api/widgets/summary').data == b'summary'
+    assert 'lazy_widgets' not in sys.modules and not lazy.loaded
+
+    response = client.get('/api/widgets/')
+    assert response.get_json() == {'widgets': [], 'marked': True}
+    assert response.headers['X-Widgets'] == '1'
+    assert client.delete('/api/widgets/7').get_json() == {'id': 7}
+    assert lazy.loaded and lazy.load_ms is not None
+    assert sorted(str(r) for r in app.url_map.iter_rules()) == rules
+
+
+def test_unmatched_requests_use_the_blueprint_routes(lazy_app):
+    app, _ = lazy_app
+    client = app.test_client()
+
+    assert client.get('/api/widgets/nope').status_code == 404
+    assert client.post('/api/widgets/7').status_code == 405
+    assert client.get('/api/widgets').status_code == 308
+    allowed = client.options('/api/widgets/7').headers['Allow']
+    assert {'GET', 'DELETE', 'OPTIONS'} <= set(m.strip() for m in allowed.split(','))
+
+
+def test_profiler_reports_slowest_step_first():
+    profiler = StartupProfiler()
+    profiler.import_attr('json')
+    profiler.entries.append({'name': 'slow', 'ms': 1e6})
+
+    assert profiler.report()['steps'][0]['name'] == 'slow'
@@ -0,0 +1,58 @@
+"""告警订阅的房间计算"""
+import pytest
+
+from dashboard.subscriptions import (MAX_ROOMS_PER_SUBSCRIPTION, AlertSubscriptions, publish_alert,
+                                     rooms_for_alert, rooms_for_filters, normalize_filters)
+
+
+class RecordingSocketIO(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+
+def subscribed_rooms(filters):
+    return set(rooms_for_filters(normalize_filters(filters)))
+
+
+@pytest.mark.parametrize('filters, alert, matches', [
+    ({}, {'severity': 'critical'}, True),
+    ({'severity': 'critical'}, {'severity': 'critical', 'location': 'lab1'}, True),
+    ({'severity': ['critical', 'high']}, {'severity': 'high'}, True),
+    ({'severity': 'critical', 'location': 'lab1'}, {'severity': 'critical', 'location': 'lab2'}, False),
+    ({'device_type': 'router'}, {'severity': 'critical'}, False),
+])
+def test_alert_rooms_match_subscription_rooms(filters, alert, matches):
+    assert bool(subscribed_rooms(filters) & set(rooms_for_alert(alert))) is matches
+
+
+def test_publish_needs_no_subscription_state():
+    """任何进程都能算出目标房间，不依赖本进程的订阅记录"""
+    socketio = RecordingSocketIO()
+    alert = {'severity': 'critical', 'device_type': 'router', 'location': 'lab1'}
+
+    assert publish_alert(socketio, alert) == 8
+    event, data, rooms = socketio.emitted[0]
+    assert event == 'new_alert' and data is alert
+    assert subscribed_rooms({'location': 'lab1'}) <= set(rooms)
+
+
+def test_unsubscribe_keeps_rooms_shared_with_other_subscriptions():
+    subs = AlertSubscriptions()
+    rooms_a, _ = subs.subscribe('sid', {'severity': ['critical', 'high']})
+    subs.subscribe('sid', {'severity': 'critical'})
+
+    left = subs.unsubscribe('sid', {'severity': ['critical', 'high']})
+
+    assert left == [r for r in rooms_a if r not in subscribed_rooms({'severity': 'critical'})]
+    assert subs.rooms_for('sid') == subscribed_rooms({'severity': 'critical'})
+    assert sorted(subs.unsubscribe('sid')) == sorted(subscribed_rooms({'severity': 'critical'}))
+    assert subs.stats()['clients'] == 0
+
+
+def test_oversized_subscription_is_rejected():
+    values = [str(i) for i in range(MAX_ROOMS_PER_SUBSCRIPTION + 1)]
+    with pytest.raises(ValueError):
+        AlertSubscriptions().subscribe('sid', {'location': values})
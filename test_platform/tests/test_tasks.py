@@ -0,0 +1,110 @@
+"""测试套件执行器：命令执行、超时、按设备串行与重试"""
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import tasks
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_stops_at_the_first_failing_command():
+    result = tasks.run_test_suite({'commands': [python('print("ok")'), python('raise SystemExit(3)'),
+                                                python('print("never")')]})
+
+    assert result['status'] == 'failed'
+    assert [r['returncode'] for r in result['results']] == [0, 3]
+    assert result['results'][0]['stdout'] == 'ok\n'
+
+
+def test_continues_after_failure_when_asked():
+    result = tasks.run_test_suite({'commands': [python('raise SystemExit(1)'), python('print("ran")')],
+                                   'stop_on_failure': False})
+
+    assert result['status'] == 'failed'
+    assert result['results'][1]['stdout'] == 'ran\n'
+
+
+def test_timeout_kills_the_command():
+    with pytest.raises(subprocess.TimeoutExpired):
+        tasks.run_test_suite({'commands': [python('import time; time.sleep(30)')], 'timeout': 0.5})
+
+
+def test_timeout_kills_children_of_shell_commands():
+    started = time.monotonic()
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        # sh 派生的 sleep 继承输出管道，只杀 sh 时读取线程会一直等到它结束
+        tasks.run_test_suite({'commands': ['sleep 30; echo done'], 'timeout': 0.5})
+
+    assert time.monotonic() - started < 5
+
+
+def test_unknown_backend_is_rejected():
+    app = Flask(__name__)
+    app.config['TASK_EXECUTOR_BACKEND'] = 'celery'
+
+    with pytest.raises(ValueError):
+        tasks.TestSuiteExecutor().init_app(app)
+
+
+def test_suites_on_one_device_run_one_at_a_time(monkeypatch):
+    executor = tasks.TestSuiteExecutor(backend='thread', max_workers=4)
+    release = threading.Event()
+    running, peak = [], []
+    lock = threading.Lock()
+
+    def fake_run(test_config, log_sink=None):
+        with lock:
+            running.append(test_config['n'])
+            peak.append(len(running))
+        release.wait(5)
+        with lock:
+            running.remove(test_config['n'])
+        return {'status': 'success', 'results': []}
+
+    monkeypatch.setattr(tasks, 'run_test_suite', fake_run)
+    try:
+        futures = [executor.submit({'n': n}, device_id=1) for n in range(3)]
+        other = executor.submit({'n': 'other'}, device_id=2)
+        assert executor.queued(1) == 2 and executor.queued(2) == 0
+        release.set()
+        results = [f.result(timeout=5) for f in futures + [other]]
+    finally:
+        executor.shutdown()
+
+    assert max(peak) <= 2                     # 设备1同一时刻只有一个，另一个属于设备2
+    assert [r['device_id'] for r in results] == [1, 1, 1, 2]
+    assert executor.queued() == 0 and executor.stats['completed'] == 4
+
+
+def test_failed_suite_is_retried_then_reported():
+    executor = tasks.TestSuiteExecutor(backend='eager')
+    config = {'commands': [python('import time; time.sleep(30)')], 'timeout': 0.2}
+
+    future = executor.submit(config, device_id=1, retries=1)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        future.result(timeout=5)
+    assert executor.stats == {'submitted': 1, 'completed': 0, 'failed': 1, 'retried': 1}
+    # 失败后设备被释放，下一个套件可以立即运行
+    assert executor.submit({'commands': [python('pass')]}, device_id=1).result(timeout=5)['attempts'] == 1
+
+
+def test_device_is_released_when_submit_fails():
+    executor = tasks.TestSuiteExecutor(backend='thread', max_workers=1)
+    executor._get_pool().shutdown()
+
+    with pytest.raises(RuntimeError):
+        executor.submit({'commands': [python('pass')]}, device_id=1).result(timeout=5)
+    assert executor.stats['failed'] == 1
+
+    executor._pool = None
+    assert executor.submit({'commands': [python('pass')]}, device_id=1).result(timeout=5)['status'] == 'success'
+    executor.shutdown()
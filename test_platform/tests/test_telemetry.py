@@ -0,0 +1,115 @@
+"""设备遥测存储：输入校验、按需分配与块文件写入"""
+import os
+import time
+
+import pytest
+
+from services.telemetry import RingArray, TelemetryStore
+
+
+def make_store(directory=None, **options):
+    store = TelemetryStore(raw_capacity=100, directory=directory and os.path.realpath(directory), **options)
+    store.device_exists = lambda device_id: device_id in (1, 2)
+    return store
+
+
+@pytest.mark.parametrize('device_id', ['../../escape', '1/../..', -1, 1.5, True, None, 99])
+def test_rejects_invalid_or_unknown_devices(tmp_path, device_id):
+    store = make_store(tmp_path)
+
+    with pytest.raises(ValueError):
+        store.record(device_id, 'cpu', 1.0)
+    assert store.stats()['series'] == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('metric', ['../cpu', 'unregistered', None])
+def test_rejects_unregistered_metrics(tmp_path, metric):
+    store = make_store(tmp_path)
+
+    with pytest.raises(ValueError):
+        store.record(1, metric, 1.0)
+    with pytest.raises(ValueError):
+        store.query(1, metric, 0, 10)
+
+
+def test_series_count_is_capped():
+    store = make_store(max_series=2)
+    store.record(1, 'cpu', 1.0)
+    store.record(1, 'memory', 1.0)
+
+    with pytest.raises(ValueError):
+        store.record(2, 'cpu', 1.0)
+    store.record(1, 'cpu', 2.0)   # 已有序列不受影响
+
+
+def test_buffers_grow_on_demand():
+    ring = RingArray(1000)
+    assert len(ring.data) == 0
+
+    for value in range(1005):
+        ring.append(float(value))
+
+    assert len(ring.data) == 1000
+    assert list(ring.values())[:2] == [5.0, 6.0] and ring.values()[-1] == 1004.0
+
+
+def test_out_of_order_samples_are_rejected():
+    store = make_store()
+
+    assert store.record(1, 'cpu', 1.0, ts=100)
+    assert not store.record(1, 'cpu', 2.0, ts=99)
+    assert store.query(1, 'cpu', 0, 200, 'raw')['points'] == [(100, 1.0)]
+    assert store.stats()['rejected'] == 1
+
+
+def test_future_samples_do_not_block_the_series():
+    store = make_store()
+    now = time.time()
+
+    with pytest.raises(ValueError):
+        store.record_many(1, {'cpu': 1.0, 'memory': 2.0}, ts=now + 3600)
+    with pytest.raises(ValueError):
+        store.record(1, 'cpu', 1.0, ts=float('nan'))
+
+    assert store.record(1, 'cpu', 2.0)
+    assert store.record_many(1, {'cpu': 3.0}, ts=now + 30) == 1      # 允许的时钟偏差之内
+    assert store.stats()['rejected'] == 1
+
+
+def test_blocks_from_several_workers_stay_ordered(tmp_path):
+    """两个worker各自缓存了同一序列的数据，交替落盘后文件仍按时间排列"""
+    worker_a, worker_b = make_store(tmp_path), make_store(tmp_path)
+    for ts in (0, 1, 2, 3):
+        worker_a.record(1, 'cpu', 10.0, ts=ts)
+    for ts in (0.5, 3.5, 4, 5):
+        worker_b.record(1, 'cpu', 30.0, ts=ts)
+
+    worker_b.flush()    # 桶 0、3、4
+    worker_a.flush()    # 桶 0、1、2：早于文件中的最后一个桶，被丢弃
+
+    reader = make_store(tmp_path)
+    points = reader._read_blocks(1, 'cpu', '1s', 0, 10)
+    assert [p[0] for p in points] == [0, 3, 4]
+    assert worker_a.stats()['dropped_rows'] == 3
+
+    worker_b.record(1, 'cpu', 50.0, ts=6)
+    worker_a.record(1, 'cpu', 20.0, ts=4.5)
+    worker_a.record(1, 'cpu', 20.0, ts=7)
+    worker_a.flush()    # 桶 4 与文件中的最后一个桶合并
+
+    start, low, high, avg, count = reader._read_blocks(1, 'cpu', '1s', 4, 5)[0]
+    assert (low, high, count) == (20.0, 30.0, 2)
+    assert avg == pytest.approx(25.0)
+    assert worker_a.stats()['merged_rows'] == 1
+
+
+def test_history_is_read_back_from_blocks(tmp_path):
+    store = make_store(tmp_path)
+    for ts in range(0, 10):
+        store.record(1, 'cpu', float(ts), ts=ts)
+    store.flush()
+
+    reader = make_store(tmp_path)
+    points = reader.query(1, 'cpu', 0, 10, '1s')['points']
+    assert [p[0] for p in points] == list(range(0, 9))
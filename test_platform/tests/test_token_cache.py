@@ -0,0 +1,131 @@
+"""设备token缓存与跨进程失效"""
+import time
+
+import pytest
+
+pytest.importorskip('database')
+pytest.importorskip('models.device')
+
+from auth import token_cache as token_cache_module  # noqa: E402
+from auth.invalidation import InvalidationBus, invalidation_bus  # noqa: E402
+from auth.services import create_token, token_required  # noqa: E402
+from auth.token_cache import DeviceIdentity, TokenCache, token_cache  # noqa: E402
+from models.device import Device  # noqa: E402
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def test_put_returns_identity_without_lazy_queries(make_device):
+    device = make_device()
+    identity = token_cache.put('t1', time.time() + 3600, device)
+
+    assert isinstance(identity, DeviceIdentity)
+    assert token_cache.get('t1') is identity
+    # 身份记录之外的字段必须显式 load()，不会在属性访问时偷偷查库
+    with pytest.raises(AttributeError):
+        identity.ip_address
+    assert identity.load().id == device.id
+
+
+def test_fingerprint_change_invalidates_on_commit(db, make_device):
+    device = make_device()
+    token_cache.put('t1', time.time() + 3600, device)
+
+    device.fingerprint = 'fp-changed'
+    db.session.commit()
+
+    assert token_cache.get('t1') is None
+
+
+def test_publish_happens_after_commit_only(db, make_device, monkeypatch):
+    published = []
+    monkeypatch.setattr(invalidation_bus, 'publish', lambda ids: published.append(sorted(ids)))
+    device = make_device()
+
+    device.password_hash = 'x'
+    db.session.flush()
+    assert published == []
+    db.session.rollback()
+    assert published == []
+
+    device.password_hash = 'y'
+    db.session.commit()
+    assert published == [[device.id]]
+
+
+def test_invalidation_reaches_other_worker(fake_redis, make_device):
+    broker = fake_redis()
+    worker_a, worker_b = InvalidationBus(), InvalidationBus()
+    worker_a.client = fake_redis(broker.broker)
+    worker_b.client = fake_redis(broker.broker)
+    cache_b = TokenCache()
+    worker_b.register(cache_b.invalidate_devices)
+    worker_b.start()
+    assert wait_for(worker_b.serving)
+
+    device = make_device()
+    cache_b.put('t1', time.time() + 3600, device)
+    assert cache_b.get('t1') is not None
+
+    worker_a.publish([device.id])
+
+    assert wait_for(lambda: cache_b.get('t1') is None)
+
+
+def test_cache_bypassed_while_subscription_is_down(fake_redis, make_device, monkeypatch):
+    bus = InvalidationBus()
+    bus.client = fake_redis()
+    monkeypatch.setattr(token_cache_module, 'invalidation_bus', bus)
+    device = make_device()
+
+    token_cache.put('t1', time.time() + 3600, device)
+
+    assert not bus.serving()
+    assert token_cache.get('t1') is None
+
+
+def test_ttl_is_capped_without_shared_bus(make_device):
+    assert not invalidation_bus.shared
+    cache = TokenCache(ttl=300)
+    cache.put('t1', time.time() + 3600, make_device())
+
+    assert cache.stats()['ttl'] == invalidation_bus.local_ttl
+    expires_at, _ = cache._entries['t1']
+    assert expires_at <= time.time() + invalidation_bus.local_ttl
+
+
+@pytest.mark.parametrize('identity, expected', [(False, Device), (True, DeviceIdentity)])
+def test_token_required_passes_full_device_unless_identity_requested(app, make_device, identity, expected):
+    received = []
+
+    @token_required(identity=identity)
+    def view(current_device):
+        received.append(current_device)
+        return 'ok'
+
+    app.add_url_rule('/whoami', 'whoami', view)
+    device = make_device(location='lab-1')
+    headers = {'Authorization': f'Bearer {create_token(device)}'}
+    client = app.test_client()
+    hits = token_cache.stats()['hits']
+
+    assert client.get('/whoami', headers=headers).status_code == 200     # 未命中缓存
+    assert client.get('/whoami', headers=headers).status_code == 200     # 命中缓存
+    assert [type(d) for d in received] == [expected, expected]
+    if not identity:
+        assert received[1].location == 'lab-1'
+    assert token_cache.stats()['hits'] == hits + 1